@@ -0,0 +1,3 @@
+"""
+    Benchmarks for the framework, run with `python -m bench` from the root of the repo (see bench/__main__.py).
+"""
@@ -0,0 +1,98 @@
+import argparse
+import sys
+
+from bench.load import bench_end_to_end
+from bench.micro import bench_dispatch, bench_middleware_depth, bench_multipart, bench_route_match
+from bench.report import build_report, compare, load_report, print_comparison, print_results, save_report
+
+
+# Benchmarks, by the name used with --only.
+BENCHMARKS = {
+    'route_match': bench_route_match,
+    'middleware': bench_middleware_depth,
+    'dispatch': bench_dispatch,
+    'multipart': bench_multipart,
+}
+
+
+def run(args):
+
+    names = args.only.split(',') if args.only else list(BENCHMARKS) + ['e2e']
+
+    results = {}
+
+    for name in names:
+
+        print(f'Running {name}...', file=sys.stderr)
+
+        if name == 'e2e':
+            results.update(bench_end_to_end(
+                engines=args.engines.split(','),
+                clients=args.clients,
+                duration=args.duration,
+                port=args.port,
+                quick=args.quick,
+            ))
+        elif name in BENCHMARKS:
+            results.update(BENCHMARKS[name](quick=args.quick))
+        else:
+            raise SystemExit(f'Unknown benchmark: {name}')
+
+    report = build_report(results)
+
+    if args.output:
+        save_report(report, args.output)
+
+    print_results(results)
+
+    if args.baseline:
+        return check(load_report(args.baseline), report, args.threshold)
+
+    return 0
+
+
+def check(baseline, current, threshold):
+
+    rows, regressions = compare(baseline, current, threshold)
+
+    print()
+    print_comparison(rows, regressions)
+
+    if regressions:
+        print(f'\n{len(regressions)} regression(s) over {threshold:.0%}: {", ".join(regressions)}')
+        return 1
+
+    return 0
+
+
+def main():
+
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Benchmarks for py_express.')
+    commands = parser.add_subparsers(dest='command')
+
+    run_parser = commands.add_parser('run', help='Run the benchmarks (the default).')
+    run_parser.add_argument('--only', help=f'Comma separated benchmarks: {", ".join(list(BENCHMARKS) + ["e2e"])}.')
+    run_parser.add_argument('--quick', action='store_true', help='Fewer iterations and smaller inputs.')
+    run_parser.add_argument('--engines', default='threads,asyncio', help='Engines for the e2e benchmark.')
+    run_parser.add_argument('--clients', type=int, default=16, help='Concurrent client threads for the e2e benchmark.')
+    run_parser.add_argument('--duration', type=float, default=3.0, help='Seconds per e2e measurement.')
+    run_parser.add_argument('--port', type=int, default=3900)
+    run_parser.add_argument('-o', '--output', help='Save the results as JSON.')
+    run_parser.add_argument('--baseline', help='JSON results to compare with. Exits with 1 on regressions.')
+    run_parser.add_argument('--threshold', type=float, default=0.10, help='Change that counts as a regression.')
+
+    compare_parser = commands.add_parser('compare', help='Compare two saved results.')
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.10)
+
+    args = parser.parse_args(sys.argv[1:] or ['run'])
+
+    if args.command == 'compare':
+        return check(load_report(args.baseline), load_report(args.current), args.threshold)
+
+    return run(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+import http.client
+import json
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from bench.micro import result
+
+
+class BenchServer:
+
+    """
+        Runs bench/server.py in a separate process, so the load generator doesn't share a GIL with the server.
+    """
+
+    def __init__(self, engine, port):
+        self.engine = engine
+        self.port = port
+        self.process = None
+
+    def __enter__(self):
+
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'bench.server', '--engine', self.engine, '--port', str(self.port)],
+            cwd=root,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+        # Wait for the server to accept connections.
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', self.port), timeout=0.1).close()
+                return self
+            except OSError:
+                time.sleep(0.05)
+
+        self.__exit__()
+        raise RuntimeError(f'Benchmark server ({self.engine}) did not start')
+
+    def __exit__(self, *args):
+        self.process.send_signal(signal.SIGTERM)
+        try:
+            self.process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def run_load(port, method, path, body=None, clients=16, duration=3.0, warmup=0.5):
+
+    """
+        Sends requests from `clients` threads, each on its own keep-alive connection, for `duration` seconds.
+        Returns the requests per second, the latency percentiles (ms) and the number of errors.
+    """
+
+    headers = {'Content-Type': 'application/json'} if body is not None else {}
+    latencies = [[] for _ in range(clients)]
+    errors = [0] * clients
+    start_at = time.perf_counter() + warmup
+    stop_at = start_at + duration
+
+    def client(index):
+
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        own = latencies[index]
+
+        while True:
+
+            started = time.perf_counter()
+
+            if started >= stop_at:
+                break
+
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                ok = False
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+
+            # Requests during the warmup aren't counted.
+            if started >= start_at:
+                if ok:
+                    own.append(time.perf_counter() - started)
+                else:
+                    errors[index] += 1
+
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    samples = sorted(latency for own in latencies for latency in own)
+
+    return {
+        "rps": len(samples) / duration,
+        "p50": percentile(samples, 0.50) * 1000,
+        "p99": percentile(samples, 0.99) * 1000,
+        "errors": sum(errors),
+    }
+
+
+# End to end
+def bench_end_to_end(engines=('threads', 'asyncio'), clients=16, duration=3.0, port=3900, quick=False):
+
+    """
+        Requests per second and p50/p99 latency of a small GET and of a JSON echo (4KB body), per engine.
+    """
+
+    if quick:
+        duration = min(duration, 1.0)
+
+    payload = json.dumps({"items": [{"id": index, "name": f"item {index}"} for index in range(150)]}).encode()
+
+    results = {}
+
+    for engine in engines:
+
+        with BenchServer(engine, port):
+
+            for name, method, path, body in (('hello', 'GET', '/hello', None), ('json_echo', 'POST', '/echo', payload)):
+
+                stats = run_load(port, method, path, body, clients=clients, duration=duration)
+
+                prefix = f'e2e.{engine}.{name}'
+                results[f'{prefix}.rps'] = result(round(stats["rps"], 1), 'req/s', better='higher', clients=clients)
+                results[f'{prefix}.p50'] = result(round(stats["p50"], 3), 'ms')
+                results[f'{prefix}.p99'] = result(round(stats["p99"], 3), 'ms')
+                results[f'{prefix}.errors'] = result(stats["errors"], 'requests')
+
+                if name == 'json_echo':
+                    results[f'{prefix}.throughput'] = result(
+                        round(stats["rps"] * len(payload) / 1024 / 1024, 2), 'MB/s', better='higher')
+
+    return results
@@ -0,0 +1,140 @@
+import os
+import tempfile
+import time
+import tracemalloc
+import timeit
+
+from bench.server import build_app
+from classes.multipart import MultipartParser
+from classes.pipeline import Pipeline
+from classes.router import Router
+
+
+def result(value, unit, better='lower', **extra):
+
+    """
+        A single measurement, as stored in the JSON report.
+    """
+
+    return {"value": value, "unit": unit, "better": better, **extra}
+
+
+def per_call_ns(function, number, repeat=5):
+    # Best of `repeat` runs, which is the least affected by noise.
+    return min(timeit.repeat(function, number=number, repeat=repeat)) / number * 1e9
+
+
+# Route matching
+def bench_route_match(quick=False):
+
+    """
+        Cost of a match against 10, 100 and 1000 routes, for a static path and a path with a param.
+    """
+
+    results = {}
+    number = 20000 if quick else 200000
+
+    for count in (10, 100, 1000):
+
+        router = Router()
+
+        for index in range(count):
+            router.add(f'/api/r{index}/items', 'GET', None)
+            router.add(f'/api/r{index}/items/:id', 'GET', None)
+
+        # The last route registered, so a linear scan would be at its worst.
+        static_path = f'/api/r{count - 1}/items'
+        param_path = f'/api/r{count - 1}/items/42'
+
+        results[f'route_match.static.{count}'] = result(
+            round(per_call_ns(lambda: router.match(static_path, 'GET'), number)), 'ns')
+        results[f'route_match.param.{count}'] = result(
+            round(per_call_ns(lambda: router.match(param_path, 'GET'), number)), 'ns')
+
+    return results
+
+
+# Middleware chain
+def bench_middleware_depth(quick=False):
+
+    """
+        Cost of running a pipeline with 0 to 50 middlewares that all call next().
+    """
+
+    def middleware(req, res, next):
+        next()
+
+    def controller(req, res):
+        pass
+
+    results = {}
+    number = 10000 if quick else 100000
+
+    for depth in (0, 1, 10, 50):
+        pipeline = Pipeline([middleware] * depth, controller)
+        results[f'middleware.depth.{depth}'] = result(round(per_call_ns(lambda: pipeline.run(None, None), number)), 'ns')
+
+    return results
+
+
+# Dispatch
+def bench_dispatch(quick=False):
+
+    """
+        Cost of a request through the whole framework (route lookup, pipeline, body parsing, response serialization)
+        without sockets, with the test client, for the same GET and JSON echo as the end to end benchmark.
+    """
+
+    client = build_app().test_client()
+    number = 2000 if quick else 20000
+
+    return {
+        'dispatch.hello': result(round(per_call_ns(lambda: client.get('/hello'), number) / 1000, 2), 'us'),
+        'dispatch.echo': result(round(per_call_ns(lambda: client.post('/echo', json={"a": 1}), number) / 1000, 2), 'us'),
+    }
+
+
+# Multipart
+def bench_multipart(quick=False):
+
+    """
+        Time and peak Python memory of parsing a multipart upload with a few fields and one large file.
+    """
+
+    file_size = (8 if quick else 64) * 1024 * 1024
+    boundary = 'benchboundary1234567890'
+
+    with tempfile.TemporaryFile() as body:
+
+        for index in range(5):
+            body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="field{index}"\r\n\r\nvalue {index}\r\n'.encode())
+
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="upload"; filename="data.bin"\r\n'
+                   f'Content-Type: application/octet-stream\r\n\r\n'.encode())
+
+        # Random-ish bytes (repeated, so building the body is quick), with no boundary inside.
+        block = os.urandom(64 * 1024)
+        for _ in range(file_size // len(block)):
+            body.write(block)
+
+        body.write(f'\r\n--{boundary}--\r\n'.encode())
+
+        content_length = body.tell()
+        body.seek(0)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+
+        parsed = MultipartParser(body, content_length, boundary.encode()).parse()
+
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        parsed['upload']['file'].close()
+
+    return {
+        'multipart.seconds': result(round(elapsed, 4), 's', size_mb=file_size // (1024 * 1024)),
+        'multipart.throughput': result(round(file_size / elapsed / 1024 / 1024, 1), 'MB/s', better='higher'),
+        'multipart.peak_memory': result(round(peak / 1024 / 1024, 2), 'MB'),
+    }
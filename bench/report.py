@@ -0,0 +1,72 @@
+import json
+import platform
+import sys
+import time
+
+
+def build_report(results):
+    return {
+        "meta": {
+            "time": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+
+
+def save_report(report, path):
+    with open(path, 'w') as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+
+
+def load_report(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+# Compare
+def compare(baseline, current, threshold=0.10):
+
+    """
+        Compares two reports. Returns (name, baseline value, current value, change) for every benchmark in both, and
+        the names of the ones that got worse by more than `threshold` (0.10 = 10%).
+    """
+
+    rows = []
+    regressions = []
+
+    for name, now in sorted(current["results"].items()):
+
+        before = baseline["results"].get(name)
+
+        if before is None:
+            continue
+
+        if before["value"]:
+            change = (now["value"] - before["value"]) / before["value"]
+        else:
+            # Counters that should stay at 0 (ie: errors) regress as soon as they aren't.
+            change = float('inf') if now["value"] > 0 else 0.0
+
+        # Positive is worse, whichever way the metric goes.
+        worse = change if now.get("better", 'lower') == 'lower' else -change
+
+        rows.append((name, before["value"], now["value"], change))
+
+        if worse > threshold:
+            regressions.append(name)
+
+    return rows, regressions
+
+
+def print_results(results, file=sys.stdout):
+    for name, measurement in sorted(results.items()):
+        print(f'{name:<40} {measurement["value"]:>14} {measurement["unit"]}', file=file)
+
+
+def print_comparison(rows, regressions, file=sys.stdout):
+    for name, before, now, change in rows:
+        flag = '  REGRESSION' if name in regressions else ''
+        print(f'{name:<40} {before:>14} -> {now:<14} {change:+.1%}{flag}', file=file)
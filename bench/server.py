@@ -0,0 +1,33 @@
+import argparse
+
+from classes.py_express import PyExpress
+
+
+# Server for the load benchmarks, run in its own process: python -m bench.server --engine threads --port 3900
+def hello(req, res):
+    res.json({"message": "hello"})
+
+
+def echo(req, res):
+    res.json(req.body)
+
+
+def build_app():
+
+    app = PyExpress()
+
+    app.get('/hello', hello)
+    app.post('/echo', echo)
+
+    return app
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--engine', default='threads')
+    parser.add_argument('--port', type=int, default=3900)
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args()
+
+    build_app().listen('127.0.0.1', args.port, workers=args.workers, engine=args.engine, max_requests_per_connection=None)
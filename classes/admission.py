@@ -0,0 +1,225 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+
+class Waiter:
+
+    """
+        A request waiting in the admission queue, woken up when a running request hands it its slot (or waiting for a
+        resource of a ResourcePool, handed over as `value`).
+        Whoever takes it off the queue grants it with the queue's lock held, and wakes it up once the lock is released.
+    """
+
+    __slots__ = ('event', 'loop', 'future', 'granted', 'value')
+
+    def __init__(self, loop=None):
+        self.loop = loop
+        self.future = loop.create_future() if loop is not None else None
+        self.event = threading.Event() if loop is None else None
+        self.granted = False
+        self.value = None
+
+    def grant(self, value=None):
+
+        # Called with the lock of the queue the waiter was taken from held, so a wait timing out meanwhile finds it
+        # granted instead of looking for it in the queue.
+        self.granted = True
+        self.value = value
+
+    def wake(self):
+
+        if self.future is None:
+            self.event.set()
+        else:
+            self.loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class AdmissionControl:
+
+    """
+        Limits the requests running at once to `max_in_flight`. Up to `max_queue` more wait for a slot, and the rest
+        are shed right away with a 503 (see `admission_control` for the options).
+        Slots are handed from the request that finishes to the oldest waiting one (priority routes first), so waiting
+        requests are served in order.
+    """
+
+    def __init__(
+        self,
+        max_in_flight,
+        max_queue=None,
+        queue_timeout=1.0,
+        target_latency=None,
+        interval=0.1,
+        exempt=(),
+        priority=(),
+        retry_after=1,
+    ):
+
+        if max_in_flight < 1:
+            raise ValueError('max_in_flight must be at least 1')
+
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_in_flight if max_queue is None else max_queue
+        self.queue_timeout = queue_timeout
+        self.target_latency = target_latency
+        self.interval = interval
+        self.exempt = frozenset(exempt)
+        self.priority = frozenset(priority)
+        self.retry_after = retry_after
+
+        self.in_flight = 0
+        self._waiters = deque()
+        self._priority_waiters = deque()
+        self._lock = threading.Lock()
+
+        # Last time nobody was waiting. A queue that didn't empty for a whole `interval` is a standing queue.
+        self._last_empty = time.monotonic()
+
+        self.admitted = 0
+        self.queued = 0
+        self.shed = 0
+
+    def stats(self):
+        return {
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": self.shed,
+            "in_flight": self.in_flight,
+            "waiting": len(self._waiters) + len(self._priority_waiters),
+        }
+
+    # Acquire
+    def acquire(self, priority=False):
+
+        """
+            Takes a slot, waiting for one if needed. Returns False if the request should be shed.
+        """
+
+        waiter = self._enter(priority, None)
+
+        if waiter is None or waiter is True:
+            return waiter is True
+
+        waiter.event.wait(self._wait_timeout())
+
+        return self._leave(waiter, priority)
+
+    async def acquire_async(self, priority=False):
+
+        """Same as acquire(), for the asyncio engine."""
+
+        waiter = self._enter(priority, asyncio.get_running_loop())
+
+        if waiter is None or waiter is True:
+            return waiter is True
+
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self._wait_timeout())
+        except asyncio.TimeoutError:
+            pass
+
+        return self._leave(waiter, priority)
+
+    def release(self):
+
+        """Frees the slot of a finished request, or hands it to the next waiting one."""
+
+        with self._lock:
+
+            queue = self._priority_waiters or self._waiters
+
+            if not queue:
+                self.in_flight -= 1
+                return
+
+            waiter = queue.popleft()
+            waiter.grant()
+
+            if not self._priority_waiters and not self._waiters:
+                self._last_empty = time.monotonic()
+
+        waiter.wake()
+
+    def reject(self, res):
+        res.set_header('Retry-After', str(self.retry_after))
+        res.status(503).send({"error": "Service Unavailable"})
+
+    def _enter(self, priority, loop):
+
+        # Returns True when admitted right away, None when shed, or the Waiter to wait on.
+        with self._lock:
+
+            now = time.monotonic()
+
+            waiting = len(self._waiters) + len(self._priority_waiters)
+
+            if not waiting:
+                self._last_empty = now
+
+                if self.in_flight < self.max_in_flight:
+                    self.in_flight += 1
+                    self.admitted += 1
+                    return True
+
+            if waiting >= self.max_queue:
+                self.shed += 1
+                return None
+
+            waiter = Waiter(loop)
+            (self._priority_waiters if priority else self._waiters).append(waiter)
+            self.queued += 1
+
+            return waiter
+
+    def _leave(self, waiter, priority):
+
+        with self._lock:
+
+            # Woken up (possibly right as the wait timed out): the finished request's slot is now ours.
+            if waiter.granted:
+                self.admitted += 1
+                return True
+
+            (self._priority_waiters if priority else self._waiters).remove(waiter)
+
+            if not self._priority_waiters and not self._waiters:
+                self._last_empty = time.monotonic()
+
+            self.shed += 1
+
+            return False
+
+    def _wait_timeout(self):
+
+        # CoDel-style: while the queue keeps waiting requests for longer than `interval`, the server can't keep up, so
+        # waiting longer than `target_latency` is pointless, they'd only make the requests behind them late too.
+        if self.target_latency is not None and time.monotonic() - self._last_empty > self.interval:
+            return min(self.target_latency, self.queue_timeout)
+
+        return self.queue_timeout
+
+
+def admission_control(max_in_flight, **options):
+
+    """
+        Returns the admission control for `PyExpress(admission=...)`.
+        Requests beyond `max_in_flight` wait for a slot, and get a 503 with a Retry-After header when they can't have
+        one in time, instead of making every request slow.
+        Options:
+            - max_queue: Requests waiting for a slot at once (defaults to max_in_flight). Past that, they're shed.
+            - queue_timeout: Longest wait for a slot, in seconds.
+            - target_latency: Once requests have been waiting for longer than `interval`, only let them wait this long
+              (in seconds), so the accepted ones keep a low latency while the server is overloaded.
+            - interval: Seconds the queue has to stay non-empty before `target_latency` applies.
+            - exempt: Route patterns that are never limited (ie: "/health").
+            - priority: Route patterns whose requests get the free slots before the others.
+            - retry_after: Seconds sent in the Retry-After header of shed requests.
+    """
+
+    return AdmissionControl(max_in_flight, **options)
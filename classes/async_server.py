@@ -0,0 +1,437 @@
+import asyncio
+import http.client
+import os
+import signal
+import threading
+from io import BytesIO
+
+from classes.body_parser import BodyReader, parse_content_length
+from classes.dispatch import dispatch_async
+from classes.http_server import MAX_DRAIN_SIZE
+from classes.errors import BadRequest, HTTPError, RequestHeaderFieldsTooLarge, RequestTimeout
+from classes.proxy_protocol import read_proxy_header_async
+from classes.request import split_target
+from classes.serialization import error_response
+
+
+# Methods handled by the framework (same as the do_* methods of CustomHandler).
+SUPPORTED_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DEL')
+
+# Bodies up to this size are read before the handlers run. Bigger ones stay on the connection until read (see
+# StreamedBody), so they never have to fit in memory and requests can be rejected without reading them.
+MAX_BUFFERED_BODY = 1024 * 1024
+
+
+class StreamedBody:
+
+    """
+        The `rfile` of a body left on the connection. Plain controllers (on the executor threads) read it as it
+        arrives; handlers running on the event loop can't wait for it, so they load it first with
+        `await req.load_body()`. Each read waits up to `timeout` seconds for the client.
+    """
+
+    def __init__(self, reader, loop, loop_thread, timeout=None):
+        self.reader = reader
+        self.loop = loop
+        self.loop_thread = loop_thread
+        self.timeout = timeout
+        self.failed = False
+        self._buffer = None
+
+    def read(self, size):
+
+        if self._buffer is not None:
+            return self._buffer.read(size)
+
+        if threading.get_ident() == self.loop_thread:
+            raise RuntimeError('Large request bodies must be loaded with `await req.load_body()` before being read '
+                               'from the event loop.')
+
+        return asyncio.run_coroutine_threadsafe(self._read(size), self.loop).result()
+
+    @property
+    def loaded(self):
+        return self._buffer is not None
+
+    async def load(self, size):
+
+        buffer = BytesIO()
+
+        while size > 0:
+
+            chunk = await self._read(min(size, 64 * 1024))
+
+            if not chunk:
+                self.failed = True
+                raise BadRequest('Unexpected end of body')
+
+            buffer.write(chunk)
+            size -= len(chunk)
+
+        buffer.seek(0)
+        self._buffer = buffer
+
+    async def _read(self, size):
+        try:
+            return await asyncio.wait_for(self.reader.read(size), timeout=self.timeout)
+        except asyncio.TimeoutError:
+            self.failed = True
+            raise RequestTimeout('Request body took too long') from None
+
+
+class AsyncConnection:
+
+    """
+        Stands in for BaseHTTPRequestHandler towards Response (which writes the status line and headers itself).
+        Writes go straight to the stream. From the executor threads they wait for the stream to drain, so a handler
+        streaming a large body is held back to the pace of the client.
+    """
+
+    def __init__(self, method, path, request_version, headers, body_reader, close_connection, writer, client_address):
+        self.command = method
+        self.path = path
+        self.request_version = request_version
+        self.headers = headers
+        self.body_reader = body_reader
+        self.wfile = self
+        self.close_connection = close_connection
+        self.writer = writer
+        self.client_address = client_address
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+
+        # File transfers started from the event loop, awaited by the server once the handlers are done.
+        self.pending = []
+
+    def write(self, data):
+
+        if threading.get_ident() == self._loop_thread:
+            self.writer.write(data)
+        else:
+            asyncio.run_coroutine_threadsafe(self._write(data), self.loop).result()
+
+    def flush(self):
+        pass
+
+    def sendfile(self, file, offset, count):
+
+        """
+            Copies `count` bytes of `file`, from `offset`, to the stream (with os.sendfile where available).
+        """
+
+        if threading.get_ident() != self._loop_thread:
+            asyncio.run_coroutine_threadsafe(
+                self.loop.sendfile(self.writer.transport, file, offset, count), self.loop).result()
+            return
+
+        # On the loop the transfer can't be waited for here. The caller closes its file, so send from a copy.
+        copy = os.fdopen(os.dup(file.fileno()), 'rb')
+
+        async def transfer():
+            try:
+                await self.loop.sendfile(self.writer.transport, copy, offset, count)
+            finally:
+                copy.close()
+
+        self.pending.append(self.loop.create_task(transfer()))
+
+    async def _write(self, data):
+        self.writer.write(data)
+        await self.writer.drain()
+
+
+class AsyncServer:
+
+    """
+        Server engine built on asyncio.start_server.
+        Uses the routes and middlewares of a PyExpress app. `async def` middlewares and controllers run on the event
+        loop; plain controllers are offloaded to `executor` so they don't block it, while plain middlewares run inline.
+        With `proxy_protocol`, connections start with a PROXY protocol header, that gives the client's address.
+    """
+
+    def __init__(self, framework, executor, keep_alive_timeout=None, max_requests_per_connection=None,
+                 header_timeout=None, body_timeout=None, max_header_size=None, max_connections=None,
+                 proxy_protocol=False):
+        self.framework = framework
+        self.executor = executor
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_requests_per_connection = max_requests_per_connection
+        self.header_timeout = header_timeout
+        self.body_timeout = body_timeout
+        self.max_header_size = max_header_size
+        self.max_connections = max_connections
+        self.proxy_protocol = proxy_protocol
+
+        # Tasks of the open connections, and of the ones waiting for their next request (oldest first).
+        self._connections = set()
+        self._idle = {}
+        self._stopping = False
+
+    # Serve
+    async def serve(self, sock):
+
+        """
+            Accepts connections on a listening socket until SIGINT/SIGTERM.
+        """
+
+        loop = asyncio.get_running_loop()
+
+        stop = asyncio.Event()
+
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+
+        server = await asyncio.start_server(self.handle_connection, sock=sock)
+
+        try:
+            await stop.wait()
+        finally:
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(signum)
+
+            self._stopping = True
+
+            server.close()
+
+            # Idle connections are closed right away, busy ones after their current response.
+            for task in list(self._idle):
+                task.cancel()
+
+            await asyncio.gather(*self._connections, return_exceptions=True)
+
+            await server.wait_closed()
+
+    # Handle a connection
+    async def handle_connection(self, reader, writer):
+
+        requests_handled = 0
+
+        task = asyncio.current_task()
+
+        # At the limit, the connection idle for the longest makes room. Without one, the new connection gets a 503
+        # (and isn't counted).
+        if self.max_connections is not None and len(self._connections) >= self.max_connections:
+
+            if not self._idle:
+                await self._reject(reader, writer)
+                return
+
+            oldest = next(iter(self._idle))
+            del self._idle[oldest]
+            self._connections.discard(oldest)
+            oldest.cancel()
+
+        self._connections.add(task)
+
+        try:
+
+            client_address = writer.get_extra_info('peername')
+
+            # Behind a proxy speaking the PROXY protocol, the connection starts with the address of the actual client.
+            if self.proxy_protocol:
+
+                try:
+                    address = await asyncio.wait_for(read_proxy_header_async(reader), timeout=self.header_timeout)
+                # Without a valid header there's no telling where the request starts.
+                except HTTPError:
+                    return
+
+                if address is not None:
+                    client_address = address
+
+            # Serve requests one after the other (pipelined ones wait in the reader's buffer) until one closes it.
+            while not self._stopping:
+
+                connection = await self._read_request(reader, writer, client_address)
+
+                if connection is None:
+                    return
+
+                requests_handled += 1
+                if self.max_requests_per_connection and requests_handled >= self.max_requests_per_connection:
+                    connection.close_connection = True
+
+                if self._stopping:
+                    connection.close_connection = True
+
+                response = await self._dispatch(connection)
+
+                # Nothing was sent, closing is the only way to let the client know.
+                if not response.is_sent:
+                    return
+
+                for transfer in connection.pending:
+                    await transfer
+
+                await writer.drain()
+
+                if response.trace is not None:
+                    self.framework.tracing.response_sent(response)
+
+                if connection.close_connection:
+                    return
+
+                # Skip whatever is left of a body still on the connection, so the next request starts at the right
+                # place. Buffered bodies were already read off it.
+                body = connection.body_reader
+                if body.broken:
+                    return
+                if isinstance(body.rfile, StreamedBody) and not body.rfile.loaded:
+                    if body.rfile.failed or body.remaining > MAX_DRAIN_SIZE:
+                        return
+                    if body.remaining > 0:
+                        await asyncio.wait_for(reader.readexactly(body.remaining), timeout=self.body_timeout)
+
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+            pass
+
+        # Cancelled while idle because the server is stopping, or to make room for a new connection.
+        except asyncio.CancelledError:
+            pass
+
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+            self._connections.discard(task)
+
+    async def _read_request(self, reader, writer, client_address):
+
+        # Waiting for the next request is the connection's idle time, during which it can be closed (on shutdown, or
+        # to make room for a new one).
+        task = asyncio.current_task()
+        self._idle[task] = None
+
+        try:
+            first_byte = await asyncio.wait_for(reader.read(1), timeout=self.keep_alive_timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            self._idle.pop(task, None)
+
+        if not first_byte:
+            return None
+
+        # The rest of the head has `header_timeout` seconds in total, so a client can't hold the connection by sending
+        # it a byte at a time.
+        try:
+            request_line, lines = await asyncio.wait_for(self._read_head(reader, first_byte), timeout=self.header_timeout)
+        except asyncio.TimeoutError:
+            await self._send_error(writer, 408)
+            return None
+        except HTTPError as error:
+            await self._send_error(writer, error.status_code)
+            return None
+
+        parts = request_line.decode('latin-1').rstrip('\r\n').split()
+
+        if len(parts) != 3 or not parts[2].startswith('HTTP/'):
+            await self._send_error(writer, 400)
+            return None
+
+        method, path, version = parts
+
+        headers = http.client.parse_headers(BytesIO(b''.join(lines)))
+
+        if method not in SUPPORTED_METHODS:
+            await self._send_error(writer, 501)
+            return None
+
+        # Chunked request bodies aren't supported, so there's no telling where the next request starts.
+        if 'Transfer-Encoding' in headers:
+            await self._send_error(writer, 501)
+            return None
+
+        content_length = parse_content_length(headers)
+
+        if content_length is None:
+            await self._send_error(writer, 400)
+            return None
+
+        # Small bodies are read right away, big ones when (if) the handlers ask for them. Bodies over the limit of their
+        # route are left on the connection, they're rejected without being read.
+        max_body_size = self._max_body_size(method, path) if content_length > 0 else None
+
+        if content_length <= MAX_BUFFERED_BODY and (max_body_size is None or content_length <= max_body_size):
+            try:
+                body = await asyncio.wait_for(reader.readexactly(content_length), timeout=self.body_timeout) \
+                    if content_length > 0 else b''
+            except asyncio.TimeoutError:
+                await self._send_error(writer, 408)
+                return None
+            rfile = BytesIO(body)
+        else:
+            rfile = StreamedBody(reader, asyncio.get_running_loop(), threading.get_ident(), self.body_timeout)
+
+        # HTTP/1.1 keeps the connection open unless told otherwise, HTTP/1.0 only if asked to.
+        connection_header = headers.get('Connection', '').lower()
+        if version >= 'HTTP/1.1':
+            close_connection = connection_header == 'close'
+        else:
+            close_connection = connection_header != 'keep-alive'
+
+        return AsyncConnection(
+            method, path, version, headers, BodyReader(rfile, content_length), close_connection, writer, client_address)
+
+    def _max_body_size(self, method, path):
+
+        # The route is looked up again by the dispatch, only requests with a body pay for this one.
+        match = self.framework.router.lookup(split_target(path)[0], method)
+
+        return (match[0].pipeline if match else self.framework.not_found_pipeline).max_body_size
+
+    async def _read_head(self, reader, first_byte):
+
+        # Request line, ie: GET /path HTTP/1.1
+        try:
+            request_line = first_byte + await reader.readline()
+        # Longer than the reader's line limit.
+        except ValueError:
+            raise HTTPError(status_code=414) from None
+
+        size = len(request_line)
+
+        # Header lines, until the empty line.
+        lines = []
+
+        while True:
+
+            try:
+                line = await reader.readline()
+            except ValueError:
+                raise RequestHeaderFieldsTooLarge() from None
+
+            size += len(line)
+
+            if self.max_header_size is not None and size > self.max_header_size:
+                raise RequestHeaderFieldsTooLarge()
+
+            lines.append(line)
+
+            if line in (b'\r\n', b'\n', b''):
+                return request_line, lines
+
+    async def _send_error(self, writer, code):
+        writer.write(error_response(code))
+        await writer.drain()
+
+    async def _reject(self, reader, writer):
+
+        try:
+            # Read the request head first, closing with it unread would reset the connection before the 503 is read.
+            if self.proxy_protocol:
+                await asyncio.wait_for(read_proxy_header_async(reader), timeout=1)
+            await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout=1)
+            writer.write(error_response(503, [('Retry-After', 1)]))
+            await writer.drain()
+        except (ConnectionError, asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                HTTPError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, connection):
+        return await dispatch_async(self.framework, connection, self.executor)
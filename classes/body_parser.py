@@ -0,0 +1,342 @@
+import codecs
+import json
+import re
+from urllib.parse import parse_qs
+from classes.errors import BadRequest, HTTPError, RequestTimeout
+from classes.multipart import MultipartParser, parse_boundary
+
+
+class BodyReader:
+
+    """
+        File-like view over the body of a request: reads from the connection's `rfile` without going past the
+        `content_length` bytes that belong to the request.
+    """
+
+    def __init__(self, rfile, content_length):
+        self.rfile = rfile
+        self.content_length = content_length
+        self.remaining = content_length
+        # Set when a read failed, so what's left of the body can't be skipped and the connection can't be reused.
+        self.broken = False
+
+    def read(self, size=-1):
+
+        if self.remaining <= 0:
+            return b''
+
+        # Everything that's left, which can take several reads of a socket.
+        if size is None or size < 0:
+            chunks = []
+            while self.remaining > 0:
+                chunks.append(self.read(self.remaining))
+            return b''.join(chunks)
+
+        if size > self.remaining:
+            size = self.remaining
+
+        try:
+            data = self.rfile.read(size)
+        except RequestTimeout:
+            self.remaining = 0
+            self.broken = True
+            raise
+
+        # The client went away in the middle of the body.
+        if not data:
+            self.remaining = 0
+            self.broken = True
+            raise BadRequest('Unexpected end of body')
+
+        self.remaining -= len(data)
+
+        return data
+
+    def drain(self, max_size):
+
+        """
+            Discards the unread part of the body, if it's no bigger than `max_size`. Returns whether it was discarded.
+        """
+
+        if self.broken or self.remaining > max_size:
+            return False
+
+        while self.remaining > 0:
+            self.read(64 * 1024)
+
+        return True
+
+
+def parse_content_length(headers):
+
+    """
+        The Content-Length of a request (0 without one), or None if it's not a valid length.
+    """
+
+    value = headers.get('Content-Length')
+
+    if value is None:
+        return 0
+
+    if not value.strip().isdigit():
+        return None
+
+    return int(value)
+
+
+class BodyParsers:
+
+    """
+        The functions that parse request bodies, by Content-Type (see PyExpress.body_parser). A parser gets the request
+        and returns its body, read from `request.raw`, or streamed from `request.stream()` / `request.body_reader`.
+        Content types are looked up as is (ie: "application/json"), then by their type ("multipart/*"), then "*/*".
+    """
+
+    def __init__(self, multipart_limits=None):
+
+        # Limits of multipart/form-data bodies (see MultipartParser).
+        self.multipart_limits = multipart_limits
+
+        self.parsers = {
+            "application/json": parse_json,
+            "application/x-ndjson": parse_ndjson,
+            "application/x-www-form-urlencoded": parse_form,
+            "multipart/*": self.parse_multipart,
+            "text/plain": parse_text,
+            # Anything else is taken as text.
+            "*/*": parse_text,
+        }
+
+    def add(self, content_type, parser):
+        self.parsers[content_type.lower()] = parser
+
+    def get(self, content_type):
+
+        parsers = self.parsers
+        parser = parsers.get(content_type)
+
+        if parser is None:
+            parser = parsers.get(content_type.partition('/')[0] + '/*') or parsers.get('*/*')
+
+        return parser
+
+    def parse_multipart(self, request):
+        # Multipart bodies can be huge, never read them in one go.
+        return parse_multipart(request.headers, request.body_reader, request.body_reader.content_length,
+                               self.multipart_limits)
+
+
+def content_type_of(headers):
+    """The media type of the Content-Type header, without its parameters (ie: charset), lowercased."""
+    return headers.get('Content-Type', '').split(';')[0].strip().lower()
+
+
+# Parse body
+def parse_body(headers, request, debug_mode=False, parsers=None):
+
+    """
+        Parse the body of `request` with the parser registered for its Content-Type in `parsers` (see BodyParsers).
+    """
+
+    # Read the content length to determine how many bytes to read from the input stream
+    content_length = int(headers.get('Content-Length', 0))
+
+    if content_length <= 0:
+        return None
+
+    parser = (parsers or DEFAULT_BODY_PARSERS).get(content_type_of(headers))
+
+    try:
+        return parser(request)
+
+    # Timeouts, limits...
+    except HTTPError:
+        raise
+
+    except Exception as e:
+
+        # Log parsing errors and re-raise if necessary
+        if debug_mode:
+            print(f"Error parsing body: {e}")
+        raise BadRequest("Unable to parse body")
+
+
+def parse_json(request):
+    return json.loads(request.raw.decode('utf-8'))
+
+
+def parse_form(request):
+    return parse_qs(request.raw.decode('utf-8'))
+
+
+def parse_text(request):
+    return request.raw.decode('utf-8')
+
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r'[ \t\n\r]*')
+
+
+def parse_ndjson(request):
+    # A generator over the records, parsed as the body is read.
+    return iter_ndjson(request.stream())
+
+
+def iter_ndjson(chunks):
+
+    """
+        Yields the JSON value of each line of an NDJSON body given as chunks of bytes, skipping blank lines.
+    """
+
+    # The start of a line that goes on in the next chunks.
+    parts = []
+    number = 0
+
+    for chunk in chunks:
+
+        lines = chunk.split(b'\n')
+
+        if parts:
+            parts.append(lines[0])
+            lines[0] = b''.join(parts)
+
+        parts = [lines.pop()]
+
+        for line in lines:
+            number += 1
+            if line.strip():
+                yield _load_line(line, number)
+
+    line = b''.join(parts)
+
+    if line.strip():
+        yield _load_line(line, number + 1)
+
+
+def _load_line(line, number):
+    try:
+        return _decoder.decode(line.decode('utf-8'))
+    except ValueError:
+        raise BadRequest(f'Invalid JSON on line {number}') from None
+
+
+def iter_json_array(chunks):
+
+    """
+        Yields the items of a JSON array given as chunks of bytes, each one as soon as it's complete, so only one item
+        (and a chunk) is in memory at a time.
+    """
+
+    chunks = iter(chunks)
+    decode = codecs.getincrementaldecoder('utf-8')().decode
+
+    buffer = ''
+    position = 0
+    finished = False
+
+    def more(needed):
+
+        # Reads until `needed` characters are buffered past `position` (or the body ends). Returns False at the end.
+        nonlocal buffer, position, finished
+
+        if finished:
+            return False
+
+        parts = [buffer[position:]]
+        size = len(parts[0])
+
+        while size < needed:
+            chunk = next(chunks, None)
+
+            if chunk is None:
+                finished = True
+                parts.append(decode(b'', final=True))
+                break
+
+            text = decode(chunk)
+            parts.append(text)
+            size += len(text)
+
+        buffer = ''.join(parts)
+        position = 0
+
+        return True
+
+    def next_character():
+
+        # Skips whitespace, returns the next character ('' at the end of the body).
+        nonlocal position
+
+        while True:
+            position = _whitespace.match(buffer, position).end()
+
+            if position < len(buffer):
+                return buffer[position]
+
+            if not more(1):
+                return ''
+
+    try:
+        if next_character() != '[':
+            raise BadRequest('Expected a JSON array')
+
+        position += 1
+
+        if next_character() == ']':
+            return
+
+        while True:
+
+            # Decode the item. A number cut by the end of the buffer (ie: "1." of "1.5") decodes too, so an item only
+            # counts once the separator after it is buffered. Each retry waits for twice as much text, so large items
+            # are decoded in a few attempts rather than one per chunk.
+            needed = 0
+
+            while True:
+                try:
+                    item, end = _decoder.raw_decode(buffer, position)
+                    following = _whitespace.match(buffer, end).end()
+                    if finished or following < len(buffer) and buffer[following] in ',]':
+                        break
+                except ValueError:
+                    if finished:
+                        raise BadRequest('Invalid JSON array') from None
+
+                needed = max(needed * 2, len(buffer) - position + 1)
+                more(needed)
+
+            position = end
+            yield item
+
+            separator = next_character()
+            position += 1
+
+            if separator == ']':
+                break
+
+            if separator != ',':
+                raise BadRequest('Invalid JSON array')
+
+            next_character()
+
+        if next_character() != '':
+            raise BadRequest('Unexpected data after the JSON array')
+
+    except UnicodeDecodeError:
+        raise BadRequest('Invalid UTF-8 in body') from None
+
+
+# Parse multipart
+def parse_multipart(headers, rfile, content_length, limits=None):
+    """Parse a multipart/form-data body, streaming it from `rfile`."""
+
+    content_type = headers.get('Content-Type')
+
+    # Extract the boundary from the Content-Type header
+    boundary = parse_boundary(content_type)
+
+    return MultipartParser(rfile, content_length, boundary, **(limits or {})).parse()
+
+
+# Parsers without multipart limits, for requests made outside of an app.
+DEFAULT_BODY_PARSERS = BodyParsers()
@@ -0,0 +1,299 @@
+import asyncio
+import threading
+import time
+from urllib.parse import parse_qsl
+
+from classes.lru import LRUCache
+
+
+class CacheEntry:
+
+    """A cached response: what the route sent, as bytes, until `expires`."""
+
+    __slots__ = ('status_code', 'headers', 'body', 'content_type', 'expires', 'variant_key')
+
+    def __init__(self, status_code, headers, body, content_type, expires, variant_key):
+        self.status_code = status_code
+        self.headers = headers
+        self.body = body
+        self.content_type = content_type
+        self.expires = expires
+        # Key for the compressed variants of the body (see Compression.compress).
+        self.variant_key = variant_key
+
+    @property
+    def size(self):
+        # Rough size of the headers on top of the body.
+        return len(self.body) + 64 * (len(self.headers) + 1)
+
+
+class Flight:
+
+    """A response being computed. Requests for the same key wait for it instead of computing it again."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def wait(self, timeout):
+        return self._done.wait(timeout)
+
+    async def wait_async(self, timeout):
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def wake():
+            if not future.done():
+                future.set_result(None)
+
+        with self._lock:
+            if self._done.is_set():
+                return True
+            self._callbacks.append(lambda: loop.call_soon_threadsafe(wake))
+
+        try:
+            await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return False
+
+        return True
+
+    def land(self):
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, []
+
+        for callback in callbacks:
+            callback()
+
+
+class RouteCache:
+
+    """
+        Response cache for a route (see `route_cache`).
+        The route's middlewares run on every request, so a hit still goes through its auth and validation, and the
+        controller only runs on a miss. What it sends with res.send/res.json/res.send_bytes is kept as bytes, so hits
+        don't encode it again. When several requests miss the same key at once, only the
+        first one runs the route and the others wait for its response.
+    """
+
+    def __init__(
+        self,
+        ttl=5.0,
+        max_size=32 * 1024 * 1024,
+        key=None,
+        vary_headers=(),
+        statuses=(200,),
+        wait_timeout=10.0,
+    ):
+        self.ttl = ttl
+        self.key = key or self.default_key
+        self.vary_headers = tuple(vary_headers)
+        self.statuses = frozenset(statuses)
+        self.wait_timeout = wait_timeout
+        self.entries = LRUCache(max_size, sizeof=lambda entry: entry.size)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    # Default key
+    def default_key(self, req):
+
+        """
+            The path, the query params (sorted, so their order doesn't matter) and the values of `vary_headers`.
+        """
+
+        headers = tuple(req.get(name) for name in self.vary_headers)
+
+        return req.path_without_query, tuple(sorted(parse_qsl(req.query_string, keep_blank_values=True))), headers
+
+    # Stats
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.entries.evictions,
+            "entries": len(self.entries),
+            "size": self.entries.size,
+        }
+
+    def clear(self):
+        self.entries = LRUCache(self.entries.max_size, sizeof=self.entries.sizeof)
+
+    # Handle
+    def handle(self, req, res, compute):
+
+        """
+            Sends the cached response for the request, or calls `compute()` (which runs the rest of the route) and
+            keeps what it sends. Returns whether the controller was reached, like Pipeline.run.
+        """
+
+        key = self.key(req)
+
+        entry = self._lookup(key)
+
+        if entry is not None:
+            self._count('hits')
+            return self._send(entry, res)
+
+        self._count('misses')
+
+        flight, leader = self._join(key)
+
+        if not leader:
+
+            flight.wait(self.wait_timeout)
+
+            entry = self._lookup(key)
+
+            # The first request didn't leave anything to share (ie: an error), so compute it separately.
+            if entry is None:
+                return compute()
+
+            self._count('coalesced')
+            return self._send(entry, res)
+
+        try:
+            before = self._start_capture(res)
+            reached = compute()
+            self._store(key, res, before)
+            return reached
+        finally:
+            self._land(key, flight)
+
+    # Handle (asyncio)
+    async def handle_async(self, req, res, compute):
+
+        """
+            Same as handle(), for the asyncio engine. `compute` is a coroutine function.
+        """
+
+        key = self.key(req)
+
+        entry = self._lookup(key)
+
+        if entry is not None:
+            self._count('hits')
+            return self._send(entry, res)
+
+        self._count('misses')
+
+        flight, leader = self._join(key)
+
+        if not leader:
+
+            await flight.wait_async(self.wait_timeout)
+
+            entry = self._lookup(key)
+
+            if entry is None:
+                return await compute()
+
+            self._count('coalesced')
+            return self._send(entry, res)
+
+        try:
+            before = self._start_capture(res)
+            reached = await compute()
+            self._store(key, res, before)
+            return reached
+        finally:
+            self._land(key, flight)
+
+    def _lookup(self, key):
+
+        entry = self.entries.get(key)
+
+        # Expired.
+        if entry is not None and entry.expires <= time.monotonic():
+            self.entries.pop(key)
+            return None
+
+        return entry
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _join(self, key):
+
+        with self._lock:
+
+            flight = self._flights.get(key)
+
+            if flight is not None:
+                return flight, False
+
+            flight = self._flights[key] = Flight()
+
+            return flight, True
+
+    def _land(self, key, flight):
+
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+        flight.land()
+
+    def _start_capture(self, res):
+        res.capture = True
+        # Headers set before the cached part of the route (ie: by global middlewares) aren't part of the entry.
+        return dict(res.headers)
+
+    def _store(self, key, res, before):
+
+        captured = res.captured
+
+        if captured is None:
+            return
+
+        status_code, headers, body, content_type = captured
+
+        if status_code not in self.statuses:
+            return
+
+        headers = {name: value for name, value in headers.items() if before.get(name) != value}
+
+        # Responses that set cookies belong to one client.
+        if any(name.lower() == 'set-cookie' for name in headers):
+            return
+
+        now = time.monotonic()
+
+        self.entries.put(key, CacheEntry(status_code, headers, body, content_type, now + self.ttl, (key, now)))
+
+    def _send(self, entry, res):
+
+        res.status(entry.status_code)
+
+        for name, value in entry.headers.items():
+            res.set_header(name, value)
+
+        res.send_bytes(entry.body, entry.content_type, cache_key=entry.variant_key)
+
+        return True
+
+
+def route_cache(**options):
+
+    """
+        Returns a response cache to attach to a GET route, ie: `app.get('/items', list_items, cache=route_cache(ttl=5))`.
+        Every middleware (global or the route's) still runs on every request; only the controller is skipped on a hit.
+        Only responses sent with res.send/res.json/res.send_bytes are cached.
+        Options:
+            - ttl: Seconds a response is kept for.
+            - max_size: Bytes of responses kept in memory, least recently used ones are evicted first.
+            - key: Function of the request that returns the (hashable) cache key. Defaults to the path, the sorted
+              query params and the values of `vary_headers`.
+            - vary_headers: Request headers whose values are part of the default key (ie: "Accept-Language").
+            - statuses: Status codes of the responses that are cached.
+            - wait_timeout: Seconds a request waits for the same response being computed by another request.
+    """
+
+    return RouteCache(**options)
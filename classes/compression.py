@@ -0,0 +1,183 @@
+import gzip
+import zlib
+
+from classes.lru import LRUCache
+
+
+# Content types worth compressing (besides text/*, and anything ending in +json or +xml).
+COMPRESSIBLE_TYPES = frozenset((
+    'application/json',
+    'application/javascript',
+    'application/x-javascript',
+    'application/xml',
+    'application/x-ndjson',
+    'application/wasm',
+    'image/svg+xml',
+    'image/x-icon',
+    'font/ttf',
+    'font/otf',
+))
+
+# Encodings we can produce, in order of preference when the client likes them equally.
+ENCODINGS = ('gzip', 'deflate')
+
+
+class Compression:
+
+    """
+        Middleware that compresses responses with gzip or deflate (see `compression`).
+        It only negotiates the encoding: the response compresses its body when it's sent, if the content type and size
+        are worth it.
+    """
+
+    def __init__(self, min_size=1024, level=6, content_types=None, cache_size=8 * 1024 * 1024):
+        self.min_size = min_size
+        self.level = level
+        self.content_types = frozenset(content_types) if content_types is not None else COMPRESSIBLE_TYPES
+        # Compressed variants of bodies sent with a cache key (ie: static files).
+        self.cache = LRUCache(cache_size) if cache_size else None
+        self._negotiated = {}
+
+    def __call__(self, req, res, next):
+
+        encoding = self.negotiate(req.headers.get('Accept-Encoding'))
+
+        if encoding is not None:
+            res.compression = (self, encoding)
+
+        next()
+
+    # Negotiate
+    def negotiate(self, accept_encoding):
+
+        """
+            Picks the encoding to use from an Accept-Encoding header, or None to send the body as is.
+        """
+
+        if not accept_encoding:
+            return None
+
+        # Clients send the same few headers over and over.
+        encoding = self._negotiated.get(accept_encoding, False)
+
+        if encoding is False:
+
+            encoding = parse_accept_encoding(accept_encoding)
+
+            if len(self._negotiated) > 256:
+                self._negotiated.clear()
+
+            self._negotiated[accept_encoding] = encoding
+
+        return encoding
+
+    def compressible(self, content_type):
+
+        if not content_type:
+            return False
+
+        media_type = content_type.split(';', 1)[0].strip().lower()
+
+        return (
+            media_type.startswith('text/')
+            or media_type in self.content_types
+            or media_type.endswith(('+json', '+xml'))
+        )
+
+    # Compress
+    def compress(self, data, encoding, cache_key=None):
+
+        """
+            Compresses a whole body. Bodies sent with a `cache_key` are only compressed the first time.
+        """
+
+        if cache_key is not None and self.cache is not None:
+
+            compressed = self.cache.get((cache_key, encoding))
+
+            if compressed is None:
+                compressed = self._compress(data, encoding)
+                self.cache.put((cache_key, encoding), compressed)
+
+            return compressed
+
+        return self._compress(data, encoding)
+
+    def compress_stream(self, chunks, encoding):
+
+        """
+            Compresses a body chunk by chunk. Every chunk is flushed, so the client gets each one as soon as it's
+            produced (at some cost in compression ratio when the chunks are small).
+        """
+
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31 if encoding == 'gzip' else 15)
+
+        for chunk in chunks:
+            if chunk:
+                yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        yield compressor.flush()
+
+    def _compress(self, data, encoding):
+
+        if encoding == 'gzip':
+            # No timestamp, so the same body always compresses to the same bytes.
+            return gzip.compress(data, compresslevel=self.level, mtime=0)
+
+        return zlib.compress(data, self.level)
+
+
+def parse_accept_encoding(header):
+
+    """
+        Returns the encoding (from ENCODINGS) the client prefers according to an Accept-Encoding header, or None.
+    """
+
+    weights = {}
+    wildcard = None
+
+    for item in header.split(','):
+
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+
+        weight = 1.0
+        params = params.strip()
+
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+
+        if name == '*':
+            wildcard = weight
+        elif name in ENCODINGS:
+            weights[name] = weight
+
+    best, best_weight = None, 0.0
+
+    for encoding in ENCODINGS:
+
+        weight = weights.get(encoding, wildcard)
+
+        if weight is not None and weight > best_weight:
+            best, best_weight = encoding, weight
+
+    return best
+
+
+def compression(**options):
+
+    """
+        Returns a middleware that compresses responses, to use with `PyExpress.use` (before the routes and middlewares
+        whose responses should be compressed).
+        Options:
+            - min_size: Smallest body (in bytes) that gets compressed.
+            - level: zlib compression level, 1 (fastest) to 9 (smallest).
+            - content_types: Media types to compress, besides text/* and +json/+xml types.
+            - cache_size: Bytes of compressed bodies kept in memory for responses sent with a cache key, ie: static
+              files (0 to disable).
+    """
+
+    return Compression(**options)
@@ -0,0 +1,220 @@
+import inspect
+import time
+
+from classes.body_parser import parse_body
+from classes.errors import HTTPError
+from classes.request import Request
+from classes.response import Response
+
+
+def dispatch(framework, connection, method):
+
+    """
+        Runs a request through the app: the route lookup, the pipeline, the error handling, and the metrics and
+        tracing around them. Returns the response.
+        `connection` is where the request was read from and where the response goes: the threads engine's
+        CustomHandler, or the test client's in-memory connection. It has the `path`, `headers`, `client_address` and
+        `body_reader` of the request, and what Response writes to (`wfile`, `request_version`, `close_connection`,
+        `sendfile`).
+    """
+
+    request, response = _start(framework, connection, method)
+
+    try:
+        return _measure(framework, connection, request, response)
+    finally:
+        _finish(framework, request, response)
+
+
+async def dispatch_async(framework, connection, executor):
+
+    """
+        Same as dispatch(), for the asyncio engine's AsyncConnection. `async def` handlers are awaited, plain
+        controllers run on `executor`.
+    """
+
+    request, response = _start(framework, connection, connection.command)
+
+    try:
+        return await _measure_async(framework, connection, request, response, executor)
+    finally:
+        _finish(framework, request, response)
+
+
+def _start(framework, connection, method):
+
+    # Create the request instance. The body is parsed on first access.
+    request = Request(
+        path=connection.path,
+        method=method,
+        headers=connection.headers,
+        client_address=connection.client_address,
+        body_reader=connection.body_reader,
+        body_parser=lambda request: parse_body(
+            connection.headers, request, framework.debug_mode, framework.body_parsers),
+    )
+
+    # Create response instance
+    response = Response(
+        server=connection,
+        path=connection.path,
+        method=method,
+        headers=connection.headers,
+        json_encoder=framework.json_encoder,
+    )
+
+    if framework.tracing is not None:
+        framework.tracing.request_start(request, response)
+
+    return request, response
+
+
+def _finish(framework, request, response):
+
+    if framework.tracing is not None:
+        framework.tracing.handler_done(request, response)
+
+    # Give back what was leased to the request (see Request.on_finish).
+    request.finish()
+
+
+def _measure(framework, connection, request, response):
+
+    metrics = framework.request_metrics
+
+    if metrics is None:
+        return _handle(framework, connection, request, response)
+
+    shard = metrics.begin()
+    started = time.perf_counter()
+
+    try:
+        return _handle(framework, connection, request, response)
+    finally:
+        _record(metrics, shard, started, connection, request, response)
+
+
+async def _measure_async(framework, connection, request, response, executor):
+
+    metrics = framework.request_metrics
+
+    if metrics is None:
+        return await _handle_async(framework, connection, request, response, executor)
+
+    shard = metrics.begin()
+    started = time.perf_counter()
+
+    try:
+        return await _handle_async(framework, connection, request, response, executor)
+    finally:
+        _record(metrics, shard, started, connection, request, response)
+
+
+def _record(metrics, shard, started, connection, request, response):
+    metrics.end(
+        shard,
+        request.route,
+        request.method,
+        response.status_code if response.is_sent else 500,
+        time.perf_counter() - started,
+        connection.body_reader.content_length,
+        response.bytes_sent,
+    )
+
+
+def _handle(framework, connection, request, response):
+
+    """
+        Runs the pipeline of the route (or the not found one), and the error handling.
+    """
+
+    try:
+        _pipeline(framework, request, response).run(request, response)
+
+    except Exception as error:
+
+        if _answer_error(framework, connection, response, error):
+            return response
+
+        try:
+            framework.error_midleware(request, response, None, error)
+        except Exception as middleware_error:
+            _error_middleware_failed(framework, connection, response, middleware_error)
+
+    return response
+
+
+async def _handle_async(framework, connection, request, response, executor):
+
+    try:
+        await _pipeline(framework, request, response).run_async(request, response, executor)
+
+    except Exception as error:
+
+        if _answer_error(framework, connection, response, error):
+            return response
+
+        try:
+            result = framework.error_midleware(request, response, None, error)
+
+            if inspect.isawaitable(result):
+                await result
+
+        except Exception as middleware_error:
+            _error_middleware_failed(framework, connection, response, middleware_error)
+
+    return response
+
+
+def _pipeline(framework, request, response):
+
+    # Walk the route tree, which gives back the route and its params in one go.
+    match = framework.router.lookup(request.path_without_query, request.method)
+
+    if match:
+        route, values = match
+        request.set_route(route, values)
+
+    if request.trace is not None:
+        framework.tracing.route_matched(request, response)
+
+    # Otherwise the global middlewares still get a chance to answer (ie: static files), or it's a 404.
+    return match[0].pipeline if match else framework.not_found_pipeline
+
+
+def _answer_error(framework, connection, response, error):
+
+    """
+        Answers an error raised by the handlers, unless the app's error middleware should. Returns whether it did.
+    """
+
+    if framework.debug_mode:
+        print(f"Error: {error}")
+
+    # The response is already on its way, dropping the connection is the only way to signal the error.
+    if response.is_sent:
+        connection.close_connection = True
+        return True
+
+    if isinstance(error, HTTPError):
+        response.status(error.status_code).send({"error": str(error)})
+        return True
+
+    # If there is an error middleware, send the error there.
+    if framework.error_midleware:
+        return False
+
+    response.status(500).json({"error": "Something went wrong"})
+
+    return True
+
+
+def _error_middleware_failed(framework, connection, response, error):
+
+    if framework.debug_mode:
+        print(f"Error in the error middleware: {error}")
+
+    if response.is_sent:
+        connection.close_connection = True
+    else:
+        response.status(500).json({"error": "Something went wrong"})
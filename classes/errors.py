@@ -0,0 +1,45 @@
+from http import HTTPStatus
+
+
+class HTTPError(Exception):
+
+    """
+        Error that maps to an HTTP status. When raised while handling a request, the client gets a response with
+        that status and the message as the error.
+    """
+
+    status_code = 500
+
+    def __init__(self, message=None, status_code=None):
+
+        if status_code is not None:
+            self.status_code = status_code
+
+        if message is None:
+            message = HTTPStatus(self.status_code).phrase
+
+        super().__init__(message)
+
+
+class BadRequest(HTTPError, ValueError):
+    status_code = 400
+
+
+class PayloadTooLarge(HTTPError):
+    status_code = 413
+
+
+class RequestTimeout(HTTPError):
+    status_code = 408
+
+
+class RequestHeaderFieldsTooLarge(HTTPError):
+    status_code = 431
+
+
+class ServiceUnavailable(HTTPError):
+    status_code = 503
+
+
+class PoolTimeout(ServiceUnavailable):
+    """No resource of a ResourcePool became free in time."""
@@ -0,0 +1,325 @@
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from io import BytesIO
+
+from classes.body_parser import BodyReader, parse_body
+from classes.errors import ServiceUnavailable
+from classes.request import Request
+from classes.response import Response
+
+
+# Ways a route's controller can run (see PyExpress.get/post/...).
+EXECUTION_POLICIES = ('inline', 'thread', 'process')
+
+# Settings of the app, for the controllers running in the process pool. Set before the pool's processes are forked,
+# so they inherit them.
+_worker_settings = {}
+
+
+class RequestSnapshot:
+
+    """
+        The parts of a request that are sent to a worker process: plain values, with the body as bytes (or already
+        parsed, if a middleware parsed it). The controller gets a Request rebuilt from it.
+    """
+
+    __slots__ = (
+        'path',
+        'method',
+        'headers',
+        'client_address',
+        'route',
+        'params',
+        'context',
+        'raw',
+        'body',
+        'status_code',
+        'response_headers',
+    )
+
+    def __init__(self, request, response):
+
+        self.path = request.path
+        self.method = request.method
+        self.headers = request.headers
+        self.client_address = request.client_address
+        self.route = request.route
+        self.params = request.params
+        self.context = request.context
+        self.status_code = response.status_code
+        self.response_headers = response.headers
+
+        # The body is read here, and parsed in the worker process. Unless a middleware already read it.
+        try:
+            self.raw = request.raw
+            self.body = None
+        except ValueError:
+            self.raw = None
+            self.body = request.body
+
+    def to_request(self):
+
+        raw = self.raw or b''
+
+        request = Request(
+            path=self.path,
+            method=self.method,
+            headers=self.headers,
+            body=self.body,
+            params=self.params,
+            body_reader=BodyReader(BytesIO(raw), len(raw)),
+            body_parser=lambda request: parse_body(
+                self.headers, request, _worker_settings.get('debug_mode', False), _worker_settings.get('body_parsers')),
+            client_address=self.client_address,
+        )
+
+        request.route = self.route
+        request.context.update(self.context)
+
+        return request
+
+
+class ResponseRecorder(Response):
+
+    """
+        The response given to a controller running in a worker process. What it sends is recorded in `description`
+        (status, headers, body, content type), and sent by the server once it's back in the main process.
+    """
+
+    def __init__(self, status_code, headers, method, json_encoder=None):
+        super().__init__(None, None, None, method, json_encoder)
+        self.status_code = status_code
+        self.headers = dict(headers)
+        self.description = None
+
+    def send_bytes(self, data, content_type='application/octet-stream', cache_key=None):
+
+        if self.is_sent:
+            raise Exception('Response was already sent to client.')
+
+        self.is_sent = True
+        self.description = (self.status_code, self.headers, bytes(data), content_type)
+
+    def end(self):
+
+        if self.is_sent:
+            raise Exception('Response was already sent to client.')
+
+        self.is_sent = True
+        self.description = (self.status_code, self.headers, None, None)
+
+    def stream(self, iterable, content_type='application/octet-stream'):
+        raise ValueError('Responses of controllers running in a process pool can\'t be streamed.')
+
+    def send_file(self, path, content_type=None, offset=0, count=None):
+        raise ValueError('Controllers running in a process pool can\'t send files, send their bytes instead.')
+
+
+def run_snapshot(controller, snapshot):
+
+    """
+        Runs `controller` in a worker process. Returns the description of what it sent (None if it sent nothing).
+    """
+
+    response = ResponseRecorder(
+        snapshot.status_code, snapshot.response_headers, snapshot.method, _worker_settings.get('json_encoder'))
+
+    controller(snapshot.to_request(), response)
+
+    return response.description
+
+
+def send_description(response, description):
+
+    """Sends what a controller running in a worker process sent."""
+
+    if description is None:
+        return
+
+    status_code, headers, body, content_type = description
+
+    response.status(status_code)
+    response.headers = headers
+
+    if body is None:
+        response.end()
+    else:
+        response.send_bytes(body, content_type)
+
+
+def _ignore_interrupts():
+    # Ctrl+C reaches the whole process group. The server shuts the pool down itself.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+
+class PoolStats:
+
+    __slots__ = ('submitted', 'completed', 'failed', 'rejected', 'total_time')
+
+    def __init__(self):
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.total_time = 0.0
+
+
+class Executors:
+
+    """
+        Pools that run the controllers of the routes registered with `execution="thread"` or `execution="process"`,
+        so CPU heavy controllers don't hold the threads (or the event loop) serving the other requests.
+        - threads: Size of the thread pool (defaults to min(32, cpu count + 4)).
+        - processes: Size of the process pool (defaults to the cpu count). Its processes are only started if a route
+          uses it, when the server starts (in each worker process, with `listen(processes=...)`).
+        - max_queue: Controllers waiting for a free thread or process, per pool (None for no limit). Past that,
+          requests get a 503.
+    """
+
+    def __init__(self, threads=None, processes=None, max_queue=None):
+        self.sizes = {
+            'thread': threads or min(32, (os.cpu_count() or 1) + 4),
+            'process': processes or os.cpu_count() or 1,
+        }
+        self.max_queue = max_queue
+        self.uses_processes = False
+        self._pools = {}
+        self._stats = {kind: PoolStats() for kind in self.sizes}
+        self._lock = threading.Lock()
+
+    def start(self, app):
+
+        """
+            Starts the process pool, if a route uses it, with the app's settings.
+            Its processes are forked now, before the server's threads start.
+        """
+
+        if not self.uses_processes or 'process' in self._pools:
+            return
+
+        _worker_settings.update(
+            json_encoder=app.json_encoder,
+            body_parsers=app.body_parsers,
+            debug_mode=app.debug_mode,
+        )
+
+        # Fork, so controllers defined in the app's main module can be found in the workers.
+        pool = ProcessPoolExecutor(
+            self.sizes['process'], mp_context=multiprocessing.get_context('fork'), initializer=_ignore_interrupts)
+
+        # Start every process right away rather than on the first requests.
+        for future in [pool.submit(int) for _ in range(self.sizes['process'])]:
+            future.result()
+
+        self._pools['process'] = pool
+
+    def shutdown(self):
+
+        pools, self._pools = self._pools, {}
+
+        for pool in pools.values():
+            pool.shutdown(wait=True)
+
+    def stats(self):
+
+        """
+            Per pool: its size, the controllers running and queued, the completed, failed and rejected (queue full)
+            counts, and the seconds from their submission to their end.
+        """
+
+        result = {}
+
+        for kind, size in self.sizes.items():
+
+            stats = self._stats[kind]
+            pending = stats.submitted - stats.completed - stats.failed
+
+            result[kind] = {
+                "size": size,
+                "running": min(pending, size),
+                "queued": max(0, pending - size),
+                "completed": stats.completed,
+                "failed": stats.failed,
+                "rejected": stats.rejected,
+                "total_time": stats.total_time,
+            }
+
+        return result
+
+    # Call
+    def call(self, execution, controller, request, response):
+
+        """
+            Runs a plain controller with the `execution` policy, and waits for it.
+        """
+
+        if execution == 'inline':
+            return controller(request, response)
+
+        if execution == 'thread':
+            return self.submit('thread', controller, request, response).result()
+
+        send_description(response, self.submit('process', run_snapshot, controller, RequestSnapshot(request, response))
+                         .result())
+
+    async def call_async(self, execution, controller, request, response):
+
+        """
+            Same as call(), for the asyncio engine. Inline controllers run on the event loop.
+        """
+
+        if execution == 'inline':
+            return controller(request, response)
+
+        if execution == 'thread':
+            return await asyncio.wrap_future(self.submit('thread', controller, request, response))
+
+        # The body has to be in memory before it's copied to the worker process (unless a middleware already read it).
+        if request.body_reader is not None and request.body_reader.remaining == request.body_reader.content_length:
+            await request.load_body()
+
+        description = await asyncio.wrap_future(
+            self.submit('process', run_snapshot, controller, RequestSnapshot(request, response)))
+
+        send_description(response, description)
+
+    def submit(self, kind, function, *args):
+
+        stats = self._stats[kind]
+
+        with self._lock:
+
+            pool = self._pools.get(kind)
+
+            if pool is None:
+                if kind == 'process':
+                    raise RuntimeError('The process pool is only available once the server started.')
+                pool = self._pools[kind] = ThreadPoolExecutor(self.sizes[kind], thread_name_prefix='py_express_route')
+
+            pending = stats.submitted - stats.completed - stats.failed
+
+            if self.max_queue is not None and pending >= self.sizes[kind] + self.max_queue:
+                stats.rejected += 1
+                raise ServiceUnavailable()
+
+            stats.submitted += 1
+
+        started = time.perf_counter()
+
+        def done(future):
+            with self._lock:
+                if future.cancelled() or future.exception() is not None:
+                    stats.failed += 1
+                else:
+                    stats.completed += 1
+                stats.total_time += time.perf_counter() - started
+
+        future = pool.submit(function, *args)
+        future.add_done_callback(done)
+
+        return future
@@ -1,281 +1,694 @@
-from http.server import BaseHTTPRequestHandler
-from classes.response import Response
-from classes.request import Request
-import json
-from urllib.parse import parse_qs
-import re
-import tempfile
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from classes.body_parser import BodyReader, parse_content_length
+from classes.dispatch import dispatch
+from classes.errors import HTTPError, RequestHeaderFieldsTooLarge, RequestTimeout
+from classes.proxy_protocol import V2_SIGNATURE, read_proxy_header
+from classes.serialization import error_response
+import io
+import selectors
+import socket
+import threading
+import time
+
+
+# Largest unread request body that is skipped to keep the connection alive (bigger ones close it instead).
+MAX_DRAIN_SIZE = 64 * 1024
+
+# Connections over max_connections waiting for their 503 at once, past that they're closed outright. Each has
+# REJECTION_TIMEOUT seconds to send its request head.
+MAX_REJECTIONS = 8
+REJECTION_TIMEOUT = 0.1
+
+
+class SocketReader(io.RawIOBase):
+
+    """
+        Raw reader over a connection's socket, with a timeout for what is being waited for: the next request while
+        the connection is idle, then the whole request head within `header_timeout` seconds of its first bytes (so a
+        client can't hold a worker by sending it a byte at a time), then each read of the body.
+        With `dont_wait`, reads give None right away when nothing has arrived.
+    """
+
+    def __init__(self, sock):
+        self.sock = sock
+        self.timeout = None
+        self.header_timeout = None
+        self.deadline = None
+
+    def readable(self):
+        return True
+
+    def wait_for_request(self, idle_timeout, header_timeout):
+        self.timeout = idle_timeout
+        self.header_timeout = header_timeout
+        self.deadline = None
+
+    def wait_for_body(self, body_timeout):
+        self.timeout = body_timeout
+        self.header_timeout = None
+        self.deadline = None
+        # Also the timeout of the response's writes.
+        self.sock.settimeout(body_timeout)
+
+    def dont_wait(self):
+        self.timeout = 0
+        self.header_timeout = None
+        self.deadline = None
+
+    def readinto(self, buffer):
+
+        timeout = self.timeout
+
+        if self.deadline is not None:
+            timeout = self.deadline - time.monotonic()
+            if timeout <= 0:
+                raise RequestTimeout('Request head took too long')
+
+        if timeout != self.sock.gettimeout():
+            self.sock.settimeout(timeout)
+
+        try:
+            count = self.sock.recv_into(buffer)
+        except BlockingIOError:
+            return None
+        except TimeoutError:
+            if self.deadline is not None:
+                raise RequestTimeout('Request head took too long')
+            if self.header_timeout is None:
+                raise RequestTimeout('Request body took too long')
+            # Idle for too long between requests, the connection is just closed.
+            raise
+
+        # The head started arriving.
+        if count and self.header_timeout is not None and self.deadline is None:
+            self.deadline = time.monotonic() + self.header_timeout
+
+        return count
+
+
+class HeadReader:
+
+    """
+        Stands in for the rfile while the headers are parsed, and stops them at `limit` bytes.
+    """
+
+    def __init__(self, rfile, limit):
+        self.rfile = rfile
+        self.remaining = limit
+
+    def readline(self, size=-1):
+
+        if self.remaining < 0:
+            raise RequestHeaderFieldsTooLarge()
+
+        # One byte more than allowed is enough to tell the headers are too large.
+        line = self.rfile.readline(self.remaining + 1 if size < 0 else min(size, self.remaining + 1))
+
+        self.remaining -= len(line)
+
+        if self.remaining < 0:
+            raise RequestHeaderFieldsTooLarge()
+
+        return line
+
+
+class IdleConnections:
+
+    """
+        The keep-alive connections of a PooledHTTPServer waiting for their next request. One thread watches them all,
+        so they don't hold a worker each: a connection is handed to `resume` once its next request starts arriving,
+        and to `close` after `timeout` seconds without one (or sooner, to make room with close_oldest(): then `close`
+        is told the connection was `evicted`).
+    """
+
+    def __init__(self, resume, close, timeout=None):
+        self.resume = resume
+        self.close = close
+        self.timeout = timeout
+
+        # Handler of each connection, with its deadline. Oldest first, as they all wait for the same `timeout`.
+        self._handlers = {}
+        # Connections parked (True) or evicted (False) since the watcher last looked, for it to (un)register.
+        self._changes = []
+        self._lock = threading.Lock()
+        self._stopped = False
+
+        self._selector = selectors.DefaultSelector()
+        self._wakeup, self._waker = socket.socketpair()
+        self._wakeup.setblocking(False)
+        self._waker.setblocking(False)
+        self._selector.register(self._wakeup, selectors.EVENT_READ)
+
+        self._thread = threading.Thread(target=self._watch, name='py_express_idle', daemon=True)
+        self._thread.start()
+
+    def park(self, handler):
+
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+
+        with self._lock:
+            stopped = self._stopped
+            if not stopped:
+                self._handlers[handler] = deadline
+                self._changes.append((handler, True))
+
+        if stopped:
+            self.close(handler, False)
+        else:
+            self._wake()
+
+    def close_oldest(self):
+
+        """
+            Closes the connection idle for the longest. Returns False if none is idle.
+        """
+
+        with self._lock:
+            if self._stopped or not self._handlers:
+                return False
+            handler = next(iter(self._handlers))
+            del self._handlers[handler]
+            self._changes.append((handler, False))
+
+        self._wake()
+
+        return True
+
+    def stop(self):
+
+        """Stops watching, and closes the connections still waiting."""
+
+        with self._lock:
+            self._stopped = True
+
+        self._wake()
+        self._thread.join()
+
+        with self._lock:
+            evicted = [handler for handler, parked in self._changes if not parked]
+            handlers, self._handlers, self._changes = list(self._handlers), {}, []
+
+        for handler in handlers:
+            self.close(handler, False)
+
+        for handler in evicted:
+            self.close(handler, True)
+
+        self._selector.close()
+        self._wakeup.close()
+        self._waker.close()
+
+    def _wake(self):
+        try:
+            self._waker.send(b'\0')
+        # Already woken up.
+        except BlockingIOError:
+            pass
+
+    def _watch(self):
+
+        while True:
+
+            with self._lock:
+                if self._stopped:
+                    return
+                changes, self._changes = self._changes, []
+                expired = self._expired()
+                deadline = next(iter(self._handlers.values()), None)
+
+            for handler, parked in changes:
+                if parked:
+                    self._selector.register(handler.request, selectors.EVENT_READ, handler)
+                else:
+                    self._selector.unregister(handler.request)
+                    self.close(handler, True)
+
+            # Idle for too long.
+            for handler in expired:
+                self._selector.unregister(handler.request)
+                self.close(handler, False)
+
+            timeout = None if deadline is None else max(0, deadline - time.monotonic())
+
+            for key, _ in self._selector.select(timeout):
+
+                if key.data is None:
+                    try:
+                        while self._wakeup.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+
+                with self._lock:
+                    # Evicted meanwhile, it's closed with the next changes.
+                    if key.data not in self._handlers:
+                        continue
+                    del self._handlers[key.data]
+
+                self._selector.unregister(key.fileobj)
+                self.resume(key.data)
+
+    def _expired(self):
+
+        # Takes out the connections past their deadline (with the lock held).
+        now = time.monotonic()
+        expired = []
+
+        for handler, deadline in self._handlers.items():
+            if deadline is None or deadline > now:
+                break
+            expired.append(handler)
+
+        for handler in expired:
+            del self._handlers[handler]
+
+        return expired
+
+
+class PooledHTTPServer(HTTPServer):
+
+    """
+        HTTPServer that hands each connection to a bounded pool of worker threads.
+        When every worker is busy the accept loop waits for a free one, so new connections queue up in the
+        listen backlog (of size `backlog`) instead of piling up in memory. Keep-alive connections waiting for their
+        next request give their worker back in the meantime (see IdleConnections).
+        If `sock` is given, it's used as the (already listening) server socket instead of binding a new one, which can
+        be a unix socket. With `proxy_protocol`, connections start with a PROXY protocol header (see CustomHandler).
+        Open connections are counted apart from the workers. At `max_connections`, the connection idle for the
+        longest is closed to make room for a new one, which only gets a 503 when none is idle.
+    """
+
+    # Connections waiting for their next request are handed back by the handler (see CustomHandler.serve).
+    park_idle_connections = True
+
+    def __init__(self, server_address, handler_class, workers, backlog, sock=None,
+                 keep_alive_timeout=None, max_requests_per_connection=None, header_timeout=None, body_timeout=None,
+                 max_header_size=None, max_connections=None, proxy_protocol=False):
+
+        # Size of the kernel accept queue, used by server_activate().
+        self.request_queue_size = backlog
+
+        self.workers = workers
+
+        # Connection settings, read by CustomHandler.
+        self.keep_alive_timeout = keep_alive_timeout
+        self.max_requests_per_connection = max_requests_per_connection
+        self.header_timeout = header_timeout
+        self.body_timeout = body_timeout
+        self.max_header_size = max_header_size
+        self.max_connections = max_connections
+        self.proxy_protocol = proxy_protocol
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='py_express')
+
+        # Connections given to the workers (running or waiting for one), and open connections (idle ones included).
+        self._busy = 0
+        self._open = 0
+        self._state = threading.Condition()
+
+        self._idle = IdleConnections(self._resume, self._close_idle, keep_alive_timeout)
+
+        # Connections turned away are answered off the accept loop, so it never waits on a client.
+        self._rejecting = 0
+        self._rejections = ThreadPoolExecutor(max_workers=2, thread_name_prefix='py_express_shed') \
+            if max_connections is not None else None
+
+        super().__init__(server_address, handler_class, bind_and_activate=sock is None)
+
+        if sock is not None:
+            self.socket.close()
+            self.socket = sock
+            self.server_address = sock.getsockname()
+
+            # Unix sockets have a path for address.
+            if isinstance(self.server_address, tuple):
+                self.server_name, self.server_port = self.server_address[:2]
+            else:
+                self.server_name, self.server_port = 'localhost', None
+
+    def process_request(self, request, client_address):
+
+        with self._state:
+
+            # At the limit, the connection idle for the longest makes room. Without one, a fast 503 beats waiting in
+            # the backlog.
+            if self.max_connections is not None and self._open >= self.max_connections:
+                if not self._idle.close_oldest():
+                    self._turn_away(request)
+                    return
+                self._open -= 1
+
+            self._open += 1
+
+            # Wait for a free worker before taking the connection.
+            while self._busy >= self.workers:
+                self._state.wait()
+
+            self._busy += 1
+
+        try:
+            self._pool.submit(self._process_request, request, client_address)
+        except Exception:
+            self._done(request, None)
+            raise
+
+    def finish_request(self, request, client_address):
+        # The handler is kept, to pick the connection up again once it idled.
+        return self.RequestHandlerClass(request, client_address, self)
+
+    def _process_request(self, request, client_address):
+
+        handler = None
+
+        try:
+            handler = self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+
+        self._done(request, handler)
+
+    def _resume(self, handler):
+
+        # The next request of an idle connection is arriving. Accepted connections go first, they don't wait.
+        with self._state:
+            self._busy += 1
+
+        self._pool.submit(self._resume_request, handler)
+
+    def _resume_request(self, handler):
+
+        try:
+            handler.resume()
+        except Exception:
+            handler.parked = False
+            self.handle_error(handler.request, handler.client_address)
+
+        self._done(handler.request, handler)
+
+    def _done(self, request, handler):
+
+        with self._state:
+            self._busy -= 1
+            self._state.notify()
 
+        if handler is not None and handler.parked:
+            self._idle.park(handler)
+            return
+
+        self.shutdown_request(request)
+
+        with self._state:
+            self._open -= 1
+
+    def _close_idle(self, handler, evicted):
+
+        handler.parked = False
+        handler.finish()
+        self.shutdown_request(handler.request)
+
+        # Evicted ones were already taken off the count, to make room.
+        if not evicted:
+            with self._state:
+                self._open -= 1
+
+    def _turn_away(self, request):
+
+        # Called with the state lock held. Clients that connect and stay silent can't pile up connections waiting for
+        # their 503.
+        if self._rejecting >= MAX_REJECTIONS:
+            self.shutdown_request(request)
+            return
+
+        self._rejecting += 1
+        self._rejections.submit(self._reject, request)
+
+    def _reject(self, request):
+        try:
+            # Read the request head first, closing with it unread would reset the connection before the 503 is read.
+            deadline = time.monotonic() + REJECTION_TIMEOUT
+            head = b''
+            # A PROXY protocol header (version 2) starts with a blank line of its own.
+            start = len(V2_SIGNATURE) if self.proxy_protocol else 0
+            while b'\r\n\r\n' not in head[start:] and len(head) < 64 * 1024:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                request.settimeout(timeout)
+                try:
+                    chunk = request.recv(4096)
+                except TimeoutError:
+                    break
+                if not chunk:
+                    break
+                head += chunk
+
+            request.settimeout(REJECTION_TIMEOUT)
+            request.sendall(error_response(503, [('Retry-After', 1)]))
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+            with self._state:
+                self._rejecting -= 1
+
+    def server_close(self):
+        super().server_close()
+        # No connection is resumed past this point, the ones parked after are closed.
+        self._idle.stop()
+        self._pool.shutdown(wait=True)
+        if self._rejections is not None:
+            self._rejections.shutdown(wait=True)
 
 
 class CustomHandler(BaseHTTPRequestHandler):
 
     """Custom HTTP handler for the MinimalFramework."""
 
+    # Persistent connections.
+    protocol_version = 'HTTP/1.1'
+
     def __init__(self, framework, *args, **kwargs):
         """
         Initialize the handler with a reference to the framework.
         """
         self.framework = framework
+        self.requests_handled = 0
+        # Waiting for its next request off the worker threads (see PooledHTTPServer), the connection stays open.
+        self.parked = False
         super().__init__(*args, **kwargs)
 
-    # Override the GET handler.
-    def do_GET(self):
+    def setup(self):
 
-        """Handle GET requests."""
+        # Idle timeout between requests on a persistent connection.
+        self.timeout = self._server_option('keep_alive_timeout')
 
-        # Handle the request
-        self._handle_request('GET')
+        super().setup()
 
-    # Override the POST handler.
-    def do_POST(self):
-
-        """Handle POST requests."""
+        # Read through a SocketReader, for the head and body timeouts.
+        self.rfile.close()
+        self.reader = SocketReader(self.connection)
+        self.rfile = io.BufferedReader(self.reader)
 
-        # Handle the request
-        self._handle_request('POST')
+    def handle(self):
 
-    # Override the PUT handler.
-    def do_PUT(self):
-        """Handle PUT requests."""
+        # Behind a proxy speaking the PROXY protocol, the connection starts with the address of the actual client.
+        if self._server_option('proxy_protocol'):
 
-        # Handle the request
-        self._handle_request('PUT')
+            self.reader.wait_for_request(self.timeout, self._server_option('header_timeout'))
 
-    # Override the PATCH handler.
-    def do_PATCH(self):
-        """Handle PATCH requests."""
+            try:
+                address = read_proxy_header(self.rfile)
+            # Without a valid header there's no telling where the request starts.
+            except (HTTPError, OSError):
+                return
 
-        # Handle the request
-        self._handle_request('PATCH')
+            if address is not None:
+                self.client_address = address
 
-    # Override the DEL handler.
-    def do_DEL(self):
-        """Handle DEL requests."""
+        self.close_connection = True
+        self.serve()
 
-        # Handle the request
-        self._handle_request('DEL')
+    def serve(self):
 
-    # Function that handles requests.
-    def _handle_request(self, method):
+        """
+            Handles the requests of the connection until it's closed, or until it has to wait for the next one and
+            the server can watch it meanwhile (then `parked` is set, and the server calls resume() once it arrives).
+        """
 
-        body = None
+        self.parked = False
+        self.handle_one_request()
 
-        # Parse body (if method is not GET)
-        if method != 'GET':
-            body = self._parse_body()
+        while not self.close_connection:
 
-        # Create the request instance.
-        request = Request(
-            path=self.path,
-            method=method,
-            headers=self.headers,
-            body=body,
-        )
+            if self._server_option('park_idle_connections') and self._is_idle():
+                self.parked = True
+                return
 
-        # Create response instance
-        response = Response(
-            server=self,
-            path=self.path,
-            method=method,
-            headers=self.headers,
-        )
+            self.handle_one_request()
 
+    def resume(self):
         try:
+            self.serve()
+        finally:
+            self.finish()
 
+    def finish(self):
+        if not self.parked:
+            super().finish()
 
+    def _is_idle(self):
+        # Nothing of the next request arrived yet (ie: pipelined after the last one).
+        self.reader.dont_wait()
+        return not self.rfile.peek(1)
 
-            # Need to use regex to find a match in the routes.
-            route = self._find_route_match(
-                path=request.path_without_query, method=request.method)
-
-            # If found the route
-            if route:
+    def handle_one_request(self):
 
-                # Parse the params, now that the route is found.
-                request.parse_params(route)
+        self.reader.wait_for_request(self.timeout, self._server_option('header_timeout'))
 
-                handlers = self.framework.global_middlewares + \
-                    self.framework.routes[route][method]
-
-                # Function to process the middleware chain
-                def next_handler(index=0):
-                    if index < len(handlers):
-                        current_handler = handlers[index]
+        try:
+            super().handle_one_request()
 
-                        # Call the handler and provide `next_handler` to control flow
+        # The request head was too slow or too large, it's answered without going through the handlers.
+        except HTTPError as error:
+            self.close_connection = True
+            try:
+                self.wfile.write(error_response(error.status_code))
+            except OSError:
+                pass
 
-                        # If on the last, aka the handler, don't pass the next argument.
-                        if index == len(handlers) - 1:
-                            current_handler(request, response)
-                        else:
-                            current_handler(request, response,
-                                            lambda: next_handler(index + 1))
+    def parse_request(self):
 
-                # Start the middleware chain
-                next_handler()
+        max_header_size = self._server_option('max_header_size')
 
-                return
+        if max_header_size is None:
+            return super().parse_request()
 
-            if not route:
-                response.status(404).send({"error": "Not Found"})
+        # The request line counts towards the limit too.
+        rfile = self.rfile
+        self.rfile = HeadReader(rfile, max_header_size - len(self.raw_requestline))
 
-        except Exception as e:
+        try:
+            return super().parse_request()
+        finally:
+            self.rfile = rfile
 
-            if self.framework.debug_mode:
-                print(f"Error: {e}")
+    # Override the GET handler.
+    def do_GET(self):
 
-            if response:
+        """Handle GET requests."""
 
-                # If there is an error middleware, send the error there.
-                if self.framework.error_midleware:
+        # Handle the request
+        self._handle_request('GET')
 
-                    self.framework.error_midleware(request, response, None, e)
+    # Override the HEAD handler.
+    def do_HEAD(self):
 
-                    return
+        """Handle HEAD requests (served by the GET routes, without the body)."""
 
-                response.status(500).json({"error": "Something went wrong"})
+        # Handle the request
+        self._handle_request('HEAD')
 
-    def _find_route_match(self, path, method):
-        for route in self.framework.routes.keys():
-            # Check match and if method is in the routes dict.
-            if self._check_route_match(route, path) and method in self.framework.routes[route]:
-                return route
-        return None
+    # Override the POST handler.
+    def do_POST(self):
 
-    def _check_route_match(self, route, path):
+        """Handle POST requests."""
 
-        # Split both the route and the path by /
-        route_split = route.split('/')
-        path_split = path.split('/')
+        # Handle the request
+        self._handle_request('POST')
 
-        if len(route_split) != len(path_split):
-            return False
+    # Override the PUT handler.
+    def do_PUT(self):
+        """Handle PUT requests."""
 
-        for i in range(len(route_split)):
+        # Handle the request
+        self._handle_request('PUT')
 
-            if route_split[i].startswith(':') and path_split[i] != '':
-                continue
+    # Override the PATCH handler.
+    def do_PATCH(self):
+        """Handle PATCH requests."""
 
-            if route_split[i] != path_split[i]:
-                return False
+        # Handle the request
+        self._handle_request('PATCH')
 
-        return True
+    # Override the DEL handler.
+    def do_DEL(self):
+        """Handle DEL requests."""
 
-    # Parse body
-    def _parse_body(self):
+        # Handle the request
+        self._handle_request('DEL')
 
-        # Read the content length to determine how many bytes to read from the input stream
-        content_length = int(self.headers.get('Content-Length', 0))
-        raw_body = self.rfile.read(
-            content_length) if content_length > 0 else None
+    # Function that handles requests.
+    def _handle_request(self, method):
 
-        if not raw_body:
-            return None
+        # Stop reusing the connection once it served its share of requests.
+        self.requests_handled += 1
+        if self._server_option('max_requests_per_connection') and \
+                self.requests_handled >= self._server_option('max_requests_per_connection'):
+            self.close_connection = True
 
-        # Retrieve the Content-Type header
-        content_type = self.headers.get(
-            'Content-Type', '').split(';')[0]  # Split to ignore charset
+        # Chunked request bodies aren't supported (and there's no telling where the next request starts), so the
+        # request is refused rather than handled without its body.
+        if 'Transfer-Encoding' in self.headers:
+            self.close_connection = True
+            self.wfile.write(error_response(501))
+            return
 
-        # Handle different content types
-        try:
+        content_length = parse_content_length(self.headers)
 
-            if content_type == "application/json":
-                # Parse JSON body
-                return json.loads(raw_body.decode('utf-8'))
+        if content_length is None:
+            self.close_connection = True
+            self.wfile.write(error_response(400))
+            return
 
-            elif content_type == "application/x-www-form-urlencoded":
+        # Reader over this request's body, which is only read when the handlers ask for it.
+        self.reader.wait_for_body(self._server_option('body_timeout'))
+        self.body_reader = BodyReader(self.rfile, content_length)
 
-                # Parse form-encoded body
-                return parse_qs(raw_body.decode('utf-8'))
+        response = None
 
-            elif content_type == "text/plain":
-                # Decode plain text
-                return raw_body.decode('utf-8')
+        try:
+            response = self._dispatch(method)
+        finally:
+            self._finish_request(response)
 
-            elif content_type.startswith("multipart/"):
-                return self._parse_multipart()
-            else:
-                # Return raw body for unsupported types
-                return raw_body.decode('utf-8')
+        if response is not None and response.trace is not None and response.is_sent:
+            self.framework.tracing.response_sent(response)
 
-        except Exception as e:
+        # Responses don't go through send_response, so they're only logged in debug mode.
+        if self.framework.debug_mode and response is not None:
+            self.log_request(response.status_code)
 
-            # Log parsing errors and re-raise if necessary
-            if self.framework.debug_mode:
-                print(f"Error parsing body: {e}")
-            raise ValueError("Unable to parse body")
+    def _dispatch(self, method):
+        return dispatch(self.framework, self, method)
 
-    # Parse multipart
-    def _parse_multipart(self):
-        """Parse a multipart/form-data body."""
+    def _finish_request(self, response):
 
-        content_type = self.headers.get('Content-Type')
-        if not content_type or 'multipart/form-data' not in content_type:
-            return None  # Return None if not multipart
+        # Nothing was sent, closing is the only way to let the client know.
+        if response is None or not response.is_sent:
+            self.close_connection = True
+            return
 
-        # Extract the boundary from the Content-Type header
-        boundary = re.search(
-            r'boundary=(.*)', content_type).group(1).encode('utf-8')
-        if not boundary:
-            raise ValueError("Boundary not found in Content-Type header")
+        # Skip whatever is left of the body, so the next request on the connection starts at the right place.
+        if not self.close_connection and not self.body_reader.drain(MAX_DRAIN_SIZE):
+            self.close_connection = True
 
-        # Read the raw body
-        raw_body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+    def sendfile(self, file, offset, count):
 
-        if not raw_body:
-            return None
+        """
+            Copies `count` bytes of `file`, from `offset`, to the connection (with os.sendfile where available).
+        """
 
-        # Split the body into parts based on the boundary!
-        parts = raw_body.split(b'--' + boundary)
-
-        # Init the parsed data (dict)
-        parsed_data = {}
-
-        # For each part
-        for part in parts:
-
-            # If empty part or beginning of body or end of body => continue
-            if not part or part == b'--' or part == b'--\r\n':
-                continue
-
-            # Get the headers and the content.
-            headers, content = part.split(b'\r\n\r\n', 1)
-
-            # Decode the headers and split.
-            headers = headers.decode('utf-8').split('\r\n')
-
-            # Parse Content-Disposition header to get field name and filename
-            disposition = [h for h in headers if h.lower().startswith('content-disposition')][0]
-
-            # Try to find a match for the specified disposition
-            match = re.search(r'form-data; name="(.*?)"(; filename="(.*?)")?', disposition)
-            
-            if not match:
-                continue
-            
-            field_name = match.group(1)
-            
-            filename = match.group(3)
-            
-            # Handle files
-            if filename:
-
-                # Save file content to a temporary file (will be deleted after the request is over)
-                temp_file = tempfile.NamedTemporaryFile(delete=True)
-                temp_file.write(content.strip())
-                temp_file.seek(0)  # Reset the file pointer to read later if needed
-
-                parsed_data[field_name] = {
-                    "filename": filename,
-                    "filepath": temp_file.name,
-                    "content": None, # Could add an option to read this directly and store in memory instead of storing the file temporarily.
-                }
-
-            # Just a text field.
-            else:
+        self.wfile.flush()
+        self.connection.sendfile(file, offset, count)
 
-                # Treat as a regular field
-                parsed_data[field_name] = content.decode('utf-8').strip()
+    def address_string(self):
+        # Connections over a unix socket have no address.
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return 'unix'
 
-        return parsed_data
\ No newline at end of file
+    def _server_option(self, name, default=None):
+        """Reads a connection setting from the server (plain HTTPServers don't have them)."""
+        return getattr(self.server, name, default)
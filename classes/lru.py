@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+
+
+class LRUCache:
+
+    """
+        Thread-safe LRU cache bounded by the total size of its values (as measured by `sizeof`), not their count.
+    """
+
+    def __init__(self, max_size, sizeof=len):
+        self.max_size = max_size
+        self.sizeof = sizeof
+        self.size = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is None:
+                return default
+
+            self._entries.move_to_end(key)
+
+            return entry[1]
+
+    def put(self, key, value):
+
+        size = self.sizeof(value)
+
+        # Wouldn't fit even in an empty cache.
+        if size > self.max_size:
+            return
+
+        with self._lock:
+
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (size, value)
+            self.size += size
+
+            # Evict the least recently used values.
+            while self.size > self.max_size:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def pop(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+    def _remove(self, key):
+        size, _ = self._entries.pop(key)
+        self.size -= size
@@ -0,0 +1,391 @@
+import bisect
+import functools
+import glob
+import inspect
+import json
+import os
+import threading
+import time
+
+from classes.pipeline import TimedNext
+
+
+# Upper bounds (seconds) of the latency histogram buckets (plus one for anything slower).
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Route label of the requests that didn't match any route.
+UNMATCHED_ROUTE = '<unmatched>'
+
+# Layout of the per route counters: count, 1xx..5xx, latency sum, bytes in, bytes out, then the histogram buckets.
+COUNT, STATUS_1XX, LATENCY_SUM, BYTES_IN, BYTES_OUT, BUCKETS = 0, 1, 6, 7, 8, 9
+
+STATUS_CLASSES = ('1xx', '2xx', '3xx', '4xx', '5xx')
+
+
+class Shard:
+
+    """
+        The counters of one thread. Only that thread writes to them, so recording a request takes no lock.
+    """
+
+    __slots__ = ('routes', 'middlewares', 'in_flight')
+
+    def __init__(self):
+        # Map from (route, method) to the list of counters (see COUNT...BUCKETS).
+        self.routes = {}
+        # Map from (route, method, middleware name) to [calls, seconds].
+        self.middlewares = {}
+        self.in_flight = 0
+
+
+class Metrics:
+
+    """
+        Request metrics per route pattern and method: count, status classes, latency histogram, bytes in and out,
+        plus the requests in flight and (optionally) the time spent in each middleware.
+        Every thread records into its own shard; the shards are only added up when the metrics are read.
+        With several worker processes, each worker publishes its counters to a file in a shared directory (see
+        `share`), and reading the metrics from any worker adds up all of them.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, middleware_timing=False, publish_interval=1.0):
+        self.buckets = tuple(sorted(buckets))
+        self.middleware_timing = middleware_timing
+        self.publish_interval = publish_interval
+        self.directory = None
+        self._row_size = BUCKETS + len(self.buckets) + 1
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        self._local = threading.local()
+
+    # Recording
+    def begin(self):
+
+        """
+            Counts a request in flight. Returns the shard to pass to end().
+        """
+
+        shard = self._shard()
+
+        shard.in_flight += 1
+
+        return shard
+
+    def end(self, shard, route, method, status_code, elapsed, bytes_in, bytes_out):
+
+        """
+            Records a finished request (`elapsed` in seconds).
+        """
+
+        shard.in_flight -= 1
+
+        key = (route or UNMATCHED_ROUTE, method)
+
+        row = shard.routes.get(key)
+
+        if row is None:
+            row = shard.routes[key] = [0] * self._row_size
+
+        row[COUNT] += 1
+        row[STATUS_1XX + min(max(status_code // 100, 1), 5) - 1] += 1
+        row[LATENCY_SUM] += elapsed
+        row[BYTES_IN] += bytes_in
+        row[BYTES_OUT] += bytes_out
+        row[BUCKETS + bisect.bisect_left(self.buckets, elapsed)] += 1
+
+    def timed_middleware(self, route, method, middleware):
+
+        """
+            Wraps a middleware so the time spent in it is recorded (see `middleware_timing`), without the rest of the
+            chain it runs with next().
+        """
+
+        key = (route, method, getattr(middleware, '__name__', type(middleware).__name__))
+
+        def record(elapsed):
+
+            middlewares = self._shard().middlewares
+
+            row = middlewares.get(key)
+            if row is None:
+                row = middlewares[key] = [0, 0.0]
+
+            row[0] += 1
+            row[1] += elapsed
+
+        if inspect.iscoroutinefunction(middleware):
+
+            @functools.wraps(middleware)
+            async def timed(req, res, next):
+                started = time.perf_counter()
+                next = TimedNext(next)
+                try:
+                    return await middleware(req, res, next)
+                finally:
+                    record(time.perf_counter() - started - next.elapsed)
+
+        else:
+
+            @functools.wraps(middleware)
+            def timed(req, res, next):
+                started = time.perf_counter()
+                next = TimedNext(next)
+                try:
+                    return middleware(req, res, next)
+                finally:
+                    record(time.perf_counter() - started - next.elapsed)
+
+        return timed
+
+    def _shard(self):
+
+        # The shard of this thread, created on its first request.
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = Shard()
+            with self._shards_lock:
+                self._shards.append(shard)
+            return shard
+
+    # Reading
+    def snapshot(self):
+
+        """
+            The counters of this process, added up across threads, in a JSON-friendly form.
+        """
+
+        routes = {}
+        middlewares = {}
+        in_flight = 0
+
+        with self._shards_lock:
+            shards = list(self._shards)
+
+        for shard in shards:
+
+            in_flight += shard.in_flight
+
+            # Copies, since the owner threads keep adding routes while we read.
+            for key, row in dict(shard.routes).items():
+                _add(routes, key, row)
+
+            for key, row in dict(shard.middlewares).items():
+                _add(middlewares, key, row)
+
+        return {
+            "pid": os.getpid(),
+            "buckets": list(self.buckets),
+            "in_flight": in_flight,
+            "routes": [[route, method, row] for (route, method), row in routes.items()],
+            "middlewares": [[route, method, name, row] for (route, method, name), row in middlewares.items()],
+        }
+
+    def collect(self):
+
+        """
+            The metrics of every worker (only this process unless `share` was called), added up.
+        """
+
+        snapshots = [self.snapshot()]
+
+        if self.directory is not None:
+            snapshots.extend(self._read_published(exclude=os.getpid()))
+
+        routes = {}
+        middlewares = {}
+        in_flight = 0
+
+        for snapshot in snapshots:
+
+            in_flight += snapshot["in_flight"]
+
+            for route, method, row in snapshot["routes"]:
+                _add(routes, (route, method), row)
+
+            for route, method, name, row in snapshot["middlewares"]:
+                _add(middlewares, (route, method, name), row)
+
+        return {
+            "workers": len(snapshots),
+            "in_flight": in_flight,
+            "routes": [self._route_metrics(route, method, row) for (route, method), row in sorted(routes.items())],
+            "middlewares": [
+                {"route": route, "method": method, "middleware": name, "calls": row[0], "seconds": row[1]}
+                for (route, method, name), row in sorted(middlewares.items())
+            ],
+        }
+
+    def _route_metrics(self, route, method, row):
+
+        cumulative = 0
+        buckets = {}
+
+        for bound, count in zip(self.buckets + (float('inf'),), row[BUCKETS:]):
+            cumulative += count
+            buckets[bound] = cumulative
+
+        return {
+            "route": route,
+            "method": method,
+            "count": row[COUNT],
+            "status": dict(zip(STATUS_CLASSES, row[STATUS_1XX:STATUS_1XX + 5])),
+            "latency": {"sum": row[LATENCY_SUM], "buckets": buckets},
+            "bytes_in": row[BYTES_IN],
+            "bytes_out": row[BYTES_OUT],
+        }
+
+    # Prometheus
+    def prometheus(self):
+
+        """
+            The metrics in the Prometheus text exposition format.
+        """
+
+        metrics = self.collect()
+
+        lines = [
+            '# HELP py_express_requests_in_flight Requests being handled.',
+            '# TYPE py_express_requests_in_flight gauge',
+            f'py_express_requests_in_flight {metrics["in_flight"]}',
+            '# HELP py_express_requests_total Requests handled, by status class.',
+            '# TYPE py_express_requests_total counter',
+        ]
+
+        for route in metrics["routes"]:
+            labels = _labels(route=route["route"], method=route["method"])
+            for status, count in route["status"].items():
+                if count:
+                    lines.append(f'py_express_requests_total{{{labels},status="{status}"}} {count}')
+
+        lines += [
+            '# HELP py_express_request_duration_seconds Time to handle a request.',
+            '# TYPE py_express_request_duration_seconds histogram',
+        ]
+
+        for route in metrics["routes"]:
+            labels = _labels(route=route["route"], method=route["method"])
+            for bound, count in route["latency"]["buckets"].items():
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'py_express_request_duration_seconds_bucket{{{labels},le="{le}"}} {count}')
+            lines.append(f'py_express_request_duration_seconds_sum{{{labels}}} {route["latency"]["sum"]}')
+            lines.append(f'py_express_request_duration_seconds_count{{{labels}}} {route["count"]}')
+
+        for name, key, help_text in (
+            ('py_express_request_bytes_total', 'bytes_in', 'Request body bytes received.'),
+            ('py_express_response_bytes_total', 'bytes_out', 'Response bytes sent.'),
+        ):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            for route in metrics["routes"]:
+                lines.append(f'{name}{{{_labels(route=route["route"], method=route["method"])}}} {route[key]}')
+
+        if metrics["middlewares"]:
+
+            lines += [
+                '# HELP py_express_middleware_seconds_total Time spent in each middleware.',
+                '# TYPE py_express_middleware_seconds_total counter',
+            ]
+
+            for middleware in metrics["middlewares"]:
+                labels = _labels(route=middleware["route"], method=middleware["method"], middleware=middleware["middleware"])
+                lines.append(f'py_express_middleware_seconds_total{{{labels}}} {middleware["seconds"]}')
+
+            lines += [
+                '# HELP py_express_middleware_calls_total Calls of each middleware.',
+                '# TYPE py_express_middleware_calls_total counter',
+            ]
+
+            for middleware in metrics["middlewares"]:
+                labels = _labels(route=middleware["route"], method=middleware["method"], middleware=middleware["middleware"])
+                lines.append(f'py_express_middleware_calls_total{{{labels}}} {middleware["calls"]}')
+
+        return '\n'.join(lines) + '\n'
+
+    # Multiple workers
+    def share(self, directory):
+
+        """
+            Makes the workers forked after this call publish their counters to `directory`, so any of them can
+            report the metrics of all of them.
+        """
+
+        self.directory = directory
+
+    def start_publishing(self):
+
+        """
+            Starts writing this worker's counters to the shared directory every `publish_interval` seconds.
+        """
+
+        if self.directory is None:
+            return
+
+        def publish():
+            while True:
+                self.publish()
+                time.sleep(self.publish_interval)
+
+        threading.Thread(target=publish, daemon=True, name='py_express_metrics').start()
+
+    def publish(self):
+
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+
+        # Write then rename, so readers never see half a file.
+        with open(path + '.tmp', 'w') as file:
+            json.dump(self.snapshot(), file)
+
+        os.replace(path + '.tmp', path)
+
+    def _read_published(self, exclude):
+
+        snapshots = []
+
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+
+            try:
+                with open(path) as file:
+                    snapshot = json.load(file)
+            except (OSError, ValueError):
+                continue
+
+            if snapshot["pid"] == exclude:
+                continue
+
+            # Workers that exited (and were replaced) keep their counters, but nothing is in flight there anymore.
+            if not _is_alive(snapshot["pid"]):
+                snapshot["in_flight"] = 0
+
+            snapshots.append(snapshot)
+
+        return snapshots
+
+
+def _add(totals, key, row):
+
+    total = totals.get(key)
+
+    if total is None:
+        totals[key] = list(row)
+        return
+
+    for index, value in enumerate(row):
+        total[index] += value
+
+
+def _labels(**labels):
+    return ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
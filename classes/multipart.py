@@ -0,0 +1,226 @@
+import re
+import tempfile
+
+from classes.errors import BadRequest, PayloadTooLarge
+
+
+# Size of the reads from the input stream.
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# Largest header block accepted for a single part.
+MAX_PART_HEADERS_SIZE = 16 * 1024
+
+
+class MultipartParser:
+
+    """
+        Incremental multipart/form-data parser.
+        Reads the body from `rfile` in chunks of `chunk_size` bytes and scans for the boundary across chunk edges, so
+        peak memory stays around a few chunks whatever the size of the upload. Files are written to spooled temporary
+        files (kept in memory up to `spool_size` bytes, on disk after that), text fields are kept in memory.
+        Limits (None for no limit):
+            - max_field_size: Bytes per text field.
+            - max_file_size: Bytes per file.
+            - max_total_size: Bytes for the whole body.
+    """
+
+    def __init__(
+        self,
+        rfile,
+        content_length,
+        boundary,
+        chunk_size=DEFAULT_CHUNK_SIZE,
+        spool_size=1024 * 1024,
+        max_field_size=1024 * 1024,
+        max_file_size=None,
+        max_total_size=None,
+    ):
+
+        if max_total_size is not None and content_length > max_total_size:
+            raise PayloadTooLarge(f'Body exceeds {max_total_size} bytes')
+
+        self.rfile = rfile
+        self.remaining = content_length
+        self.chunk_size = chunk_size
+        self.spool_size = spool_size
+        self.max_field_size = max_field_size
+        self.max_file_size = max_file_size
+
+        # The first delimiter may open the body, every other one follows a line break.
+        self.delimiter = b'--' + boundary
+        self.separator = b'\r\n' + self.delimiter
+
+        self.buffer = bytearray()
+
+    # Parse
+    def parse(self):
+
+        """
+            Parses the whole body, returns a dict from field name to the text value, or to a dict describing the file.
+        """
+
+        parsed_data = {}
+
+        self._skip_preamble()
+
+        # After each delimiter comes either "--" (end of the body) or a line break and the next part.
+        while self._read_marker() != b'--':
+
+            headers = self._read_part_headers()
+
+            field_name, filename = self._parse_disposition(headers.get('content-disposition', ''))
+
+            # Handle files
+            if filename is not None:
+
+                temp_file = tempfile.SpooledTemporaryFile(max_size=self.spool_size)
+
+                try:
+                    size = self._read_part_body(temp_file.write, self.max_file_size, field_name)
+                except BaseException:
+                    temp_file.close()
+                    raise
+
+                temp_file.seek(0)  # Reset the file pointer so the handler reads from the start.
+
+                value = {
+                    "filename": filename,
+                    "content_type": headers.get('content-type'),
+                    "size": size,
+                    "file": temp_file,
+                }
+
+            # Just a text field.
+            else:
+                content = bytearray()
+                self._read_part_body(content.extend, self.max_field_size, field_name)
+                value = content.decode('utf-8')
+
+            # Parts without a name are read (to get past them) but not kept.
+            if field_name is not None:
+                parsed_data[field_name] = value
+
+        # Discard the epilogue.
+        while self.remaining > 0:
+            self.buffer.clear()
+            self._fill()
+
+        return parsed_data
+
+    def _fill(self):
+
+        # Read the next chunk (never past the end of the body).
+        if self.remaining <= 0:
+            raise BadRequest('Unexpected end of multipart body')
+
+        chunk = self.rfile.read(min(self.chunk_size, self.remaining))
+
+        if not chunk:
+            raise BadRequest('Unexpected end of multipart body')
+
+        self.remaining -= len(chunk)
+        self.buffer += chunk
+
+    def _skip_preamble(self):
+
+        while True:
+            index = self.buffer.find(self.delimiter)
+
+            if index != -1:
+                del self.buffer[:index + len(self.delimiter)]
+                return
+
+            # Keep enough of the tail to find a delimiter split between two chunks.
+            del self.buffer[:max(0, len(self.buffer) - len(self.delimiter) + 1)]
+            self._fill()
+
+    def _read_marker(self):
+
+        while len(self.buffer) < 2:
+            self._fill()
+
+        marker = bytes(self.buffer[:2])
+
+        if marker not in (b'--', b'\r\n'):
+            raise BadRequest('Malformed multipart body')
+
+        del self.buffer[:2]
+
+        return marker
+
+    def _read_part_headers(self):
+
+        while True:
+            index = self.buffer.find(b'\r\n\r\n')
+
+            if index != -1:
+                break
+
+            if len(self.buffer) > MAX_PART_HEADERS_SIZE:
+                raise BadRequest('Multipart headers too large')
+
+            self._fill()
+
+        raw_headers = bytes(self.buffer[:index]).decode('utf-8')
+        del self.buffer[:index + 4]
+
+        headers = {}
+        for line in raw_headers.split('\r\n'):
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        return headers
+
+    def _parse_disposition(self, disposition):
+
+        # Try to find the name and filename of the part.
+        name = re.search(r'(?:^|;)\s*name="(.*?)"', disposition)
+        filename = re.search(r'(?:^|;)\s*filename="(.*?)"', disposition)
+
+        return (
+            name.group(1) if name else None,
+            filename.group(1) if filename else None,
+        )
+
+    def _read_part_body(self, write, max_size, field_name):
+
+        """
+            Passes the content of the current part to `write`, up to the next delimiter. Returns its size.
+        """
+
+        size = 0
+
+        while True:
+            index = self.buffer.find(self.separator)
+
+            # Everything but the tail is content (the tail could be the start of a delimiter split between chunks).
+            end = index if index != -1 else max(0, len(self.buffer) - len(self.separator) + 1)
+
+            size += end
+
+            if max_size is not None and size > max_size:
+                raise PayloadTooLarge(f'Field "{field_name}" exceeds {max_size} bytes')
+
+            if end:
+                write(bytes(self.buffer[:end]))
+                del self.buffer[:end]
+
+            if index != -1:
+                del self.buffer[:len(self.separator)]
+                return size
+
+            self._fill()
+
+
+def parse_boundary(content_type):
+
+    """
+        Extracts the boundary from a multipart Content-Type header.
+    """
+
+    match = re.search(r'boundary=(?:"([^"]+)"|([^;\s]+))', content_type)
+
+    if not match:
+        raise BadRequest('Boundary not found in Content-Type header')
+
+    return (match.group(1) or match.group(2)).encode('utf-8')
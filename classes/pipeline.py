@@ -0,0 +1,276 @@
+import asyncio
+import inspect
+import time
+
+from classes.errors import PayloadTooLarge
+
+
+class Next:
+
+    """
+        The `next` passed to middlewares. Calling it runs the rest of the chain (the next middlewares, then the
+        controller) and returns once it's done, so code placed after `next()` runs after them and sees the errors they
+        raise. On the asyncio engine it's awaited instead: `await next()`. Plain middlewares there can't wait for the
+        rest of the chain, which runs once they return.
+        One is created per request, and handed to every middleware of the chain: it keeps the position of the one
+        being run. `end` (ie: the controller) is called with the request and response once every middleware let the
+        request through, and what it returns (whether the controller was reached) is kept in `reached`.
+    """
+
+    __slots__ = ('request', 'response', 'middlewares', 'end', 'is_async', 'index', 'furthest', 'pending', 'reached')
+
+    def __init__(self, request, response, middlewares, end, is_async=False):
+        self.request = request
+        self.response = response
+        self.middlewares = middlewares
+        self.end = end
+        self.is_async = is_async
+        # Where the rest of the chain starts, for the middleware being run.
+        self.index = 0
+        # Furthest the chain got, so a middleware can't run the rest of it twice.
+        self.furthest = -1
+        # Where the rest of the chain starts, until it's awaited (asyncio).
+        self.pending = None
+        self.reached = False
+
+    def __call__(self):
+
+        index = self.index
+
+        if index <= self.furthest:
+            raise RuntimeError('next() was called more than once')
+
+        self.furthest = index
+
+        # The rest of the chain runs when this is awaited.
+        if self.is_async:
+            self.pending = index
+            return self
+
+        try:
+            if index == len(self.middlewares):
+                self.reached = self.end(self.request, self.response)
+            else:
+                self.index = index + 1
+                self.middlewares[index](self.request, self.response, self)
+        finally:
+            self.index = index
+
+    def __await__(self):
+
+        index = self.pending
+
+        if index is None:
+            raise RuntimeError('next() must be called before it\'s awaited, and awaited once')
+
+        self.pending = None
+
+        return self._run_async(index).__await__()
+
+    async def _run_async(self, index):
+
+        try:
+            if index == len(self.middlewares):
+                self.reached = await self.end(self.request, self.response)
+                return
+
+            self.index = index + 1
+
+            result = self.middlewares[index](self.request, self.response, self)
+
+            if inspect.isawaitable(result):
+                await result
+
+            # Called from a plain middleware (or not awaited): the rest of the chain runs now.
+            if self.pending is not None:
+                await self
+        finally:
+            self.index = index
+
+
+class TimedNext:
+
+    """
+        Stands in for the `next` of a middleware that is timed (see RequestMetrics.timed_middleware and
+        Tracing.traced_middleware), and adds the time the rest of the chain took to `elapsed`, so it can be taken out
+        of the middleware's own. A cProfile `profile` is paused meanwhile, the handlers downstream enable it themselves.
+    """
+
+    __slots__ = ('next', 'profile', 'elapsed')
+
+    def __init__(self, next, profile=None):
+        self.next = next
+        self.profile = profile
+        self.elapsed = 0.0
+
+    def __call__(self):
+
+        started = time.perf_counter()
+
+        if self.profile is not None:
+            self.profile.disable()
+
+        try:
+            result = self.next()
+        finally:
+            if self.profile is not None:
+                self.profile.enable()
+            self.elapsed += time.perf_counter() - started
+
+        # On the asyncio engine nothing ran yet, it's timed when awaited.
+        return None if result is None else self
+
+    def __await__(self):
+
+        started = time.perf_counter()
+
+        if self.profile is not None:
+            self.profile.disable()
+
+        try:
+            yield from self.next.__await__()
+        finally:
+            if self.profile is not None:
+                self.profile.enable()
+            self.elapsed += time.perf_counter() - started
+
+
+class Pipeline:
+
+    """
+        Handler chain of a route, flattened once when the route (or a global middleware) is registered:
+        global middlewares, then route middlewares, then the controller.
+        Running it walks that tuple by index (see Next), so nothing is nested or rebuilt per request.
+    """
+
+    __slots__ = (
+        'middlewares',
+        'controller',
+        'controller_is_async',
+        'cache',
+        'admission',
+        'priority',
+        'max_body_size',
+        'execution',
+        'executors',
+    )
+
+    def __init__(self, middlewares, controller, cache=None, admission=None, priority=False,
+                 max_body_size=None, execution=None, executors=None):
+        self.middlewares = tuple(middlewares)
+        self.controller = controller
+        self.controller_is_async = inspect.iscoroutinefunction(controller)
+        # Response cache (see RouteCache) in front of the controller. Every middleware (ie: auth) runs before it.
+        self.cache = cache
+        # Admission control (see AdmissionControl) the whole chain runs under, and whether the route gets free slots first.
+        self.admission = admission
+        self.priority = priority
+        # Largest request body accepted (None for no limit). Bigger ones get a 413 before anything reads them.
+        self.max_body_size = max_body_size
+        # Where the controller runs ("inline", "thread" or "process", see Executors). None for the engine's default.
+        self.execution = execution
+        self.executors = executors
+
+    # Run
+    def run(self, request, response):
+
+        """
+            Runs the chain, which stops at the first middleware that doesn't call next().
+            Returns whether the controller was reached.
+        """
+
+        self._check_body_size(request, response)
+
+        if self.admission is None:
+            return self._run_cached(request, response)
+
+        if not self.admission.acquire(self.priority):
+            self.admission.reject(response)
+            return False
+
+        try:
+            return self._run_cached(request, response)
+        finally:
+            self.admission.release()
+
+    # Run (asyncio)
+    async def run_async(self, request, response, executor):
+
+        """
+            Same as run(), for the asyncio engine. `async def` handlers are awaited, plain middlewares run inline and
+            plain controllers run on `executor`.
+        """
+
+        self._check_body_size(request, response)
+
+        if self.admission is None:
+            return await self._run_cached_async(request, response, executor)
+
+        if not await self.admission.acquire_async(self.priority):
+            self.admission.reject(response)
+            return False
+
+        try:
+            return await self._run_cached_async(request, response, executor)
+        finally:
+            self.admission.release()
+
+    def _check_body_size(self, request, response):
+        if self.max_body_size is not None and request.body_reader is not None and \
+                request.body_reader.content_length > self.max_body_size:
+            # The body stays unread, so the connection can't be reused.
+            response.server.close_connection = True
+            raise PayloadTooLarge('Request body is too large')
+
+    def _run_cached(self, request, response):
+
+        if self.cache is None:
+            return self._run(request, response, self.middlewares, self._call_controller)
+
+        return self._run(request, response, self.middlewares, self._call_cached_controller)
+
+    async def _run_cached_async(self, request, response, executor):
+
+        async def controller(request, response):
+            return await self._call_controller_async(request, response, executor)
+
+        if self.cache is None:
+            return await self._run_async(request, response, self.middlewares, controller)
+
+        async def cached(request, response):
+            return await self.cache.handle_async(request, response, lambda: controller(request, response))
+
+        return await self._run_async(request, response, self.middlewares, cached)
+
+    def _run(self, request, response, middlewares, end):
+        chain = Next(request, response, middlewares, end)
+        chain()
+        return chain.reached
+
+    async def _run_async(self, request, response, middlewares, end):
+        chain = Next(request, response, middlewares, end, is_async=True)
+        await chain()
+        return chain.reached
+
+    def _call_controller(self, request, response):
+
+        if self.execution is None:
+            self.controller(request, response)
+        else:
+            self.executors.call(self.execution, self.controller, request, response)
+
+        return True
+
+    def _call_cached_controller(self, request, response):
+        return self.cache.handle(request, response, lambda: self._call_controller(request, response))
+
+    async def _call_controller_async(self, request, response, executor):
+
+        if self.controller_is_async:
+            await self.controller(request, response)
+        elif self.execution is not None:
+            await self.executors.call_async(self.execution, self.controller, request, response)
+        else:
+            await asyncio.get_running_loop().run_in_executor(executor, self.controller, request, response)
+
+        return True
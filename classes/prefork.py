@@ -0,0 +1,121 @@
+import os
+import signal
+import sys
+import time
+import traceback
+
+
+class Supervisor:
+
+    """
+        Forks `processes` workers that each run `target`, and keeps that many alive until SIGINT/SIGTERM.
+        Workers that exit on their own are restarted. On shutdown every worker gets SIGTERM, and the ones still
+        running after `graceful_timeout` seconds are killed.
+    """
+
+    def __init__(self, processes, target, graceful_timeout=30):
+
+        if processes < 1:
+            raise ValueError('processes must be at least 1')
+
+        self.processes = processes
+        self.target = target
+        self.graceful_timeout = graceful_timeout
+
+        # Map from pid to the (monotonic) time the worker was started.
+        self.workers = {}
+
+        self._stopping = False
+
+    # Run
+    def run(self):
+
+        """
+            Starts the workers and blocks until all of them exited after a stop signal.
+        """
+
+        previous_handlers = {
+            signum: signal.signal(signum, handler)
+            for signum, handler in (
+                (signal.SIGINT, self._stop),
+                (signal.SIGTERM, self._stop),
+                (signal.SIGALRM, self._kill),
+            )
+        }
+
+        try:
+            for _ in range(self.processes):
+                self._spawn()
+
+            while self.workers:
+
+                try:
+                    pid, status = os.wait()
+                except ChildProcessError:
+                    break
+
+                started = self.workers.pop(pid, None)
+
+                if started is None or self._stopping:
+                    continue
+
+                print(f"Worker {pid} exited with code {os.waitstatus_to_exitcode(status)}, restarting.")
+
+                # Don't fork in a tight loop if workers die right after starting.
+                if time.monotonic() - started < 1:
+                    time.sleep(1)
+
+                if not self._stopping:
+                    self._spawn()
+
+        finally:
+            signal.alarm(0)
+
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+    def _spawn(self):
+
+        pid = os.fork()
+
+        # Worker.
+        if pid == 0:
+
+            # The target installs its own handlers.
+            for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGALRM):
+                signal.signal(signum, signal.SIG_DFL)
+
+            code = 0
+
+            try:
+                self.target()
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                os._exit(code)
+
+        self.workers[pid] = time.monotonic()
+
+    def _signal_workers(self, signum):
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    def _stop(self, signum, frame):
+
+        if self._stopping:
+            return
+
+        self._stopping = True
+
+        self._signal_workers(signal.SIGTERM)
+
+        signal.alarm(self.graceful_timeout)
+
+    def _kill(self, signum, frame):
+        self._signal_workers(signal.SIGKILL)
@@ -0,0 +1,139 @@
+import asyncio
+import ipaddress
+import struct
+
+from classes.errors import BadRequest
+
+
+# First 12 bytes of a version 2 (binary) header.
+V2_SIGNATURE = b'\r\n\r\n\x00\r\nQUIT\n'
+
+# Longest version 1 (text) header, CRLF included.
+V1_MAX_LENGTH = 107
+
+# Address families of version 2 headers: (address length, constructor) of TCP over IPv4 and IPv6.
+V2_FAMILIES = {
+    0x11: (4, ipaddress.IPv4Address),
+    0x21: (16, ipaddress.IPv6Address),
+}
+
+
+def read_proxy_header(rfile):
+
+    """
+        Reads the PROXY protocol header (version 1 or 2) a proxy sends at the start of each connection, from a
+        buffered file (the threads engine's rfile).
+        Returns the (ip, port) of the client the proxy is relaying, or None when the proxy doesn't say (ie: its own
+        health checks), in which case the connection's address stands. Raises BadRequest if the header is missing or
+        invalid: the connection must then be closed, there's no telling where the request starts.
+    """
+
+    start = rfile.read(len(V2_SIGNATURE))
+
+    if start == V2_SIGNATURE:
+        head = start + rfile.read(4)
+        payload = rfile.read(_v2_length(head))
+        return parse_v2(head, payload)
+
+    return parse_v1(start + rfile.readline(V1_MAX_LENGTH - len(start)))
+
+
+async def read_proxy_header_async(reader):
+
+    """Same as read_proxy_header(), from an asyncio StreamReader."""
+
+    start = await reader.readexactly(len(V2_SIGNATURE))
+
+    if start == V2_SIGNATURE:
+        head = start + await reader.readexactly(4)
+        payload = await reader.readexactly(_v2_length(head))
+        return parse_v2(head, payload)
+
+    try:
+        line = start + await reader.readuntil(b'\r\n')
+    except asyncio.LimitOverrunError:
+        raise BadRequest('Invalid PROXY protocol header') from None
+
+    return parse_v1(line)
+
+
+def parse_v1(line):
+
+    """
+        Parses a version 1 header, ie: b"PROXY TCP4 203.0.113.7 10.0.0.1 51234 443\\r\\n".
+    """
+
+    if len(line) > V1_MAX_LENGTH or not line.startswith(b'PROXY ') or not line.endswith(b'\r\n'):
+        raise BadRequest('Invalid PROXY protocol header')
+
+    parts = line[:-2].decode('latin-1').split(' ')
+
+    # The proxy doesn't know (or tell) who the client is.
+    if parts[1] == 'UNKNOWN':
+        return None
+
+    if len(parts) != 6 or parts[1] not in ('TCP4', 'TCP6'):
+        raise BadRequest('Invalid PROXY protocol header')
+
+    _, protocol, source, destination, source_port, destination_port = parts
+
+    source_ip = _parse_ip(source)
+
+    if _parse_ip(destination) is None or source_ip is None or source_ip.version != int(protocol[3]):
+        raise BadRequest('Invalid PROXY protocol header')
+
+    if not _is_port(source_port) or not _is_port(destination_port):
+        raise BadRequest('Invalid PROXY protocol header')
+
+    return str(source_ip), int(source_port)
+
+
+def parse_v2(head, payload):
+
+    """
+        Parses a version 2 header: its fixed 16 bytes, then the addresses (followed by TLVs, which are ignored).
+    """
+
+    if len(head) != 16 or len(payload) != _v2_length(head) or head[12] >> 4 != 2:
+        raise BadRequest('Invalid PROXY protocol header')
+
+    command = head[12] & 0x0F
+
+    # LOCAL: a connection of the proxy itself (ie: a health check).
+    if command == 0:
+        return None
+
+    if command != 1:
+        raise BadRequest('Invalid PROXY protocol header')
+
+    # Other families (unspecified, UDP, unix sockets) have no (ip, port) to give.
+    if head[13] not in V2_FAMILIES:
+        return None
+
+    size, address = V2_FAMILIES[head[13]]
+
+    # Source and destination addresses, then source and destination ports.
+    if len(payload) < 2 * size + 4:
+        raise BadRequest('Invalid PROXY protocol header')
+
+    port, = struct.unpack_from('!H', payload, 2 * size)
+
+    return str(address(payload[:size])), port
+
+
+def _v2_length(head):
+    # Length of what follows the fixed 16 bytes.
+    if len(head) != 16:
+        raise BadRequest('Invalid PROXY protocol header')
+    return struct.unpack_from('!H', head, 14)[0]
+
+
+def _parse_ip(text):
+    try:
+        return ipaddress.ip_address(text)
+    except ValueError:
+        return None
+
+
+def _is_port(text):
+    return text.isascii() and text.isdigit() and len(text) <= 5 and int(text) <= 65535
@@ -1,15 +1,75 @@
+import asyncio
+import gc
 import inspect
+import os
+import pickle
+import shutil
+import signal
+import tempfile
 from typing import Callable, Optional, List
-from http.server import HTTPServer
 import threading
-from classes.http_server import CustomHandler 
+from concurrent.futures import ThreadPoolExecutor
+from classes.http_server import CustomHandler, PooledHTTPServer
+from classes.async_server import AsyncServer
+from classes.serialization import default_json_encoder
+from classes.prefork import Supervisor
+from classes.sockets import adopt_socket, create_listen_socket, create_unix_socket, describe_address
+from classes.pipeline import Pipeline
+from classes.cache import RouteCache
+from classes.body_parser import BodyParsers
+from classes.resources import State
+from classes.executors import EXECUTION_POLICIES, Executors
+from classes.testing import TestClient
+from classes.tracing import RequestProfiler, SlowRequestLog, Tracing
+from classes.metrics import Metrics
+from classes.router import Router
+
+
+def not_found(req, res):
+    res.status(404).send({"error": "Not Found"})
 
 
 class PyExpress:
     
-    def __init__(self, debug_mode=False):
+    def __init__(self, debug_mode=False, max_field_size=1024 * 1024, max_file_size=None, max_multipart_size=None,
+                 json_encoder=None, metrics=True, admission=None, max_body_size=None, executors=None, state=None):
         
         self.debug_mode = debug_mode
+
+        # What the handlers share (see State), ie: the pools opened by the on_startup hooks.
+        self.state = state if state is not None else State()
+
+        # Functions called with the app when each worker starts and stops (see on_startup).
+        self.startup_hooks = []
+        self.shutdown_hooks = []
+
+        # Thread and process pools for the routes that don't run their controller inline (see Executors).
+        self.executors = executors or Executors()
+
+        # Largest request body accepted (None for no limit), unless the route sets its own.
+        self.max_body_size = max_body_size
+
+        # Admission control (see admission_control), or None to let every request through.
+        self.admission = admission
+
+        # Request metrics (see Metrics), or None when disabled.
+        self.request_metrics = Metrics() if metrics is True else (metrics or None)
+
+        # Instrumentation hooks, slow request log and profiler (see on_request_start), None until one is set up.
+        self.tracing = None
+
+        # Function that turns the dicts and lists given to res.send/res.json into bytes (or str).
+        self.json_encoder = json_encoder or default_json_encoder()
+
+        # Limits for multipart/form-data bodies (None for no limit): bytes per text field, per file and in total.
+        self.multipart_limits = {
+            "max_field_size": max_field_size,
+            "max_file_size": max_file_size,
+            "max_total_size": max_multipart_size,
+        }
+
+        # Request body parsers by Content-Type (see body_parser).
+        self.body_parsers = BodyParsers(self.multipart_limits)
         
         self.global_middlewares = []
         
@@ -18,32 +78,292 @@ class PyExpress:
 
         # Map from (resource) to method to functions (middleware, then controller)
         self.routes = {}
+
+        # Map from (resource, method) to the options of the route (ie: its response cache).
+        self.route_options = {}
+
+        # Compiled route tree, kept in sync with `routes` by _add_route.
+        self.router = Router()
+
+        # Global middlewares followed by a 404, for requests that don't match any route.
+        self.not_found_pipeline = Pipeline([], not_found, admission=admission, max_body_size=max_body_size)
     
     # Listen
-    def listen(self, host="localhost", port=3000):
-        
-        # Start the server on the specified port.
-        # Function to create the server on the desired host and port
-        server_address = (host, port)
+    def listen(self, host="localhost", port=3000, workers=None, backlog=128, engine="threads", processes=None, reuse_port=False,
+               keep_alive_timeout=5, max_requests_per_connection=100, header_timeout=10, body_timeout=30,
+               max_header_size=64 * 1024, max_connections=None, unix_socket=None, unix_socket_mode=None, sock=None,
+               proxy_protocol=False):
 
-        # Init the custom handler.
-        httpd = HTTPServer(server_address, lambda *args, **kwargs: CustomHandler(self, *args, **kwargs))
+        """
+            Starts the server and blocks until SIGINT/SIGTERM.
+            With the "threads" engine, connections are handled by a pool of `workers` threads (defaults to
+            min(32, cpu count + 4)), with up to `backlog` connections waiting to be accepted while every worker is busy.
+            With the "asyncio" engine, connections are served from an event loop and `workers` is the size of the
+            thread pool that runs plain (non async) controllers.
+            With `processes`, that many worker processes are forked, each running the chosen engine. They share a
+            socket bound before forking, or bind their own with SO_REUSEPORT if `reuse_port` is set.
+            Connections are kept alive between requests for up to `keep_alive_timeout` seconds, and closed after
+            `max_requests_per_connection` requests (None for no limit).
+            Clients get a 408 if a request head takes more than `header_timeout` seconds, or the body goes
+            `body_timeout` seconds without sending anything, and a 431 if the head is over `max_header_size` bytes.
+            At `max_connections` open connections (per process), the one idle for the longest is closed to make room
+            for a new one, which only gets a 503 when none is idle.
+            Instead of `host` and `port`, the server can listen on a `unix_socket` path (with `unix_socket_mode`
+            permissions, ie: 0o660), or serve from an already listening `sock`, given as a socket or a file
+            descriptor (ie: 3, with systemd socket activation). Either is shared by the forked `processes`.
+            With `proxy_protocol`, every connection must start with a PROXY protocol header (version 1 or 2, as sent
+            by nginx with `proxy_protocol on`, or HAProxy with `send-proxy`), and `req.ip` is the client's address it
+            gives. Only for servers reached through such a proxy: the header is required, and trusted.
+        """
+
+        if engine not in ("threads", "asyncio"):
+            raise ValueError(f'Unknown engine: {engine}')
+
+        # The threads engine would call them without awaiting them, and their requests would get no response.
+        if engine == "threads" and self.async_handlers():
+            raise ValueError(f'async def handlers need the asyncio engine: {", ".join(self.async_handlers())}')
+
+        if workers is None:
+            workers = min(32, (os.cpu_count() or 1) + 4)
+
+            # Admitted requests shouldn't wait for a thread. With the threads engine, waiting ones hold a thread too,
+            # and a few more read the requests to shed (or to exempt routes) while every slot is taken.
+            if self.admission is not None:
+                waiting = self.admission.max_queue + 4 if engine == "threads" else 0
+                workers = max(workers, self.admission.max_in_flight + waiting)
+
+        if workers < 1:
+            raise ValueError('workers must be at least 1')
+
+        if unix_socket is not None and sock is not None:
+            raise ValueError('Listen on either a unix_socket or a sock, not both')
+
+        if reuse_port and (unix_socket is not None or sock is not None):
+            raise ValueError('reuse_port only applies to host and port')
+
+        address = f'{host}:{port}'
+
+        # Bind now, so forked workers inherit the listening socket. With SO_REUSEPORT every worker binds its own.
+        if unix_socket is not None:
+            sock = create_unix_socket(unix_socket, backlog, unix_socket_mode)
+            address = f'unix:{unix_socket}'
+        elif sock is not None:
+            sock = adopt_socket(sock)
+            address = describe_address(sock.getsockname())
+        elif not (processes and reuse_port):
+            sock = create_listen_socket(host, port, backlog, reuse_port)
+
+        print(f"Server running on {address} ({engine}{f', {processes} processes' if processes else ''})")
 
-        print(f"Server running on {host}:{port}")
-        
         if self.debug_mode:
+            print(f"Workers: {workers}, backlog: {backlog}")
             print(f"Global middlewares length: {len(self.global_middlewares)}")
             print(f"Routes: {list(self.routes.keys())}")
 
-        # Start the HTTP server in a separate thread to avoid blocking
-        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        metrics_directory = None
+
+        connection_options = {
+            "keep_alive_timeout": keep_alive_timeout,
+            "max_requests_per_connection": max_requests_per_connection,
+            "header_timeout": header_timeout,
+            "body_timeout": body_timeout,
+            "max_header_size": max_header_size,
+            "max_connections": max_connections,
+            "proxy_protocol": proxy_protocol,
+        }
 
         try:
-            while True:  # Run the server indefinitely
-                pass
-        except KeyboardInterrupt:
+
+            if not processes:
+                self._serve_engine(engine, sock, workers, backlog, connection_options)
+                return
+
+            # Each worker publishes its metrics to a shared directory, so any of them can report the totals.
+            if self.request_metrics is not None and self.request_metrics.directory is None:
+                metrics_directory = tempfile.mkdtemp(prefix='py_express_metrics_')
+                self.request_metrics.share(metrics_directory)
+
+            def serve_worker():
+                if self.request_metrics is not None:
+                    self.request_metrics.start_publishing()
+                self._serve_engine(
+                    engine, sock or create_listen_socket(host, port, backlog, reuse_port=True), workers, backlog,
+                    connection_options)
+
+            # The routes are already compiled, move them out of the GC's reach so workers keep sharing those pages.
+            gc.freeze()
+
+            Supervisor(processes, serve_worker).run()
+
+        finally:
+            if sock:
+                sock.close()
+
+            if unix_socket is not None:
+                try:
+                    os.unlink(unix_socket)
+                except FileNotFoundError:
+                    pass
+
+            if metrics_directory:
+                shutil.rmtree(metrics_directory, ignore_errors=True)
+                self.request_metrics.share(None)
+
             print("Server stopped.")
+
+    def _serve_engine(self, engine, sock, workers, backlog, connection_options):
+
+        """
+            Serves connections from a listening socket with the chosen engine until a stop signal arrives.
+        """
+
+        # Forked before the server's threads start.
+        self.executors.start(self)
+
+        try:
+            if engine == "asyncio":
+                self._serve_async(sock, workers, connection_options)
+            else:
+                self._serve_threads(sock, workers, backlog, connection_options)
+        finally:
+            self.executors.shutdown()
+
+            if self.tracing is not None:
+                self.tracing.close()
+
+    def _serve_threads(self, sock, workers, backlog, connection_options):
+
+        """
+            Runs the threads engine until a stop signal arrives.
+        """
+
+        self.startup()
+
+        # Init the custom handler.
+        httpd = PooledHTTPServer(
+            sock.getsockname(),
+            lambda *args, **kwargs: CustomHandler(self, *args, **kwargs),
+            workers=workers,
+            backlog=backlog,
+            sock=sock,
+            **connection_options,
+        )
+
+        try:
+            self._serve(httpd)
+        finally:
+            self.shutdown()
+
+    def _serve_async(self, sock, workers, connection_options):
+
+        """
+            Runs the asyncio engine until a stop signal arrives.
+        """
+
+        executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='py_express')
+
+        async def serve():
+
+            await self.startup_async()
+
+            try:
+                await AsyncServer(self, executor, **connection_options).serve(sock)
+            finally:
+                await self.shutdown_async()
+
+        try:
+            asyncio.run(serve())
+        finally:
+            executor.shutdown(wait=True)
+
+    def _serve(self, httpd):
+
+        """
+            Runs the accept loop on a separate thread while the calling thread sleeps until a stop signal arrives.
+        """
+
+        stop = threading.Event()
+
+        # Install the signal handlers (only possible from the main thread).
+        previous_handlers = {}
+        if threading.current_thread() is threading.main_thread():
+            for signum in (signal.SIGINT, signal.SIGTERM):
+                previous_handlers[signum] = signal.signal(signum, lambda *args: stop.set())
+
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+        try:
+            # Block without spinning until told to stop.
+            stop.wait()
+        finally:
             httpd.shutdown()
+            httpd.server_close()
+
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+    # Lifecycle
+    def on_startup(self, hook: Callable) -> Callable:
+
+        """
+            Adds a function called with the app when each worker starts (each process, with `processes`), before it
+            serves requests. ie: to open the pools and clients the requests share, in `app.state`, after the fork.
+            With the asyncio engine it runs on the event loop, and can be `async def`. Returns the hook, so it can be
+            used as a decorator.
+        """
+
+        self.startup_hooks.append(hook)
+        return hook
+
+    def on_shutdown(self, hook: Callable) -> Callable:
+        """Adds a function called with the app when each worker stops, once it's done serving requests."""
+        self.shutdown_hooks.append(hook)
+        return hook
+
+    def startup(self):
+
+        """
+            Runs the on_startup hooks. Done by the server in each worker (and by the test client).
+        """
+
+        if any(inspect.iscoroutinefunction(hook) for hook in self.startup_hooks + self.shutdown_hooks):
+            raise ValueError('async def startup and shutdown hooks need the asyncio engine.')
+
+        for hook in self.startup_hooks:
+            hook(self)
+
+    def shutdown(self):
+
+        """
+            Runs the on_shutdown hooks. A failing hook doesn't stop the others.
+        """
+
+        for hook in self.shutdown_hooks:
+            try:
+                hook(self)
+            except Exception as e:
+                print(f"Error in shutdown hook: {e}")
+
+    async def startup_async(self):
+
+        """Same as startup(), on the event loop of the asyncio engine."""
+
+        for hook in self.startup_hooks:
+            result = hook(self)
+            if inspect.isawaitable(result):
+                await result
+
+    async def shutdown_async(self):
+
+        """Same as shutdown(), on the event loop of the asyncio engine."""
+
+        for hook in self.shutdown_hooks:
+            try:
+                result = hook(self)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                print(f"Error in shutdown hook: {e}")
 
     # Use
     def use(self, middleware):
@@ -71,58 +391,193 @@ class PyExpress:
         # Otherwise, use it as a normal global middleware.
         else:
             self.global_middlewares.append(middleware)
+            self._compile_routes()
             if self.debug_mode:
                 print(f'Added global middleware to server. Current global middlewares length: {len(self.global_middlewares)}')
 
+    # Metrics
+    def metrics(self):
+
+        """
+            Returns the request metrics per route and method (of every worker, when running several processes).
+        """
+
+        if self.request_metrics is None:
+            raise ValueError('Metrics are disabled.')
+
+        return self.request_metrics.collect()
+
+    # Metrics route
+    def serve_metrics(self, resource: str = '/metrics', middlewares: Optional[List[Callable]] = None) -> None:
+
+        """
+            Adds a GET route that serves the metrics in the Prometheus text format (with `middlewares` in front, ie:
+            to restrict who can read them).
+        """
+
+        if self.request_metrics is None:
+            raise ValueError('Metrics are disabled.')
+
+        def metrics(req, res):
+            res.send_bytes(self.request_metrics.prometheus().encode(), 'text/plain; version=0.0.4; charset=utf-8')
+
+        if middlewares:
+            self.get(resource, middlewares, metrics)
+        else:
+            self.get(resource, metrics)
+
+    # Body parser
+    def body_parser(self, content_type: str, parser: Callable) -> None:
+
+        """
+            Sets the function that parses `req.body` for a Content-Type, ie: "application/msgpack", or "text/*" for a
+            whole type. It gets the request and returns the body, read from `req.raw` (or streamed from `req.stream()`
+            for large bodies). Errors it raises (other than HTTPErrors) become a 400.
+        """
+
+        self.body_parsers.add(content_type, parser)
+
+    # Test client
+    def test_client(self, headers: Optional[dict] = None) -> TestClient:
+
+        """
+            Returns a client that makes requests to the app in memory, without a server or sockets, ie:
+            server.test_client().get('/users/1', headers={'Authorization': '...'}).json()
+        """
+
+        return TestClient(self, headers)
+
+    # Instrumentation
+    def on_request_start(self, hook: Callable) -> Callable:
+
+        """
+            Adds a function called with (req, res, timestamp) when a request starts, before its route is looked up.
+            Timestamps come from time.monotonic(). Hooks run on the request's thread (or the event loop, with the
+            asyncio engine), so they should be quick. Returns the hook, so it can be used as a decorator.
+        """
+
+        self._get_tracing().request_start_hooks.append(hook)
+        return hook
+
+    def on_route_matched(self, hook: Callable) -> Callable:
+        """Adds a function called with (req, res, timestamp) once the route is looked up (req.route is None if none matched)."""
+        self._get_tracing().route_matched_hooks.append(hook)
+        return hook
+
+    def on_handler_done(self, hook: Callable) -> Callable:
+        """Adds a function called with (req, res, timestamp) once the middlewares and the controller are done."""
+        self._get_tracing().handler_done_hooks.append(hook)
+        return hook
+
+    def on_response_sent(self, hook: Callable) -> Callable:
+        """Adds a function called with (req, res, timestamp) once the response was written to the connection."""
+        self._get_tracing().response_sent_hooks.append(hook)
+        return hook
+
+    def log_slow_requests(self, threshold: float = 1.0, size: int = 100, callback: Optional[Callable] = None) -> SlowRequestLog:
+
+        """
+            Keeps the last `size` requests that took `threshold` seconds or more, with the time spent matching the
+            route, in each middleware, in the controller, parsing the body and sending the response.
+            `callback` is called with each record (ie: to log it). Returns the log (see SlowRequestLog.records).
+        """
+
+        tracing = self._get_tracing()
+        tracing.slow_log = SlowRequestLog(threshold, size, callback)
+
+        # The middlewares get wrapped to time them.
+        self._compile_routes()
+
+        return tracing.slow_log
+
+    def profile_requests(self, every: Optional[int] = 100, header: Optional[str] = None, token: Optional[str] = None,
+                         directory: str = 'profiles', save_interval: float = 10.0) -> RequestProfiler:
+
+        """
+            Runs cProfile on the middlewares and controller of 1 in `every` requests (None for none), and of the
+            requests whose `header` is `token`. The stats are added up per route and saved to `directory` every
+            `save_interval` seconds and when the server stops, one .pstats file per route and process, ie:
+            pstats.Stats(*glob.glob('profiles/GET_users_:id.*.pstats')).sort_stats('cumulative').print_stats(20)
+        """
+
+        tracing = self._get_tracing()
+        tracing.profiler = RequestProfiler(every, header, token, directory, save_interval)
+
+        self._compile_routes()
+
+        return tracing.profiler
+
+    def _get_tracing(self):
+        if self.tracing is None:
+            self.tracing = Tracing()
+        return self.tracing
+
     # Get
-    def get(self, resource: str, middlewares: Callable | List[Callable], controller: Optional[Callable]=None) -> None:
+    def get(self, resource: str, middlewares: Callable | List[Callable], controller: Optional[Callable]=None,
+            cache: Optional[RouteCache]=None, execution: Optional[str]=None) -> None:
 
         """
             Creates a new GET route for a specific resource, with specific middlewares that run in order, and a controller.
+            With a `cache` (see route_cache), responses are reused and the controller only runs on misses. The middlewares
+            (ie: auth) run on every request, before the cache is looked up.
+            `execution` is where the controller runs: "inline" (on the thread serving the request), "thread" or
+            "process" (on the app's Executors, ie: for CPU heavy work).
         """
 
-        self._add_route(resource, 'GET', middlewares, controller)
+        self._add_route(resource, 'GET', middlewares, controller, cache=cache, execution=execution)
 
     # Put
-    def put(self, resource: str, middlewares: Callable | List[Callable], controller: Optional[Callable]=None) -> None:
+    def put(self, resource: str, middlewares: Callable | List[Callable], controller: Optional[Callable]=None,
+            max_body_size: Optional[int]=None, execution: Optional[str]=None) -> None:
 
         """
             Creates a new PUT route for a specific resource, with specific middlewares that run in order, and a controller.
+            `max_body_size` overrides the app's limit on request bodies for this route, and `execution` is where the
+            controller runs (see get).
         """
 
-        self._add_route(resource, 'PUT', middlewares, controller)
+        self._add_route(resource, 'PUT', middlewares, controller, max_body_size=max_body_size, execution=execution)
 
     # Post
-    def post(self, resource: str, middlewares: Callable | List[Callable], controller: Optional[Callable]=None) -> None:
+    def post(self, resource: str, middlewares: Callable | List[Callable], controller: Optional[Callable]=None,
+            max_body_size: Optional[int]=None, execution: Optional[str]=None) -> None:
 
         """
             Creates a new POST route for a specific resource, with specific middlewares that run in order, and a controller.
+            `max_body_size` overrides the app's limit on request bodies for this route, and `execution` is where the
+            controller runs (see get).
         """
 
-        self._add_route(resource, 'POST', middlewares, controller)
+        self._add_route(resource, 'POST', middlewares, controller, max_body_size=max_body_size, execution=execution)
 
 
     # Delete
-    def delete(self, resource: str, middlewares: Callable | List[Callable], controller: Optional[Callable]=None) -> None:
+    def delete(self, resource: str, middlewares: Callable | List[Callable], controller: Optional[Callable]=None,
+            max_body_size: Optional[int]=None, execution: Optional[str]=None) -> None:
 
         """
             Creates a new DEL route for a specific resource, with specific middlewares that run in order, and a controller.
+            `max_body_size` overrides the app's limit on request bodies for this route, and `execution` is where the
+            controller runs (see get).
         """
 
-        self._add_route(resource, 'DEL', middlewares, controller)
+        self._add_route(resource, 'DEL', middlewares, controller, max_body_size=max_body_size, execution=execution)
 
 
     # Patch
-    def patch(self, resource: str, middlewares: Callable | List[Callable], controller: Optional[Callable]=None) -> None:
+    def patch(self, resource: str, middlewares: Callable | List[Callable], controller: Optional[Callable]=None,
+            max_body_size: Optional[int]=None, execution: Optional[str]=None) -> None:
 
         """
             Creates a new PATCH route for a specific resource, with specific middlewares that run in order, and a controller.
+            `max_body_size` overrides the app's limit on request bodies for this route, and `execution` is where the
+            controller runs (see get).
         """
 
-        self._add_route(resource, 'PATCH', middlewares, controller)
+        self._add_route(resource, 'PATCH', middlewares, controller, max_body_size=max_body_size, execution=execution)
 
 
-    def _add_route(self, resource, method, middlewares, controller):
+    def _add_route(self, resource, method, middlewares, controller, **options):
 
         if not middlewares:
             raise ValueError(f'Missing controller for resource: {resource}')
@@ -146,6 +601,8 @@ class PyExpress:
         if not self._is_valid_controller(controller):
             raise ValueError('Invalid controller. Controller must accept args: req, res')
 
+        self._check_execution(controller, options.get('execution'))
+
         if resource not in self.routes:
             self.routes[resource] = {}
         
@@ -153,12 +610,104 @@ class PyExpress:
             self.routes[resource][method] = []
 
         self.routes[resource][method] = middlewares + [controller]
+        self.route_options[(resource, method)] = options
+
+        # Insert into the route tree, with the whole chain flattened into a pipeline.
+        self.router.add(resource, method, self._build_pipeline(resource, method, middlewares, controller))
 
         if self.debug_mode:
             print(f'Added new route. Current routes: {list(self.routes.keys())}')
 
         pass
 
+    def async_handlers(self):
+
+        """
+            Names of the `async def` middlewares, controllers and error middleware, which only the asyncio engine
+            awaits.
+        """
+
+        handlers = self.global_middlewares + [self.error_midleware] + [
+            handler for methods in self.routes.values() for functions in methods.values() for handler in functions]
+
+        return [
+            getattr(handler, '__qualname__', repr(handler))
+            for handler in dict.fromkeys(handlers) if inspect.iscoroutinefunction(handler)
+        ]
+
+    def _check_execution(self, controller, execution):
+
+        if execution is None:
+            return
+
+        if execution not in EXECUTION_POLICIES:
+            raise ValueError(f'Unknown execution: {execution}')
+
+        if execution != 'inline' and inspect.iscoroutinefunction(controller):
+            raise ValueError('Async controllers run on the event loop, they can only be inline.')
+
+        if execution == 'process':
+
+            # Controllers are sent to the worker processes by name.
+            try:
+                pickle.dumps(controller)
+            except Exception:
+                raise ValueError('Controllers running in a process pool must be module level functions.') from None
+
+            self.executors.uses_processes = True
+
+    def _compile_routes(self):
+
+        """
+            Rebuilds the pipeline of every route, ie: after a global middleware was added.
+        """
+
+        for resource, methods in self.routes.items():
+            for method, handlers in methods.items():
+                self.router.add(resource, method, self._build_pipeline(resource, method, handlers[:-1], handlers[-1]))
+
+        self.not_found_pipeline = Pipeline(
+            self.global_middlewares, not_found, admission=self.admission, max_body_size=self.max_body_size)
+
+    def _build_pipeline(self, resource, method, middlewares, controller):
+
+        options = self.route_options.get((resource, method), {})
+
+        middlewares = self.global_middlewares + middlewares
+
+        # Wrapped once here, so routes pay nothing for it when it's off.
+        if self.request_metrics is not None and self.request_metrics.middleware_timing:
+            middlewares = [self.request_metrics.timed_middleware(resource, method, middleware) for middleware in middlewares]
+
+        execution = options.get('execution')
+
+        # 0 is a limit too (no body allowed), only None falls back to the app's.
+        max_body_size = options.get('max_body_size')
+        if max_body_size is None:
+            max_body_size = self.max_body_size
+
+        if self.tracing is not None and self.tracing.wraps_handlers:
+            middlewares = [self.tracing.traced_middleware(middleware) for middleware in middlewares]
+
+            # Controllers sent to the process pool have to stay picklable, and can't be profiled from here anyway.
+            if self.tracing.profiler is not None and execution != 'process':
+                controller = self.tracing.profiled_controller(controller)
+
+        # Exempt routes (ie: health checks) skip admission control altogether.
+        admission = self.admission if self.admission is not None and resource not in self.admission.exempt else None
+
+        # The cache sits in front of the controller, after every middleware (ie: the route's auth).
+        return Pipeline(
+            middlewares,
+            controller,
+            cache=options.get('cache'),
+            admission=admission,
+            priority=admission is not None and resource in admission.priority,
+            max_body_size=max_body_size,
+            execution=execution,
+            executors=self.executors,
+        )
+
     def _is_valid_middleware(self, middleware: Callable) -> bool:
         """
         Check if the middleware function has three arguments: req, res, and next.
@@ -0,0 +1,210 @@
+import hashlib
+import math
+import mmap
+import multiprocessing
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+
+class BucketStore:
+
+    """
+        Token buckets of the clients of one process, in a dict split in `shards`, each with its own lock (so
+        concurrent requests rarely wait on each other).
+        Each shard keeps up to max_keys / shards buckets. Past that, the least recently used one is dropped, so a flood
+        of unique clients can't grow it without bound.
+    """
+
+    def __init__(self, max_keys=100000, shards=32):
+        self.shard_count = shards
+        self.max_keys_per_shard = max(1, max_keys // shards)
+        self._shards = [OrderedDict() for _ in range(shards)]
+        self._locks = [threading.Lock() for _ in range(shards)]
+        self.evictions = 0
+
+    def take(self, key, rate, burst, now):
+
+        """
+            Takes a token from the bucket of `key` (refilled at `rate` tokens per second, up to `burst`).
+            Returns (allowed, tokens left, seconds until the next token).
+        """
+
+        index = hash(key) % self.shard_count
+        shard = self._shards[index]
+
+        with self._locks[index]:
+
+            bucket = shard.get(key)
+
+            if bucket is None:
+                tokens = burst
+                # Evict the least recently used bucket.
+                if len(shard) >= self.max_keys_per_shard:
+                    shard.popitem(last=False)
+                    self.evictions += 1
+            else:
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+                shard.move_to_end(key)
+
+            allowed = tokens >= 1
+
+            if allowed:
+                tokens -= 1
+
+            shard[key] = (tokens, now)
+
+        return allowed, tokens, 0.0 if allowed else (1 - tokens) / rate
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards)
+
+
+# Slot of the shared table: key hash, tokens, time of the last update.
+SLOT = struct.Struct('=Qdd')
+
+
+class SharedBucketStore:
+
+    """
+        Token buckets in anonymous shared memory, so forked workers share them. It must be created before the
+        workers are forked (ie: when the app is built, before listen).
+        The table has a fixed number of `slots`, split in stripes, each with its own process-shared lock. A key can
+        sit in any of the first `probes` slots from its position in its stripe; when they're all taken, the one
+        unused for the longest is reused. Memory never grows past slots * 24 bytes.
+    """
+
+    def __init__(self, slots=65536, stripes=64, probes=8):
+        self.stripes = stripes
+        self.slots_per_stripe = max(probes, slots // stripes)
+        self.probes = probes
+        self._memory = mmap.mmap(-1, SLOT.size * self.slots_per_stripe * stripes)
+        self._locks = [multiprocessing.Lock() for _ in range(stripes)]
+        self.evictions = 0
+
+    def take(self, key, rate, burst, now):
+
+        digest = int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), 'little') or 1
+
+        stripe = digest % self.stripes
+        start = (digest // self.stripes) % self.slots_per_stripe
+        base = stripe * self.slots_per_stripe
+
+        memory = self._memory
+
+        with self._locks[stripe]:
+
+            target = None
+            oldest = None
+            tokens = burst
+
+            for probe in range(self.probes):
+
+                offset = (base + (start + probe) % self.slots_per_stripe) * SLOT.size
+                slot_key, slot_tokens, slot_time = SLOT.unpack_from(memory, offset)
+
+                if slot_key == digest:
+                    target = offset
+                    tokens = min(burst, slot_tokens + (now - slot_time) * rate)
+                    break
+
+                if slot_key == 0:
+                    if target is None:
+                        target = offset
+                    break
+
+                if oldest is None or slot_time < oldest[1]:
+                    oldest = (offset, slot_time)
+
+            # Every probed slot is taken by other keys, reuse the one unused for the longest.
+            if target is None:
+                target = oldest[0]
+                self.evictions += 1
+
+            allowed = tokens >= 1
+
+            if allowed:
+                tokens -= 1
+
+            SLOT.pack_into(memory, target, digest, tokens, now)
+
+        return allowed, tokens, 0.0 if allowed else (1 - tokens) / rate
+
+
+class RateLimit:
+
+    """
+        Middleware that limits each client to `rate` requests per second, with bursts of up to `burst` requests
+        (token bucket, see `rate_limit`).
+    """
+
+    def __init__(self, rate, burst=None, key='ip', store=None, shared=False, headers=False, max_keys=100000):
+
+        if rate <= 0:
+            raise ValueError('rate must be positive')
+
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1, math.ceil(rate))
+        self.key = self._key_function(key)
+        self.headers = headers
+
+        if store is None:
+            store = SharedBucketStore(slots=max_keys) if shared else BucketStore(max_keys=max_keys)
+
+        self.store = store
+
+    def __call__(self, req, res, next):
+
+        key = self.key(req)
+
+        # Nothing to tell clients apart by.
+        if key is None:
+            return next()
+
+        allowed, tokens, retry_after = self.store.take(key, self.rate, self.burst, time.monotonic())
+
+        if self.headers:
+            res.set_header('RateLimit-Limit', str(self.burst))
+            res.set_header('RateLimit-Remaining', str(int(tokens)))
+
+        if allowed:
+            return next()
+
+        # Rejected before the body is read (it's only read when a handler asks for it).
+        res.set_header('Retry-After', str(max(1, math.ceil(retry_after))))
+        res.status(429).send({"error": "Too Many Requests"})
+
+    @staticmethod
+    def _key_function(key):
+
+        if callable(key):
+            return key
+
+        if key == 'ip':
+            return lambda req: req.ip
+
+        if key.startswith('header:'):
+            name = key[len('header:'):]
+            return lambda req: req.get(name)
+
+        raise ValueError(f'Invalid rate limit key: {key}')
+
+
+def rate_limit(rate, **options):
+
+    """
+        Returns a middleware that limits each client to `rate` requests per second, for `PyExpress.use` or a route's
+        middlewares. Clients over the limit get a 429 with a Retry-After header.
+        Options:
+            - burst: Requests a client can make at once after being idle (defaults to the rate).
+            - key: What tells clients apart: "ip" (default), "header:<name>" (ie: "header:X-Api-Key"), or a function of
+              the request. Requests without a key aren't limited.
+            - shared: Share the limits between the workers of `listen(processes=...)`. The middleware must be created
+              before listen is called.
+            - max_keys: Clients tracked at once. Past that, the least recently seen ones are forgotten.
+            - headers: Send RateLimit-Limit and RateLimit-Remaining headers.
+            - store: A custom bucket store (see BucketStore).
+    """
+
+    return RateLimit(rate, **options)
@@ -1,46 +1,346 @@
-from urllib.parse import urlparse, parse_qs
-from time import time
+from urllib.parse import parse_qs, unquote, urlsplit
+from time import monotonic, time
+
+from classes.body_parser import content_type_of, iter_json_array, iter_ndjson
 
 class Request:
 
+    """
+        The incoming request. The URL is split once, and the query string, params, cookies and headers are only parsed
+        the first time they're accessed.
+        Per request data (ie: the authenticated user) goes in `req.context`, since requests have no __dict__.
+    """
+
+    __slots__ = (
+        'path',
+        'method',
+        'headers',
+        'client_address',
+        'path_without_query',
+        'query_string',
+        'timestamp',
+        'route',
+        'trace',
+        'body_reader',
+        '_body_parser',
+        '_body',
+        '_body_parsed',
+        '_raw',
+        '_query',
+        '_query_lists',
+        '_params',
+        '_param_names',
+        '_param_values',
+        '_cookies',
+        '_header_map',
+        '_context',
+        '_finish_callbacks',
+    )
+
     def __init__(
         self,
         path,
         method,
         headers,
         body=None,
-        params=None
+        params=None,
+        body_reader=None,
+        body_parser=None,
+        client_address=None,
     ):
         self.path = path
         self.method = method
-        self.headers = headers,
-        self.body = body
-        self.query = self._parse_query_params(path)
-        self.params = params or {}
-        self.path_without_query = urlparse(path).path
+        self.headers = headers
+        # Address of the client, ie: ("203.0.113.7", 51234).
+        self.client_address = client_address
         self.timestamp = time()
 
-    def _parse_query_params(self, path):
-        """Parse the query string parameters and return them as a dictionary."""
-        parsed_url = urlparse(path)
-        query_params = parse_qs(parsed_url.query)
-        return {key: value[0] for key, value in query_params.items()}
+        # Split the URL once.
+        self.path_without_query, self.query_string = split_target(path)
+
+        # Pattern of the matched route (ie: "/users/:id"), None if no route matched.
+        self.route = None
+
+        # Timings of the request's phases (see RequestTrace), when the app's instrumentation is on.
+        self.trace = None
+
+        # File-like reader over the request body (see BodyReader), and the function that parses it on first access.
+        self.body_reader = body_reader
+        self._body_parser = body_parser
+        self._body = body
+        self._body_parsed = body is not None or body_parser is None
+        self._raw = None
+
+        self._query = None
+        self._query_lists = None
+        self._params = params
+        self._param_names = ()
+        self._param_values = ()
+        self._cookies = None
+        self._header_map = None
+        self._context = None
+        self._finish_callbacks = None
+
+    @property
+    def ip(self):
+        """The IP address of the client (None if unknown, ie: over a unix socket)."""
+        if isinstance(self.client_address, tuple) and self.client_address:
+            return self.client_address[0]
+        return None
+
+    def set_route(self, entry, values):
+        """Sets the matched route entry and the values of its params (turned into `params` on first access)."""
+        self.route = entry.route
+        self._param_names = entry.param_names
+        self._param_values = values
+        self._params = None
+
+    @property
+    def query(self):
+        """The query string params, with the first value of each."""
+
+        if self._query is None:
+            self._query = {key: values[0] for key, values in self.query_lists.items()}
+
+        return self._query
+
+    @property
+    def query_lists(self):
+        """The query string params, with every value of each (ie: ?tag=a&tag=b gives {"tag": ["a", "b"]})."""
+
+        if self._query_lists is None:
+            self._query_lists = parse_qs(self.query_string) if self.query_string else {}
+
+        return self._query_lists
+
+    def get_query(self, name, default=None):
+        """The first value of a query string param."""
+        values = self.query_lists.get(name)
+        return values[0] if values else default
+
+    def get_query_list(self, name):
+        """Every value of a query string param."""
+        return self.query_lists.get(name, [])
+
+    @property
+    def params(self):
+        """The values of the route's ":name" segments."""
+
+        if self._params is None:
+            self._params = dict(zip(self._param_names, self._param_values))
+
+        return self._params
+
+    @params.setter
+    def params(self, value):
+        self._params = value
+
+    @property
+    def cookies(self):
+        """The cookies sent with the request."""
+
+        if self._cookies is None:
+            self._cookies = parse_cookies(self.get('Cookie'))
+
+        return self._cookies
+
+    def get(self, name, default=None):
+        """A request header, by its case insensitive name."""
+
+        if self._header_map is None:
+            # Lowercase once, so lookups don't scan the headers. The first of repeated headers wins, like headers.get.
+            self._header_map = {key.lower(): value for key, value in reversed(self.headers.items())} if self.headers else {}
+
+        return self._header_map.get(name.lower(), default)
+
+    @property
+    def context(self):
+        """Dict for middlewares to pass data (ie: the authenticated user) to the next handlers."""
+
+        if self._context is None:
+            self._context = {}
+
+        return self._context
+
+    @property
+    def body(self):
+        """The parsed body, parsed the first time it's accessed."""
+
+        if not self._body_parsed:
+
+            if self.trace is None:
+                self._body = self._body_parser(self)
+            else:
+                started = monotonic()
+                try:
+                    self._body = self._body_parser(self)
+                finally:
+                    self.trace.body_time += monotonic() - started
+
+            self._body_parsed = True
+
+        return self._body
+
+    @body.setter
+    def body(self, value):
+        self._body = value
+        self._body_parsed = True
+
+    @property
+    def raw(self):
+        """The body as bytes (read in full the first time it's accessed)."""
+
+        if self._raw is None:
+
+            if self.body_reader is None:
+                return b''
+
+            self._check_not_streamed()
+            self._raw = self.body_reader.read()
+
+        return self._raw
+
+    def stream(self, chunk_size=64 * 1024):
+        """Yields the body in chunks of up to `chunk_size` bytes as it's read from the connection."""
+
+        # Already in memory.
+        if self._raw is not None:
+            for start in range(0, len(self._raw), chunk_size):
+                yield self._raw[start:start + chunk_size]
+            return
+
+        if self.body_reader is None:
+            return
+
+        self._check_not_streamed()
+
+        while True:
+            chunk = self.body_reader.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def iter_lines(self, chunk_size=64 * 1024, encoding='utf-8'):
+        """Yields the body line by line (without the line break), ie: one record at a time of an NDJSON or CSV upload."""
+
+        pending = b''
+
+        for chunk in self.stream(chunk_size):
+
+            lines = (pending + chunk).split(b'\n')
+
+            # The last piece may be the start of a line that continues in the next chunk.
+            pending = lines.pop()
+
+            for line in lines:
+                yield line.rstrip(b'\r').decode(encoding)
+
+        if pending:
+            yield pending.rstrip(b'\r').decode(encoding)
+
+    def iter_json(self, chunk_size=64 * 1024):
+        """
+            Yields the items of a JSON array body (or the records of an NDJSON one) one at a time, decoded as the body
+            is read, so a large upload is never in memory all at once, ie: to insert its records in batches.
+        """
+
+        if content_type_of(self.headers) == 'application/x-ndjson':
+            return iter_ndjson(self.stream(chunk_size))
+
+        return iter_json_array(self.stream(chunk_size))
+
+    def on_finish(self, callback):
+        """
+            Calls `callback()` once the handlers are done with the request, ie: to give back a resource leased to it
+            (see ResourcePool.lease). The latest added is called first.
+        """
+
+        if self._finish_callbacks is None:
+            self._finish_callbacks = []
+
+        self._finish_callbacks.append(callback)
+
+    def finish(self):
+
+        """Runs the on_finish callbacks. Called by the server, once the handlers are done."""
+
+        callbacks, self._finish_callbacks = self._finish_callbacks, None
+
+        if not callbacks:
+            return
+
+        # Each of them runs, even if one fails.
+        error = None
+
+        for callback in reversed(callbacks):
+            try:
+                callback()
+            except Exception as e:
+                error = error or e
+
+        if error is not None:
+            raise error
+
+    async def load_body(self):
+        """
+            Reads the body ahead of time. Only needed on the asyncio engine, by handlers running on the event loop
+            (`async def` ones and plain middlewares) that use the body of a large request.
+        """
+
+        load = getattr(self.body_reader.rfile, 'load', None) if self.body_reader is not None else None
+
+        if load is not None:
+            self._check_not_streamed()
+            await load(self.body_reader.remaining)
+
+    def _check_not_streamed(self):
+        if self.body_reader.remaining != self.body_reader.content_length:
+            raise ValueError('Request body was already consumed')
 
     def __repr__(self):
-        return f"Request(path={self.path}, method={self.method}, query={self.query}, params={self.params}, body={self.body})"
-    
-    # Parse the params.
-    def parse_params(self, route):
+        # Don't parse the body just to print it.
+        body = self._body if self._body_parsed else '<not parsed>'
+        return f"Request(path={self.path}, method={self.method}, query={self.query}, params={self.params}, body={body})"
+
+
+def split_target(path):
+
+    """
+        Splits a request target into its path and query string. Absolute URLs (ie: GET http://host/path) are rare,
+        they go through urlsplit.
+    """
+
+    target, _, query_string = path.partition('?')
+
+    return (target if target.startswith('/') else urlsplit(target).path), query_string
+
+
+def parse_cookies(header):
+
+    """
+        Parses a Cookie header into a dict. Malformed pairs are skipped, and the first of repeated names wins.
+    """
+
+    cookies = {}
+
+    if not header:
+        return cookies
+
+    for pair in header.split(';'):
+
+        name, separator, value = pair.partition('=')
+
+        name = name.strip()
+
+        if not separator or not name or name in cookies:
+            continue
 
-        # Split both the route and the path by /
-        route_split = route.split('/')
-        
-        path_split = self.path_without_query.split('/')
+        value = value.strip()
 
-        params = {}
+        # Quoted values.
+        if len(value) >= 2 and value[0] == value[-1] == '"':
+            value = value[1:-1]
 
-        for i in range(len(route_split)):
-            if route_split[i].startswith(':') and path_split[i] != '':
-                params[route_split[i][1:]] = path_split[i]
+        cookies[name] = unquote(value)
 
-        self.params = params
+    return cookies
@@ -0,0 +1,395 @@
+import asyncio
+import inspect
+import os
+import threading
+import time
+from collections import deque
+
+from classes.admission import Waiter
+from classes.errors import PoolTimeout
+
+
+class State:
+
+    """
+        What the app shares between requests (ie: pools, clients, settings), as `app.state`. Subclass it with
+        annotations to have its attributes typed, ie:
+
+            class AppState(State):
+                db: ResourcePool
+
+            app = PyExpress(state=AppState())
+    """
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{name}={value!r}' for name, value in vars(self).items())})"
+
+
+# Handed to a waiting acquire instead of a resource: a resource was discarded, so it may create one in its place.
+_CREATE = object()
+# Handed to the waiting acquires when the pool is closed.
+_CLOSED = object()
+
+
+class ResourcePool:
+
+    """
+        Bounded pool of resources that are costly to set up (ie: database connections, HTTP clients), reused from one
+        request to the next. Resources are created on demand, up to `max_size`.
+        - create: Function that returns a new resource (`async def` too, with acquire_async).
+        - close: Function that closes a resource.
+        - check: Function that returns whether an idle resource still works (ie: runs "SELECT 1"). Resources that
+          were idle for `check_after` seconds are checked before they're leased, and replaced if they fail.
+        - min_size: Resources kept open even when idle (see open()).
+        - acquire_timeout: Longest wait for a free resource, in seconds. Past that, PoolTimeout (a 503).
+        - max_idle: Seconds after which an idle resource is closed (beyond `min_size`).
+        Pools can be created before the server forks its workers: each process only uses the resources it created.
+    """
+
+    def __init__(
+        self,
+        create,
+        close=None,
+        check=None,
+        max_size=10,
+        min_size=0,
+        acquire_timeout=5.0,
+        max_idle=300.0,
+        check_after=30.0,
+    ):
+
+        if max_size < 1:
+            raise ValueError('max_size must be at least 1')
+
+        if min_size > max_size:
+            raise ValueError('min_size can\'t be more than max_size')
+
+        self.create = create
+        self.close_resource = close
+        self.check = check
+        self.max_size = max_size
+        self.min_size = min_size
+        self.acquire_timeout = acquire_timeout
+        self.max_idle = max_idle
+        self.check_after = check_after
+
+        # (resource, time it was released) of the idle resources, the most recently used on the right.
+        self._idle = deque()
+        # Resources open (idle, leased or being created).
+        self._size = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._pid = os.getpid()
+
+        self.created = 0
+        self.discarded = 0
+        self.timeouts = 0
+
+    def stats(self):
+        return {
+            "size": self._size,
+            "idle": len(self._idle),
+            "leased": self._size - len(self._idle),
+            "waiting": len(self._waiters),
+            "created": self.created,
+            "discarded": self.discarded,
+            "timeouts": self.timeouts,
+        }
+
+    # Acquire
+    def acquire(self, timeout=None):
+
+        """
+            Leases a resource, waiting up to `timeout` seconds (`acquire_timeout` by default) for one to be free.
+            It must be given back with release().
+        """
+
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+
+        while True:
+
+            grant = self._enter(None)
+
+            if isinstance(grant, Waiter):
+                grant.event.wait(max(0.0, deadline - time.monotonic()))
+                grant = self._leave(grant)
+
+            if grant is _CREATE:
+                return self._create(self.create)
+
+            resource, released = grant
+
+            if self.check is None or time.monotonic() - released < self.check_after:
+                return resource
+
+            if self._healthy(self.check, resource):
+                return resource
+
+            self._replace(resource)
+
+    async def acquire_async(self, timeout=None):
+
+        """Same as acquire(), for the asyncio engine. `create` and `check` can be `async def`."""
+
+        deadline = time.monotonic() + (self.acquire_timeout if timeout is None else timeout)
+
+        while True:
+
+            grant = self._enter(asyncio.get_running_loop())
+
+            if isinstance(grant, Waiter):
+                try:
+                    await asyncio.wait_for(asyncio.shield(grant.future), max(0.0, deadline - time.monotonic()))
+                except asyncio.TimeoutError:
+                    pass
+                grant = self._leave(grant)
+
+            if grant is _CREATE:
+                resource = self._create(self.create)
+                return await resource if inspect.isawaitable(resource) else resource
+
+            resource, released = grant
+
+            if self.check is None or time.monotonic() - released < self.check_after:
+                return resource
+
+            healthy = self._healthy(self.check, resource)
+
+            if await healthy if inspect.isawaitable(healthy) else healthy:
+                return resource
+
+            self._replace(resource)
+
+    def release(self, resource, discard=False):
+
+        """
+            Gives a leased resource back, for the next request. With `discard`, it's closed instead (ie: it broke
+            while it was used) and another one will be created in its place.
+        """
+
+        if discard or self._closed or self._pid != os.getpid():
+            self._replace(resource)
+            return
+
+        now = time.monotonic()
+
+        with self._lock:
+
+            expired = self._expire(now)
+
+            waiter = self._waiters.popleft() if self._waiters else None
+
+            # Straight to the oldest waiting acquire, so waiting requests are served in order.
+            if waiter is None:
+                self._idle.append((resource, now))
+            else:
+                waiter.grant((resource, now))
+
+        if waiter is not None:
+            waiter.wake()
+
+        for resource in expired:
+            self._close(resource)
+
+    # Lease
+    def lease(self, name):
+
+        """
+            Returns a middleware that leases a resource to each request, as `req.context[name]`, and gives it back
+            once the handlers are done. Requests get a 503 when none is free within `acquire_timeout`.
+            Leased resources stay in this process, they can't be used by `execution="process"` controllers.
+        """
+
+        async def lease_async(req, next):
+            resource = await self.acquire_async()
+            req.on_finish(lambda: self.release(resource))
+            req.context[name] = resource
+            await next()
+
+        def lease(req, res, next):
+
+            # On the event loop (asyncio engine), wait without blocking it.
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                pass
+            else:
+                return lease_async(req, next)
+
+            resource = self.acquire()
+            req.on_finish(lambda: self.release(resource))
+            req.context[name] = resource
+            next()
+
+        lease.__name__ = f'lease_{name}'
+
+        return lease
+
+    # Open and close
+    def open(self):
+
+        """Creates `min_size` resources up front (ie: from an on_startup hook), rather than on the first requests."""
+
+        resources = [self.acquire() for _ in range(self.min_size - self._size)]
+
+        for resource in resources:
+            self.release(resource)
+
+    def close(self):
+
+        """Closes the idle resources, and the leased ones as they're released (ie: from an on_shutdown hook)."""
+
+        with self._lock:
+            self._closed = True
+            idle = [resource for resource, _ in self._idle]
+            self._idle.clear()
+            self._size -= len(idle)
+            waiters, self._waiters = self._waiters, deque()
+
+            for waiter in waiters:
+                waiter.grant(_CLOSED)
+
+        for waiter in waiters:
+            waiter.wake()
+
+        for resource in idle:
+            self._close(resource)
+
+    def _enter(self, loop):
+
+        # Returns an idle (resource, released), _CREATE when a new one can be created, or the Waiter to wait on.
+        with self._lock:
+
+            if self._closed:
+                raise RuntimeError('The pool is closed.')
+
+            # Forked: the resources belong to the parent process, leave them to it.
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._idle.clear()
+                self._waiters.clear()
+                self._size = 0
+
+            expired = self._expire(time.monotonic())
+
+            if self._idle:
+                grant = self._idle.pop()
+            elif self._size < self.max_size:
+                self._size += 1
+                grant = _CREATE
+            else:
+                grant = Waiter(loop)
+                self._waiters.append(grant)
+
+        for resource in expired:
+            self._close(resource)
+
+        return grant
+
+    def _leave(self, waiter):
+
+        with self._lock:
+
+            # Handed a resource (possibly right as the wait timed out).
+            if waiter.granted:
+                if waiter.value is _CLOSED:
+                    raise RuntimeError('The pool is closed.')
+                return waiter.value
+
+            self._waiters.remove(waiter)
+            self.timeouts += 1
+
+        raise PoolTimeout('No resource available')
+
+    def _expire(self, now):
+
+        # Idle resources unused for longer than max_idle, oldest first, beyond min_size. Called with the lock held.
+        expired = []
+
+        while self._idle and self._size > self.min_size and now - self._idle[0][1] > self.max_idle:
+            expired.append(self._idle.popleft()[0])
+            self._size -= 1
+
+        return expired
+
+    def _create(self, create):
+
+        try:
+            resource = create()
+        except BaseException:
+            self._free_place()
+            raise
+
+        # An `async def` create, awaited by acquire_async.
+        if inspect.isawaitable(resource):
+            return self._await_created(resource)
+
+        self.created += 1
+
+        return resource
+
+    async def _await_created(self, awaitable):
+
+        try:
+            resource = await awaitable
+        except BaseException:
+            self._free_place()
+            raise
+
+        self.created += 1
+
+        return resource
+
+    def _healthy(self, check, resource):
+
+        try:
+            healthy = check(resource)
+        except Exception:
+            healthy = False
+
+        if inspect.isawaitable(healthy):
+            return self._await_check(healthy)
+
+        return healthy
+
+    async def _await_check(self, awaitable):
+        try:
+            return await awaitable
+        except Exception:
+            return False
+
+    def _replace(self, resource):
+        self.discarded += 1
+        self._close(resource)
+        self._free_place()
+
+    def _free_place(self):
+
+        # A resource was closed (or failed to be created): the next waiting acquire may create one in its place.
+        with self._lock:
+
+            waiter = self._waiters.popleft() if self._waiters else None
+
+            if waiter is None:
+                self._size -= 1
+            else:
+                waiter.grant(_CREATE)
+
+        if waiter is not None:
+            waiter.wake()
+
+    def _close(self, resource):
+
+        if self.close_resource is None:
+            return
+
+        # A resource that's being thrown away may well be broken already, failing to close it changes nothing.
+        try:
+            result = self.close_resource(resource)
+
+            if inspect.isawaitable(result):
+                asyncio.get_running_loop().create_task(result)
+
+        except Exception:
+            pass
@@ -1,49 +1,322 @@
-import json
+import mimetypes
+import os
+
+from classes.errors import HTTPError
+from classes.serialization import BYTES_TYPES, default_json_encoder, http_date, status_line
+
+
+# Bodies up to this size are sent in the same write as the headers (bigger ones aren't copied just for that).
+MAX_COALESCED_BODY = 64 * 1024
+
+# Used by responses created without the app's encoder.
+_default_json_encoder = default_json_encoder()
+
 
 class Response:
 
-    def __init__(self, server, path, headers, method):
+    def __init__(self, server, path, headers, method, json_encoder=None):
         self.server = server
         self.path = path
         self.method = method
-        self.headers = headers
+        self.request_headers = headers
+        # Headers sent with the response.
+        self.headers = {}
         self.body = None
         self.status_code = 200
         self.is_sent = False
+        # (Compression, encoding) when the compression middleware negotiated an encoding with the client.
+        self.compression = None
+        # Function that turns dicts and lists into JSON bytes (see PyExpress json_encoder).
+        self.json_encoder = json_encoder or _default_json_encoder
+        # When `capture` is set (by a route cache), send_bytes keeps (status, headers, body, content type) in `captured`.
+        self.capture = False
+        self.captured = None
+        # Bytes written to the connection (status line and headers included).
+        self.bytes_sent = 0
+        # Trace of the request (see RequestTrace), when the app's instrumentation is on.
+        self.trace = None
 
     def send(self, body=None):
 
         if self.is_sent:
             raise Exception('Response was already sent to client.')
-        
+
         if body is not None:
             self.body = body
-        
-        # Send the status code
-        self.server.send_response(self.status_code)
 
-        # Send the headers.
-        for header_name, header_value in self.headers.items():
-            self.server.send_header(header_name, header_value)
+        body = self.body
+
+        # Bytes are sent untouched.
+        if isinstance(body, BYTES_TYPES):
+            return self.send_bytes(body)
+
+        if isinstance(body, (dict, list)):
+            payload = self.json_encoder(body)
+            if isinstance(payload, str):
+                payload = payload.encode()
+        else:
+            payload = str(body).encode()
+
+        self.send_bytes(payload, 'application/json')
+
+    # Send bytes
+    def send_bytes(self, data, content_type='application/octet-stream', cache_key=None):
+
+        """
+            Sends `data` as is (compressed, if the compression middleware is used).
+            Bodies sent with a `cache_key` are only compressed once, for as long as the key stays the same.
+        """
+
+        if self.is_sent:
+            raise Exception('Response was already sent to client.')
+
+        if self.capture:
+            self.captured = (self.status_code, dict(self.headers), bytes(data), content_type)
+
+        if self.compression is not None:
+            data = self._compress(data, content_type, cache_key)
+
+        # Always frame the body, so the connection can be reused for the next request.
+        self._send_head(content_type, content_length=len(data), body=data)
+
+    # End
+    def end(self):
+
+        """
+            Sends the status and headers without a body (ie: for a 204 or a 304).
+        """
+
+        if self.is_sent:
+            raise Exception('Response was already sent to client.')
+
+        # 1xx, 204 and 304 responses never have a body, so they don't need framing.
+        no_body = self.status_code < 200 or self.status_code in (204, 304)
+
+        self._send_head(None, content_length=None if no_body else 0)
+
+    # Stream
+    def stream(self, iterable, content_type='application/octet-stream'):
+
+        """
+            Sends the chunks (bytes or str) produced by `iterable` as they come, with chunked transfer encoding, so the
+            whole body never has to be in memory.
+        """
+
+        if self.is_sent:
+            raise Exception('Response was already sent to client.')
+
+        # HTTP/1.0 clients don't understand chunks, the end of the body is the end of the connection.
+        chunked = self.server.request_version != 'HTTP/1.0'
+
+        if not chunked:
+            self.server.close_connection = True
+
+        chunks = (chunk.encode() if isinstance(chunk, str) else chunk for chunk in iterable)
+
+        if self.compression is not None and self._use_compression(content_type):
+            compressor, encoding = self.compression
+            self.set_header('Content-Encoding', encoding)
+            chunks = compressor.compress_stream(chunks, encoding)
+
+        self._send_head(content_type, chunked=chunked)
+
+        if self.method == 'HEAD':
+            return
+
+        try:
+            for chunk in chunks:
+
+                # An empty chunk would end the body.
+                if not chunk:
+                    continue
+
+                if chunked:
+                    chunk = b'%x\r\n%b\r\n' % (len(chunk), chunk)
+
+                self.server.wfile.write(chunk)
+                self.bytes_sent += len(chunk)
+
+        except BaseException:
+            # The client can't tell the body is incomplete unless the connection is dropped.
+            self.server.close_connection = True
+            raise
+
+        if chunked:
+            self.server.wfile.write(b'0\r\n\r\n')
+            self.bytes_sent += 5
+
+    # Send file
+    def send_file(self, path, content_type=None, offset=0, count=None):
+
+        """
+            Sends (`count` bytes from `offset` of) a file. The bytes go straight from the file to the socket with
+            os.sendfile, never through Python (so they're never compressed). `count` is cut to what's left of the file
+            after `offset`. The Content-Type is guessed from the file name unless given.
+        """
+
+        if self.is_sent:
+            raise Exception('Response was already sent to client.')
 
-        self.server.send_header('Content-Type', 'application/json')
-        self.server.end_headers()
+        try:
+            file = open(path, 'rb')
+        except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+            raise HTTPError(status_code=404)
 
-        # Send the body
-        self.server.wfile.write(
-            json.dumps(self.body).encode() if isinstance(self.body, (dict, list)) else str(self.body).encode()
-        )
+        try:
+            size = os.fstat(file.fileno()).st_size
 
-        self.server.is_sent = True
+            if offset < 0 or offset > size:
+                raise ValueError(f'offset {offset} is out of range for a file of {size} bytes')
+
+            if count is not None and count < 0:
+                raise ValueError('count can\'t be negative')
+
+            # No more than what's left of the file, Content-Length must match what sendfile writes.
+            count = size - offset if count is None else min(count, size - offset)
+
+            if content_type is None:
+                content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+            self._send_head(content_type, content_length=count)
+
+            if count and self.method != 'HEAD':
+                self.server.sendfile(file, offset, count)
+                self.bytes_sent += count
+
+        finally:
+            file.close()
 
     def status(self, status_code):
         self.status_code = status_code
         return self
-    
+
+    # Set header
+    def set_header(self, name, value):
+
+        """
+            Sets a header to send with the response (replacing any header with the same name).
+        """
+
+        for existing in [key for key in self.headers if key.lower() == name.lower()]:
+            del self.headers[existing]
+
+        self.headers[name] = value
+
+        return self
+
+    # Get header
+    def get_header(self, name, default=None):
+        for key, value in self.headers.items():
+            if key.lower() == name.lower():
+                return value
+        return default
+
     # JSON
     def json(self, body):
 
         if not body:
             raise ValueError('Invalid body')
 
-        self.send(body)
\ No newline at end of file
+        self.send(body)
+
+    def _compress(self, data, content_type, cache_key):
+
+        if not self._use_compression(content_type):
+            return data
+
+        compressor, encoding = self.compression
+
+        # Not worth it (or, for 206s, the ranges are of the uncompressed body).
+        if len(data) < compressor.min_size or self.status_code in (204, 206, 304):
+            return data
+
+        self.set_header('Content-Encoding', encoding)
+
+        # HEAD responses are compressed too, so their Content-Length is the one a GET gets.
+        return compressor.compress(data, encoding, cache_key)
+
+    def _use_compression(self, content_type):
+
+        compressor, _ = self.compression
+
+        # Already encoded by the handler, or not compressible.
+        if self.get_header('Content-Encoding') is not None:
+            return False
+
+        if not compressor.compressible(self.get_header('Content-Type', content_type)):
+            return False
+
+        # Caches must keep the compressed and uncompressed bodies apart.
+        vary = self.get_header('Vary')
+        if vary is None:
+            self.set_header('Vary', 'Accept-Encoding')
+        elif 'accept-encoding' not in vary.lower() and vary.strip() != '*':
+            self.set_header('Vary', f'{vary}, Accept-Encoding')
+
+        return True
+
+    def _send_head(self, content_type, content_length=None, chunked=False, body=None):
+
+        """
+            Writes the status line and headers (and `body`, unless it's a HEAD request) with a single write where
+            possible.
+        """
+
+        server = self.server
+
+        head = [status_line(self.status_code), 'Date: ', http_date(), '\r\n']
+
+        # Headers set by the handler.
+        for header_name, header_value in self.headers.items():
+            head.append(f'{header_name}: {header_value}\r\n')
+
+        # Headers set by the handler win.
+        if content_type is not None and self.get_header('Content-Type') is None:
+            head.append(f'Content-Type: {content_type}\r\n')
+
+        if content_length is not None:
+            head.append(f'Content-Length: {content_length}\r\n')
+        elif chunked:
+            head.append('Transfer-Encoding: chunked\r\n')
+
+        connection_header = self._connection_header()
+        if connection_header is not None:
+            head.append(connection_header)
+
+        head.append('\r\n')
+
+        data = ''.join(head).encode('latin-1')
+
+        if body is not None and self.method != 'HEAD':
+
+            if len(body) <= MAX_COALESCED_BODY:
+                data += body
+            else:
+                server.wfile.write(data)
+                self.bytes_sent += len(data)
+                data = body
+
+        server.wfile.write(data)
+        self.bytes_sent += len(data)
+
+        self.is_sent = True
+
+    def _connection_header(self):
+
+        connection = self.get_header('Connection')
+
+        # Set by the handler.
+        if connection is not None:
+            if connection.lower() == 'close':
+                self.server.close_connection = True
+            return None
+
+        # The server decided to close after this response (client asked for it, or the connection hit its limits).
+        if self.server.close_connection:
+            return 'Connection: close\r\n'
+
+        # HTTP/1.0 clients only keep the connection open if told so.
+        if self.server.request_version == 'HTTP/1.0':
+            return 'Connection: keep-alive\r\n'
+
+        return None
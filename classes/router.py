@@ -0,0 +1,141 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class RouteEntry:
+
+    """A leaf of the route tree: the registered pattern and its pipeline for one method."""
+
+    __slots__ = ('route', 'pipeline', 'param_names')
+
+    def __init__(self, route: str, pipeline: Any, param_names: Tuple[str, ...]):
+        self.route = route
+        self.pipeline = pipeline
+        self.param_names = param_names
+
+
+class RouteNode:
+
+    """A single path segment in the route tree."""
+
+    __slots__ = ('static', 'param', 'methods')
+
+    def __init__(self):
+
+        # Children keyed by the literal segment.
+        self.static: Dict[str, 'RouteNode'] = {}
+
+        # Child for any ":name" segment (names live on the leaf, so they can differ between routes).
+        self.param: Optional['RouteNode'] = None
+
+        # Map from method to the route entry that ends on this node.
+        self.methods: Dict[str, RouteEntry] = {}
+
+
+class Router:
+
+    """
+        Segment trie used to match paths against the registered routes.
+        Static segments take precedence over ":param" segments, and matching backtracks if a static branch
+        doesn't lead to a route for the method. The cost of a match depends on the depth of the path, not on
+        the number of routes.
+    """
+
+    def __init__(self):
+        self.root = RouteNode()
+
+    # Add
+    def add(self, route: str, method: str, pipeline: Any) -> RouteEntry:
+
+        """
+            Inserts (or replaces) the pipeline for a route pattern and method.
+        """
+
+        node = self.root
+        param_names = []
+
+        for segment in route.split('/'):
+
+            # Param segment => shared param child.
+            if segment.startswith(':'):
+                if node.param is None:
+                    node.param = RouteNode()
+                node = node.param
+                param_names.append(segment[1:])
+
+            # Static segment.
+            else:
+                child = node.static.get(segment)
+                if child is None:
+                    child = node.static[segment] = RouteNode()
+                node = child
+
+        entry = RouteEntry(route, pipeline, tuple(param_names))
+
+        node.methods[method] = entry
+
+        return entry
+
+    # Match
+    def match(self, path: str, method: str) -> Optional[Tuple[RouteEntry, Dict[str, str]]]:
+
+        """
+            Finds the route for a path (without query string) and method.
+            Returns the route entry and the params dict, or None if nothing matches.
+            HEAD requests fall back to the GET route of the path.
+        """
+
+        match = self.lookup(path, method)
+
+        if match is None:
+            return None
+
+        entry, values = match
+
+        return entry, dict(zip(entry.param_names, values))
+
+    # Lookup
+    def lookup(self, path: str, method: str) -> Optional[Tuple[RouteEntry, List[str]]]:
+
+        """
+            Same as match(), but gives back the param values as a list (in the order of entry.param_names), so the
+            params dict is only built if it's used.
+        """
+
+        values = []
+
+        segments = path.split('/')
+
+        entry = self._walk(self.root, segments, 0, method, values)
+
+        if entry is None and method == 'HEAD':
+            entry = self._walk(self.root, segments, 0, 'GET', values)
+
+        if entry is None:
+            return None
+
+        return entry, values
+
+    def _walk(self, node: RouteNode, segments: List[str], index: int, method: str, values: List[str]) -> Optional[RouteEntry]:
+
+        # Reached the end of the path, check if there's a route for the method here.
+        if index == len(segments):
+            return node.methods.get(method)
+
+        segment = segments[index]
+
+        # Try the static child first.
+        child = node.static.get(segment)
+        if child is not None:
+            entry = self._walk(child, segments, index + 1, method, values)
+            if entry is not None:
+                return entry
+
+        # Fall back to the param child (params never match empty segments).
+        if node.param is not None and segment != '':
+            values.append(segment)
+            entry = self._walk(node.param, segments, index + 1, method, values)
+            if entry is not None:
+                return entry
+            values.pop()
+
+        return None
@@ -0,0 +1,87 @@
+import json
+import time
+from email.utils import formatdate
+from http import HTTPStatus
+
+
+# Status lines, ready to send.
+STATUS_LINES = {status.value: f'HTTP/1.1 {status.value} {status.phrase}\r\n' for status in HTTPStatus}
+
+# Body types sent as they are.
+BYTES_TYPES = (bytes, bytearray, memoryview)
+
+
+def compact_json_encoder():
+
+    """
+        Returns a function that encodes a value to compact JSON bytes (no spaces after separators).
+    """
+
+    encode = json.JSONEncoder(separators=(',', ':'), ensure_ascii=False).encode
+
+    def encoder(value):
+        return encode(value).encode()
+
+    return encoder
+
+
+def default_json_encoder():
+
+    """
+        Returns the JSON encoder used when the app doesn't set one: orjson if it's installed, otherwise the standard
+        library with compact separators.
+    """
+
+    try:
+        import orjson
+    except ImportError:
+        return compact_json_encoder()
+
+    return orjson.dumps
+
+
+def status_line(status_code):
+
+    line = STATUS_LINES.get(status_code)
+
+    if line is None:
+        line = f'HTTP/1.1 {status_code} \r\n'
+
+    return line
+
+
+_date_cache = (0, '')
+
+
+def http_date():
+
+    """
+        The current date for the Date header. It only changes once per second, so it's only formatted once per second.
+    """
+
+    global _date_cache
+
+    now = int(time.time())
+    second, value = _date_cache
+
+    if second != now:
+        value = formatdate(now, usegmt=True)
+        _date_cache = (now, value)
+
+    return value
+
+
+def error_response(status_code, headers=()):
+
+    """
+        A complete response that closes the connection, for errors answered outside of the handlers (ie: a request
+        head that took too long).
+    """
+
+    body = ('{"error":"%s"}' % HTTPStatus(status_code).phrase).encode()
+
+    head = [status_line(status_code), f'Date: {http_date()}\r\n']
+    head.extend(f'{name}: {value}\r\n' for name, value in headers)
+    head.append(f'Content-Type: application/json\r\nContent-Length: {len(body)}\r\nConnection: close\r\n\r\n')
+
+    return ''.join(head).encode('latin-1') + body
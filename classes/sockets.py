@@ -0,0 +1,89 @@
+import os
+import socket
+import stat
+
+
+def create_listen_socket(host, port, backlog, reuse_port=False):
+
+    """
+        Creates a TCP socket bound to (host, port) and listening with the given backlog.
+        With `reuse_port`, SO_REUSEPORT is set so several processes can bind the same address and let the kernel
+        balance connections between them.
+    """
+
+    family, _, _, _, address = socket.getaddrinfo(
+        host, port, type=socket.SOCK_STREAM, flags=socket.AI_PASSIVE)[0]
+
+    sock = socket.socket(family, socket.SOCK_STREAM)
+
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+
+        if reuse_port:
+            if not hasattr(socket, 'SO_REUSEPORT'):
+                raise ValueError('SO_REUSEPORT is not supported on this platform')
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
+        sock.bind(address)
+        sock.listen(backlog)
+    except BaseException:
+        sock.close()
+        raise
+
+    return sock
+
+
+def create_unix_socket(path, backlog, mode=None):
+
+    """
+        Creates a unix domain socket bound to `path` and listening with the given backlog (ie: for a reverse proxy on
+        the same host, which is spared the TCP stack). A socket file left at `path` by a previous run is replaced.
+        With `mode`, the socket file gets those permissions (ie: 0o660 for the proxy's group to connect).
+    """
+
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise ValueError(f'{path} exists and is not a socket')
+        os.unlink(path)
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    try:
+        sock.bind(path)
+
+        if mode is not None:
+            os.chmod(path, mode)
+
+        sock.listen(backlog)
+    except BaseException:
+        sock.close()
+        raise
+
+    return sock
+
+
+def adopt_socket(sock):
+
+    """
+        Returns the listening socket to serve from, given as a socket or as a file descriptor (ie: 3 for the first one
+        passed by systemd socket activation, or one inherited from a parent process). Its family is read from the
+        descriptor, so TCP and unix sockets both work.
+    """
+
+    if isinstance(sock, int):
+        sock = socket.socket(fileno=sock)
+
+    if sock.type != socket.SOCK_STREAM:
+        raise ValueError('The socket must be a stream socket')
+
+    if hasattr(socket, 'SO_ACCEPTCONN') and not sock.getsockopt(socket.SOL_SOCKET, socket.SO_ACCEPTCONN):
+        raise ValueError('The socket must be listening')
+
+    return sock
+
+
+def describe_address(address):
+    """Readable address of a listening socket, ie: "127.0.0.1:3000" or "unix:/run/app.sock"."""
+    if isinstance(address, tuple):
+        return f'{address[0]}:{address[1]}'
+    return f'unix:{address}'
@@ -0,0 +1,297 @@
+import mimetypes
+import os
+import stat
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import unquote
+
+from classes.lru import LRUCache
+
+
+class StatCache:
+
+    """
+        Caches os.stat() results (including misses) for `ttl` seconds, so a burst of requests for the same files
+        doesn't turn into a burst of syscalls. Shared by the worker threads.
+    """
+
+    def __init__(self, ttl=1.0):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def stat(self, path):
+
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(path)
+
+        if entry is not None and entry[0] > now:
+            return entry[1]
+
+        # Paths that can't be read (ie: no permission, or a NUL byte from %00) are served as missing.
+        try:
+            result = os.stat(path)
+        except (OSError, ValueError):
+            result = None
+
+        with self._lock:
+
+            # Drop expired entries from time to time, so the cache doesn't grow with every path ever requested.
+            if len(self._entries) > 10000:
+                self._entries = {key: value for key, value in self._entries.items() if value[0] > now}
+
+            self._entries[path] = (now + self.ttl, result)
+
+        return result
+
+
+class FileCache:
+
+    """
+        LRU cache of small file contents, bounded to `max_size` bytes in total.
+        Entries are keyed by path and checked against the file's mtime and size, so changed files are re-read.
+    """
+
+    def __init__(self, max_size=16 * 1024 * 1024):
+        self._entries = LRUCache(max_size, sizeof=lambda entry: len(entry[1]))
+
+    @property
+    def size(self):
+        return self._entries.size
+
+    def get(self, path, file_stat):
+
+        entry = self._entries.get(path)
+
+        if entry is None:
+            return None
+
+        # The file changed since it was cached.
+        if entry[0] != (file_stat.st_mtime_ns, file_stat.st_size):
+            self._entries.pop(path)
+            return None
+
+        return entry[1]
+
+    def put(self, path, file_stat, data):
+        self._entries.put(path, ((file_stat.st_mtime_ns, file_stat.st_size), data))
+
+
+class StaticFiles:
+
+    """
+        Middleware that serves the files under `root` (see `static`).
+    """
+
+    def __init__(
+        self,
+        root,
+        prefix='',
+        index='index.html',
+        max_age=0,
+        stat_ttl=1.0,
+        cache_size=16 * 1024 * 1024,
+        cache_file_size=64 * 1024,
+    ):
+        self.root = os.path.realpath(root)
+        self.prefix = prefix.rstrip('/')
+        self.index = index
+        self.max_age = max_age
+        self.cache_file_size = cache_file_size
+        self.stats = StatCache(stat_ttl)
+        self.cache = FileCache(cache_size) if cache_size else None
+
+    def __call__(self, req, res, next):
+
+        if req.method not in ('GET', 'HEAD'):
+            return next()
+
+        path = self._resolve(req.path_without_query)
+
+        file_stat = self.stats.stat(path) if path else None
+
+        # Directories are served through their index file.
+        if file_stat is not None and stat.S_ISDIR(file_stat.st_mode) and self.index:
+            path = os.path.join(path, self.index)
+            file_stat = self.stats.stat(path)
+
+        if file_stat is None or not stat.S_ISREG(file_stat.st_mode):
+            return next()
+
+        self._send(req, res, path, file_stat)
+
+    def _resolve(self, url_path):
+
+        # Only paths under the prefix.
+        if self.prefix:
+            if url_path != self.prefix and not url_path.startswith(self.prefix + '/'):
+                return None
+            url_path = url_path[len(self.prefix):]
+
+        path = os.path.normpath(os.path.join(self.root, unquote(url_path).lstrip('/')))
+
+        # Never go outside the root (ie: /../../etc/passwd).
+        if path != self.root and not path.startswith(self.root + os.sep):
+            return None
+
+        return path
+
+    def _send(self, req, res, path, file_stat):
+
+        size = file_stat.st_size
+        etag = f'W/"{size:x}-{file_stat.st_mtime_ns:x}"'
+
+        res.set_header('ETag', etag)
+        res.set_header('Last-Modified', formatdate(file_stat.st_mtime, usegmt=True))
+        res.set_header('Accept-Ranges', 'bytes')
+        res.set_header('Cache-Control', f'public, max-age={self.max_age}')
+
+        headers = req.headers
+
+        if self._not_modified(headers, etag, file_stat):
+            return res.status(304).end()
+
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+
+        offset, count = 0, size
+
+        # Byte range, unless If-Range says the client's copy is outdated.
+        range_header = headers.get('Range')
+        if range_header and self._if_range_matches(headers.get('If-Range'), etag, file_stat):
+
+            byte_range = parse_range(range_header, size)
+
+            if byte_range == 'unsatisfiable':
+                res.set_header('Content-Range', f'bytes */{size}')
+                return res.status(416).end()
+
+            if byte_range is not None:
+                offset, count = byte_range
+                res.status(206).set_header('Content-Range', f'bytes {offset}-{offset + count - 1}/{size}')
+
+        whole = offset == 0 and count == size
+
+        # A gzipped copy next to the file (ie: app.js.gz) is sent as is, instead of compressing the file.
+        if whole and res.compression is not None and res.compression[1] == 'gzip':
+            if self._send_precompressed(res, path, file_stat, content_type):
+                return
+
+        # Small files are served from memory.
+        if self.cache is not None and size <= self.cache_file_size:
+
+            data = self.cache.get(path, file_stat)
+
+            if data is None:
+                with open(path, 'rb') as file:
+                    data = file.read()
+                self.cache.put(path, file_stat, data)
+
+            # The compressed variant of the whole file is kept until the file changes.
+            cache_key = (path, file_stat.st_mtime_ns, size) if whole else None
+
+            return res.send_bytes(data[offset:offset + count], content_type, cache_key=cache_key)
+
+        res.send_file(path, content_type=content_type, offset=offset, count=count)
+
+    def _send_precompressed(self, res, path, file_stat, content_type):
+
+        if not res.compression[0].compressible(content_type):
+            return False
+
+        gzip_stat = self.stats.stat(path + '.gz')
+
+        # Missing, or older than the file (so probably outdated).
+        if gzip_stat is None or not stat.S_ISREG(gzip_stat.st_mode) or gzip_stat.st_mtime < file_stat.st_mtime:
+            return False
+
+        res.set_header('Content-Encoding', 'gzip')
+        res.set_header('Vary', 'Accept-Encoding')
+        res.send_file(path + '.gz', content_type=content_type)
+
+        return True
+
+    def _not_modified(self, headers, etag, file_stat):
+
+        if_none_match = headers.get('If-None-Match')
+
+        # If-None-Match takes precedence over If-Modified-Since.
+        if if_none_match is not None:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or etag in tags or etag[2:] in tags
+
+        if_modified_since = headers.get('If-Modified-Since')
+
+        if if_modified_since is not None:
+            try:
+                return int(file_stat.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+
+        return False
+
+    def _if_range_matches(self, if_range, etag, file_stat):
+
+        if if_range is None:
+            return True
+
+        if if_range.startswith(('"', 'W/')):
+            return if_range == etag
+
+        return if_range == formatdate(file_stat.st_mtime, usegmt=True)
+
+
+def parse_range(header, size):
+
+    """
+        Parses a Range header for a file of `size` bytes into (offset, count).
+        Returns None if the header should be ignored (not bytes, or several ranges), and 'unsatisfiable' if the range
+        is outside the file.
+    """
+
+    unit, _, ranges = header.partition('=')
+
+    if unit.strip() != 'bytes' or ',' in ranges:
+        return None
+
+    start, _, end = ranges.strip().partition('-')
+
+    try:
+        # Suffix range, ie: the last 500 bytes.
+        if not start:
+            length = int(end)
+            if length <= 0:
+                return 'unsatisfiable'
+            return max(0, size - length), min(length, size)
+
+        start = int(start)
+        end = int(end) if end else size - 1
+
+    except ValueError:
+        return None
+
+    if start >= size or end < start:
+        return 'unsatisfiable'
+
+    end = min(end, size - 1)
+
+    return start, end - start + 1
+
+
+def static(root, **options):
+
+    """
+        Returns a middleware that serves the files under `root`, to use with `PyExpress.use`.
+        Requests that don't map to a file are passed on to the next handler.
+        Options:
+            - prefix: URL path the files are served under (ie: "/assets").
+            - index: File served for directories (defaults to index.html).
+            - max_age: Seconds for the Cache-Control max-age.
+            - stat_ttl: Seconds stat() results are cached for.
+            - cache_size: Bytes of small files kept in memory (0 to disable).
+            - cache_file_size: Largest file kept in memory. Bigger files are sent with sendfile.
+    """
+
+    return StaticFiles(root, **options)
@@ -0,0 +1,212 @@
+import asyncio
+import http.client
+import inspect
+import json as jsonlib
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlencode
+
+from classes.body_parser import BodyReader
+from classes.dispatch import dispatch, dispatch_async
+
+
+class TestConnection:
+
+    """
+        Stands in for the connection of a request made with TestClient: the request is read from memory and the
+        response is written to memory.
+    """
+
+    def __init__(self, method, path, headers, body, client_address):
+        self.command = method
+        self.path = path
+        self.request_version = 'HTTP/1.1'
+        self.headers = headers
+        self.body_reader = BodyReader(BytesIO(body), len(body))
+        self.client_address = client_address
+        self.close_connection = False
+        self.wfile = BytesIO()
+
+    def sendfile(self, file, offset, count):
+        file.seek(offset)
+        self.wfile.write(file.read(count))
+
+
+class TestResponse:
+
+    """
+        The response to a request made with TestClient, parsed back from the bytes the server would have sent.
+    """
+
+    def __init__(self, raw, method):
+
+        # The raw response bytes, status line and headers included.
+        self.raw = raw
+
+        response = http.client.HTTPResponse(_Socket(raw), method=method)
+        response.begin()
+
+        self.status_code = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        # The body, with the chunked encoding undone (but not the compression).
+        self.body = response.read()
+
+    @property
+    def text(self):
+        return self.body.decode(self.headers.get_content_charset() or 'utf-8')
+
+    def json(self):
+        return jsonlib.loads(self.body)
+
+
+class _Socket:
+
+    # What http.client.HTTPResponse reads the response from.
+    def __init__(self, data):
+        self.data = data
+
+    def makefile(self, mode):
+        return BytesIO(self.data)
+
+
+class TestClient:
+
+    """
+        Makes requests to an app without a server: each one goes through the route lookup, the middlewares, the body
+        parsing and the response serialization, in memory, on the calling thread (see PyExpress.test_client).
+        Used as a context manager, the app's on_startup and on_shutdown hooks run around it, and its process pool (see
+        Executors) is started and stopped.
+        Apps with `async def` handlers or hooks are run like the asyncio engine runs them, on an event loop of the
+        client (plain controllers on a small thread pool).
+    """
+
+    # Not a test case, for pytest.
+    __test__ = False
+
+    def __init__(self, app, headers=None, client_address=('127.0.0.1', 50000)):
+        self.app = app
+        # Headers sent with every request.
+        self.headers = dict(headers or {})
+        self.client_address = client_address
+
+        # Event loop and executor of the asyncio engine, created for the first request that needs them.
+        self._loop = None
+        self._executor = None
+
+    def __enter__(self):
+        self.app.executors.start(self.app)
+
+        if self._is_async():
+            self._event_loop().run_until_complete(self.app.startup_async())
+        else:
+            self.app.startup()
+
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._is_async():
+            self._event_loop().run_until_complete(self.app.shutdown_async())
+        else:
+            self.app.shutdown()
+
+        self.app.executors.shutdown()
+
+        if self.app.tracing is not None:
+            self.app.tracing.close()
+
+        self.close()
+
+    def close(self):
+
+        """Closes the event loop and executor of an app with `async def` handlers."""
+
+        if self._loop is not None:
+            self._loop.close()
+            self._executor.shutdown()
+            self._loop = self._executor = None
+
+    def get(self, path, **options):
+        return self.request('GET', path, **options)
+
+    def head(self, path, **options):
+        return self.request('HEAD', path, **options)
+
+    def post(self, path, **options):
+        return self.request('POST', path, **options)
+
+    def put(self, path, **options):
+        return self.request('PUT', path, **options)
+
+    def patch(self, path, **options):
+        return self.request('PATCH', path, **options)
+
+    def delete(self, path, **options):
+        # Routes added with app.delete answer to DEL.
+        return self.request('DEL', path, **options)
+
+    def request(self, method, path, query=None, headers=None, json=None, data=None, content_type=None):
+
+        """
+            Makes a request and returns its TestResponse.
+            - query: Dict added to the path as a query string.
+            - json: Sent as a JSON body.
+            - data: Body as bytes or str, or a dict sent as a form (application/x-www-form-urlencoded).
+            - content_type: Content-Type of the body (guessed from json and data otherwise).
+        """
+
+        if query:
+            path += ('&' if '?' in path else '?') + urlencode(query, doseq=True)
+
+        body = b''
+
+        if json is not None:
+            body = self.app.json_encoder(json)
+            content_type = content_type or 'application/json'
+        elif isinstance(data, dict):
+            body = urlencode(data, doseq=True)
+            content_type = content_type or 'application/x-www-form-urlencoded'
+        elif data is not None:
+            body = data
+            content_type = content_type or 'application/octet-stream'
+
+        if isinstance(body, str):
+            body = body.encode()
+
+        fields = {'Host': 'localhost', **self.headers, **(headers or {})}
+
+        if content_type is not None:
+            fields['Content-Type'] = content_type
+        if body:
+            fields['Content-Length'] = str(len(body))
+
+        # Parsed like the servers parse them, so handlers see the same kind of headers.
+        head = ''.join(f'{name}: {value}\r\n' for name, value in fields.items()) + '\r\n'
+        connection = TestConnection(
+            method, path, http.client.parse_headers(BytesIO(head.encode('latin-1'))), body, self.client_address)
+
+        if self._is_async():
+            loop = self._event_loop()
+            response = loop.run_until_complete(dispatch_async(self.app, connection, self._executor))
+        else:
+            response = dispatch(self.app, connection, method)
+
+        if not response.is_sent:
+            raise AssertionError(f'{method} {path} sent no response.')
+
+        if self.app.tracing is not None and response.trace is not None:
+            self.app.tracing.response_sent(response)
+
+        return TestResponse(connection.wfile.getvalue(), method)
+
+    def _is_async(self):
+        hooks = self.app.startup_hooks + self.app.shutdown_hooks
+        return bool(self.app.async_handlers()) or any(inspect.iscoroutinefunction(hook) for hook in hooks)
+
+    def _event_loop(self):
+
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+            self._executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='py_express_test')
+
+        return self._loop
@@ -0,0 +1,356 @@
+import cProfile
+import functools
+import hmac
+import inspect
+import itertools
+import os
+import pstats
+import re
+import threading
+import time
+from collections import deque
+
+from classes.pipeline import TimedNext
+
+
+class RequestTrace:
+
+    """
+        Monotonic timestamps (time.monotonic) of a request's phases, and where its time went. Set on `req.trace` and
+        `res.trace` while instrumentation is on.
+    """
+
+    __slots__ = ('request', 'started', 'matched', 'handled', 'sent', 'body_time', 'middlewares', 'profile')
+
+    def __init__(self, request, started):
+        self.request = request
+        self.started = started
+        self.matched = None
+        self.handled = None
+        self.sent = None
+        # Seconds spent parsing the body (inside whichever middleware or controller accessed req.body).
+        self.body_time = 0.0
+        # (name, seconds) of each middleware that ran, in order.
+        self.middlewares = []
+        # cProfile.Profile of a sampled request (see RequestProfiler).
+        self.profile = None
+
+
+class Tracing:
+
+    """
+        The instrumentation of an app: its hooks, slow request log and profiler (see PyExpress.on_request_start,
+        log_slow_requests and profile_requests). The servers only call it when one of them is set up.
+    """
+
+    def __init__(self):
+        self.request_start_hooks = []
+        self.route_matched_hooks = []
+        self.handler_done_hooks = []
+        self.response_sent_hooks = []
+        self.slow_log = None
+        self.profiler = None
+
+    @property
+    def wraps_handlers(self):
+        """Whether the middlewares (and controllers) of the routes need to be wrapped to time or profile them."""
+        return self.slow_log is not None or self.profiler is not None
+
+    # Phases, called by the servers.
+    def request_start(self, request, response):
+
+        trace = RequestTrace(request, time.monotonic())
+        request.trace = response.trace = trace
+
+        if self.profiler is not None:
+            trace.profile = self.profiler.start(request)
+
+        for hook in self.request_start_hooks:
+            hook(request, response, trace.started)
+
+    def route_matched(self, request, response):
+
+        trace = request.trace
+        trace.matched = time.monotonic()
+
+        for hook in self.route_matched_hooks:
+            hook(request, response, trace.matched)
+
+    def handler_done(self, request, response):
+
+        trace = request.trace
+        trace.handled = time.monotonic()
+
+        # The profile ends with the handlers, so it's collected even when nothing gets sent.
+        if trace.profile is not None:
+            self.profiler.stop(request.route, request.method, trace.profile)
+            trace.profile = None
+
+        for hook in self.handler_done_hooks:
+            hook(request, response, trace.handled)
+
+    def response_sent(self, response):
+
+        trace = response.trace
+        trace.sent = time.monotonic()
+
+        for hook in self.response_sent_hooks:
+            hook(trace.request, response, trace.sent)
+
+        if self.slow_log is not None:
+            self.slow_log.record(trace, response)
+
+        # The request and its trace point to each other.
+        trace.request = None
+
+    def close(self):
+
+        """Saves what the profiler gathered, when the server stops."""
+
+        if self.profiler is not None:
+            self.profiler.save()
+
+    # Wrappers
+    def traced_middleware(self, middleware):
+
+        """
+            Wraps a middleware so the time spent in it (without the rest of the chain it runs with next()) is added to
+            the trace of the request, and it's profiled in sampled requests.
+        """
+
+        name = getattr(middleware, '__name__', type(middleware).__name__)
+
+        if inspect.iscoroutinefunction(middleware):
+
+            @functools.wraps(middleware)
+            async def traced(req, res, next):
+
+                trace = req.trace
+                if trace is None:
+                    return await middleware(req, res, next)
+
+                started = time.monotonic()
+                profile = trace.profile
+                next = TimedNext(next, profile)
+
+                if profile is not None:
+                    profile.enable()
+                try:
+                    return await middleware(req, res, next)
+                finally:
+                    if profile is not None:
+                        profile.disable()
+                    trace.middlewares.append((name, time.monotonic() - started - next.elapsed))
+
+        else:
+
+            @functools.wraps(middleware)
+            def traced(req, res, next):
+
+                trace = req.trace
+                if trace is None:
+                    return middleware(req, res, next)
+
+                started = time.monotonic()
+                profile = trace.profile
+                next = TimedNext(next, profile)
+
+                if profile is not None:
+                    profile.enable()
+                try:
+                    return middleware(req, res, next)
+                finally:
+                    if profile is not None:
+                        profile.disable()
+                    trace.middlewares.append((name, time.monotonic() - started - next.elapsed))
+
+        return traced
+
+    def profiled_controller(self, controller):
+
+        """Wraps a controller so it's profiled in sampled requests."""
+
+        if inspect.iscoroutinefunction(controller):
+
+            @functools.wraps(controller)
+            async def profiled(req, res):
+
+                profile = req.trace.profile if req.trace is not None else None
+                if profile is None:
+                    return await controller(req, res)
+
+                profile.enable()
+                try:
+                    return await controller(req, res)
+                finally:
+                    profile.disable()
+
+        else:
+
+            @functools.wraps(controller)
+            def profiled(req, res):
+
+                profile = req.trace.profile if req.trace is not None else None
+                if profile is None:
+                    return controller(req, res)
+
+                # Plain controllers can run on another thread (asyncio engine, execution="thread"), hence runcall.
+                return profile.runcall(controller, req, res)
+
+        return profiled
+
+
+class SlowRequestLog:
+
+    """
+        Keeps the last `size` requests that took `threshold` seconds or more, with the time spent in each phase (see
+        PyExpress.log_slow_requests).
+    """
+
+    def __init__(self, threshold=1.0, size=100, callback=None):
+        self.threshold = threshold
+        self.callback = callback
+        self._records = deque(maxlen=size)
+
+    def record(self, trace, response):
+
+        duration = trace.sent - trace.started
+
+        if duration < self.threshold:
+            return
+
+        request = trace.request
+        matched = trace.matched or trace.started
+        handled = trace.handled or trace.sent
+        middlewares = sum(elapsed for _, elapsed in trace.middlewares)
+
+        record = {
+            "timestamp": request.timestamp,
+            "method": request.method,
+            "route": request.route,
+            "path": request.path_without_query,
+            "status": response.status_code,
+            "duration": duration,
+            "phases": {
+                "route_match": matched - trace.started,
+                "middlewares": [[name, elapsed] for name, elapsed in trace.middlewares],
+                "controller": max(0.0, handled - matched - middlewares),
+                "body_parse": trace.body_time,
+                "send": trace.sent - handled,
+            },
+        }
+
+        self._records.append(record)
+
+        if self.callback is not None:
+            self.callback(record)
+
+    def records(self):
+        """The slow requests logged, oldest first."""
+        return list(self._records)
+
+
+class RequestProfiler:
+
+    """
+        Runs cProfile on 1 in `every` requests, and on the ones carrying `header` with `token` as its value, and adds
+        up their stats per route (see PyExpress.profile_requests).
+        Only one request is profiled at a time, a sampled request that comes while another is profiled isn't.
+    """
+
+    def __init__(self, every=100, header=None, token=None, directory='profiles', save_interval=10.0):
+
+        if every is not None and every < 1:
+            raise ValueError('every must be at least 1')
+
+        if header is not None and not token:
+            raise ValueError('A token is needed to profile requests on demand.')
+
+        self.every = every
+        self.header = header
+        self.token = token
+        self.directory = directory
+        self.save_interval = save_interval
+
+        self._counter = itertools.count(1)
+        self._profiling = threading.Lock()
+        self._lock = threading.Lock()
+        # (method, route) to their pstats.Stats, and how many requests they're made of.
+        self._stats = {}
+        self._counts = {}
+        self._last_saved = time.monotonic()
+
+    def start(self, request):
+
+        """Returns the profile for the request when it's sampled, None otherwise."""
+
+        if not self._sampled(request) or not self._profiling.acquire(blocking=False):
+            return None
+
+        return cProfile.Profile()
+
+    def stop(self, route, method, profile):
+
+        try:
+            profile.disable()
+            profile.create_stats()
+        finally:
+            self._profiling.release()
+
+        # Nothing of the request ran profiled (ie: its controller ran in the process pool).
+        if not profile.stats:
+            return
+
+        key = (method, route)
+
+        with self._lock:
+
+            if key in self._stats:
+                self._stats[key].add(profile)
+            else:
+                self._stats[key] = pstats.Stats(profile)
+
+            self._counts[key] = self._counts.get(key, 0) + 1
+
+        if time.monotonic() - self._last_saved >= self.save_interval:
+            self.save()
+
+    def stats(self):
+        """Requests profiled per "METHOD route"."""
+        with self._lock:
+            return {f"{method} {route}": count for (method, route), count in self._counts.items()}
+
+    def save(self):
+
+        """
+            Writes the stats of each route to `directory`, as `<METHOD>_<route>.<pid>.pstats` (one file per process).
+            Returns the paths written.
+        """
+
+        paths = []
+
+        with self._lock:
+
+            self._last_saved = time.monotonic()
+
+            if not self._stats:
+                return paths
+
+            os.makedirs(self.directory, exist_ok=True)
+
+            for (method, route), stats in self._stats.items():
+                name = re.sub(r'[^A-Za-z0-9_.:-]+', '_', f"{method}{route or '_not_found'}")
+                path = os.path.join(self.directory, f"{name}.{os.getpid()}.pstats")
+                stats.dump_stats(path)
+                paths.append(path)
+
+        return paths
+
+    def _sampled(self, request):
+
+        if self.header is not None:
+            value = request.get(self.header)
+            if value is not None and hmac.compare_digest(value.encode(), self.token.encode()):
+                return True
+
+        return self.every is not None and next(self._counter) % self.every == 0
@@ -0,0 +1,22 @@
+class FakeConnection:
+
+    """
+        Stands in for the connection a Response writes to (what dispatch() calls `connection`), keeping each write in
+        memory. For whole requests, use the test client (see TestClient) instead.
+    """
+
+    def __init__(self, request_version='HTTP/1.1'):
+        self.wfile = self
+        self.request_version = request_version
+        self.close_connection = False
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(bytes(data))
+
+    def flush(self):
+        pass
+
+    @property
+    def data(self):
+        return b''.join(self.writes)
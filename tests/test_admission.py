@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest import mock
+
+from classes.admission import AdmissionControl, Waiter
+from classes.pipeline import Pipeline
+from classes.py_express import PyExpress
+
+
+class FakeResponse:
+    def __init__(self):
+        self.headers = {}
+        self.status_code = 200
+        self.body = None
+
+    def set_header(self, name, value):
+        self.headers[name] = value
+        return self
+
+    def status(self, status_code):
+        self.status_code = status_code
+        return self
+
+    def send(self, body):
+        self.body = body
+
+
+# Unit tests
+class TestAdmissionControl(unittest.TestCase):
+    def test_sheds_when_queue_is_full(self):
+        admission = AdmissionControl(1, max_queue=0)
+        self.assertTrue(admission.acquire())
+        self.assertFalse(admission.acquire())
+        admission.release()
+        self.assertTrue(admission.acquire())
+        self.assertEqual(admission.stats()["shed"], 1)
+
+    def test_waiting_request_gets_released_slot(self):
+        admission = AdmissionControl(1, max_queue=1, queue_timeout=5)
+        admission.acquire()
+
+        results = []
+        waiting = threading.Thread(target=lambda: results.append(admission.acquire()))
+        waiting.start()
+        while admission.stats()["waiting"] == 0:
+            time.sleep(0.001)
+
+        admission.release()
+        waiting.join()
+
+        self.assertEqual(results, [True])
+        self.assertEqual(admission.in_flight, 1)
+
+    def test_wait_times_out(self):
+        admission = AdmissionControl(1, max_queue=1, queue_timeout=0.01)
+        admission.acquire()
+        self.assertFalse(admission.acquire())
+        self.assertEqual(admission.stats()["waiting"], 0)
+
+    def test_standing_queue_waits_target_latency(self):
+        admission = AdmissionControl(1, queue_timeout=5, target_latency=0.01, interval=0.05)
+        self.assertEqual(admission._wait_timeout(), 5)
+        admission._last_empty -= 0.1
+        self.assertEqual(admission._wait_timeout(), 0.01)
+
+    def test_priority_waiters_go_first(self):
+        admission = AdmissionControl(1, max_queue=2, queue_timeout=5)
+        admission.acquire()
+
+        order = []
+
+        def wait(priority):
+            admission.acquire(priority)
+            order.append(priority)
+            admission.release()
+
+        normal = threading.Thread(target=wait, args=(False,))
+        normal.start()
+        while admission.stats()["waiting"] < 1:
+            time.sleep(0.001)
+        urgent = threading.Thread(target=wait, args=(True,))
+        urgent.start()
+        while admission.stats()["waiting"] < 2:
+            time.sleep(0.001)
+
+        admission.release()
+        normal.join()
+        urgent.join()
+
+        self.assertEqual(order, [True, False])
+
+    def test_async_wait(self):
+        admission = AdmissionControl(1, max_queue=1, queue_timeout=5)
+
+        async def run():
+            await admission.acquire_async()
+            waiting = asyncio.ensure_future(admission.acquire_async())
+            await asyncio.sleep(0)
+            admission.release()
+            return await waiting
+
+        self.assertTrue(asyncio.run(run()))
+
+    def test_pipeline_rejects_with_503(self):
+        admission = AdmissionControl(1, max_queue=0, retry_after=2)
+        pipeline = Pipeline([], lambda req, res: res.send("ok"), admission=admission)
+
+        admission.acquire()
+        response = FakeResponse()
+        self.assertFalse(pipeline.run(None, response))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers["Retry-After"], "2")
+
+        admission.release()
+        response = FakeResponse()
+        self.assertTrue(pipeline.run(None, response))
+        self.assertEqual(admission.in_flight, 0)
+
+    def test_slot_handed_over_as_the_wait_times_out(self):
+        admission = AdmissionControl(1, max_queue=1, queue_timeout=0.05)
+        self.assertTrue(admission.acquire())
+
+        results = []
+        waiting = threading.Thread(target=lambda: results.append(admission.acquire()))
+        waiting.start()
+        while admission.stats()["waiting"] == 0:
+            time.sleep(0.001)
+
+        # The wait times out after the slot was handed over, before the waiter is woken up.
+        wake = Waiter.wake
+
+        def late_wake(waiter):
+            time.sleep(0.2)
+            wake(waiter)
+
+        with mock.patch.object(Waiter, 'wake', late_wake):
+            admission.release()
+        waiting.join()
+
+        self.assertEqual(results, [True])
+        admission.release()
+        self.assertEqual(admission.stats()["in_flight"], 0)
+
+    def test_exempt_routes(self):
+        app = PyExpress(admission=AdmissionControl(1, exempt=('/health',), priority=('/pay',)))
+        app.get('/health', lambda req, res: None)
+        app.get('/pay', lambda req, res: None)
+        app.get('/items', lambda req, res: None)
+
+        self.assertIsNone(app.router.lookup('/health', 'GET')[0].pipeline.admission)
+        self.assertTrue(app.router.lookup('/pay', 'GET')[0].pipeline.priority)
+        self.assertIs(app.router.lookup('/items', 'GET')[0].pipeline.admission, app.admission)
+        self.assertIs(app.not_found_pipeline.admission, app.admission)
@@ -0,0 +1,32 @@
+import unittest
+
+from bench.report import compare
+
+
+def report(**values):
+    return {"results": {name: {"value": value, "unit": '', "better": better} for name, (value, better) in values.items()}}
+
+
+# Unit tests
+class TestCompare(unittest.TestCase):
+    def test_direction(self):
+        baseline = report(latency=(100, 'lower'), rps=(1000, 'higher'))
+        current = report(latency=(120, 'lower'), rps=(1200, 'higher'))
+        _, regressions = compare(baseline, current, threshold=0.10)
+        self.assertEqual(regressions, ['latency'])
+
+    def test_within_threshold(self):
+        _, regressions = compare(report(rps=(1000, 'higher')), report(rps=(950, 'higher')), threshold=0.10)
+        self.assertEqual(regressions, [])
+
+    def test_zero_baseline(self):
+        _, regressions = compare(report(errors=(0, 'lower')), report(errors=(2, 'lower')))
+        self.assertEqual(regressions, ['errors'])
+
+    def test_new_benchmarks_are_skipped(self):
+        rows, regressions = compare(report(), report(new=(1, 'lower')))
+        self.assertEqual((rows, regressions), ([], []))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import json
+import unittest
+
+from classes.body_parser import BodyParsers, iter_json_array, iter_ndjson, parse_json, parse_text
+from classes.errors import BadRequest
+from classes.py_express import PyExpress
+
+
+def chunked(data, size):
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+# Unit tests
+class TestBodyParsers(unittest.TestCase):
+    def test_lookup(self):
+        parsers = BodyParsers()
+        custom = lambda request: 'custom'
+        parsers.add('Text/CSV', custom)
+
+        self.assertIs(parsers.get('application/json'), parse_json)
+        self.assertIs(parsers.get('text/csv'), custom)
+        self.assertEqual(parsers.get('multipart/form-data'), parsers.parse_multipart)
+        self.assertIs(parsers.get('application/unknown'), parse_text)
+
+    def test_custom_parser(self):
+        app = PyExpress()
+        app.body_parser('text/csv', lambda req: [line.split(',') for line in req.raw.decode().splitlines()])
+        app.post('/csv', lambda req, res: res.send(req.body))
+
+        response = app.test_client().post('/csv', data='a,b\n1,2', content_type='text/csv; charset=utf-8')
+        self.assertEqual(response.json(), [["a", "b"], ["1", "2"]])
+
+    def test_ndjson_body_is_streamed(self):
+        app = PyExpress()
+        app.post('/ingest', lambda req, res: res.send({"type": type(req.body).__name__, "ids": [r["id"] for r in req.body]}))
+
+        body = b'{"id":1}\n\n{"id":2}\n{"id":3}'
+        response = app.test_client().post('/ingest', data=body, content_type='application/x-ndjson')
+        self.assertEqual(response.json(), {"type": "generator", "ids": [1, 2, 3]})
+
+    def test_iter_json(self):
+        app = PyExpress()
+        app.post('/ingest', lambda req, res: res.send(sum(1 for _ in req.iter_json(chunk_size=7))))
+
+        response = app.test_client().post('/ingest', json=[{"id": index} for index in range(100)])
+        self.assertEqual(response.json(), 100)
+
+        response = app.test_client().post('/ingest', json={"not": "an array"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_json_array_across_chunks(self):
+        items = [1.5, -2e10, 123, "a,]\"é", None, True, [], {"a": [1, {"b": "c"}]}]
+        data = json.dumps(items, ensure_ascii=False, indent=2).encode()
+
+        for size in (1, 2, 3, 16, len(data)):
+            self.assertEqual(list(iter_json_array(chunked(data, size))), items)
+
+        self.assertEqual(list(iter_json_array([b' [ ] '])), [])
+
+    def test_invalid_json_arrays(self):
+        for data in (b'', b'[', b'[1,]', b'[1 2]', b'[1]x', b'[1.x]', b'["\xff"]'):
+            with self.assertRaises(BadRequest):
+                list(iter_json_array(chunked(data, 1)))
+
+    def test_ndjson_across_chunks(self):
+        data = b'{"a":1}\r\n\n[2]\n"three"'
+
+        for size in (1, 4, len(data)):
+            self.assertEqual(list(iter_ndjson(chunked(data, size))), [{"a": 1}, [2], "three"])
+
+        with self.assertRaises(BadRequest) as error:
+            list(iter_ndjson([b'1\nnope\n']))
+        self.assertEqual(str(error.exception), 'Invalid JSON on line 2')
@@ -0,0 +1,123 @@
+import threading
+import time
+import unittest
+
+from classes.cache import RouteCache
+from classes.pipeline import Pipeline
+from classes.py_express import PyExpress
+from classes.request import Request
+from classes.response import Response
+from fakes import FakeConnection
+
+
+def request(path, headers=None):
+    return Request(path, 'GET', headers or {})
+
+
+# Unit tests
+class TestRouteCache(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+
+    def _controller(self, req, res):
+        self.calls += 1
+        res.json({'calls': self.calls})
+
+    def _run(self, pipeline, path='/items', headers=None):
+        server = FakeConnection()
+        pipeline.run(request(path, headers), Response(server, path, {}, 'GET'))
+        return server.data.partition(b'\r\n\r\n')[2]
+
+    def test_hits_skip_the_controller(self):
+        cache = RouteCache(ttl=60)
+        pipeline = Pipeline([], self._controller, cache=cache)
+        self.assertEqual(self._run(pipeline), b'{"calls":1}')
+        self.assertEqual(self._run(pipeline), b'{"calls":1}')
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_default_key(self):
+        cache = RouteCache(ttl=60, vary_headers=('Accept-Language',))
+        pipeline = Pipeline([], self._controller, cache=cache)
+        self._run(pipeline, '/items?a=1&b=2')
+        self._run(pipeline, '/items?b=2&a=1')
+        self.assertEqual(self.calls, 1)
+        self._run(pipeline, '/items?b=2&a=1', {'Accept-Language': 'pt'})
+        self._run(pipeline, '/items?a=2')
+        self.assertEqual(self.calls, 3)
+
+    def test_expiry(self):
+        pipeline = Pipeline([], self._controller, cache=RouteCache(ttl=0.01))
+        self._run(pipeline)
+        time.sleep(0.02)
+        self._run(pipeline)
+        self.assertEqual(self.calls, 2)
+
+    def test_only_cached_statuses(self):
+        def controller(req, res):
+            self.calls += 1
+            res.status(500).json({'error': 1})
+
+        pipeline = Pipeline([], controller, cache=RouteCache(ttl=60))
+        self._run(pipeline)
+        self._run(pipeline)
+        self.assertEqual(self.calls, 2)
+
+    def test_middlewares_always_run(self):
+        seen = []
+
+        def global_middleware(req, res, next):
+            seen.append(req.path)
+            res.set_header('X-Request', str(len(seen)))
+            next()
+
+        pipeline = Pipeline([global_middleware], self._controller, cache=RouteCache(ttl=60))
+        self._run(pipeline)
+        self._run(pipeline)
+        self.assertEqual(len(seen), 2)
+        self.assertEqual(self.calls, 1)
+
+    def test_hits_go_through_the_route_auth(self):
+        app = PyExpress()
+
+        def auth(req, res, next):
+            if req.get('Authorization') != 'Bearer secret':
+                return res.status(401).send({"error": "Unauthorized"})
+            next()
+
+        app.get('/me', [auth], self._controller, cache=RouteCache(ttl=60))
+        client = app.test_client()
+
+        self.assertEqual(client.get('/me', headers={'Authorization': 'Bearer secret'}).json(), {'calls': 1})
+        self.assertEqual(client.get('/me').status_code, 401)
+        self.assertEqual(client.get('/me', headers={'Authorization': 'Bearer secret'}).json(), {'calls': 1})
+        self.assertEqual(self.calls, 1)
+
+    def test_eviction(self):
+        cache = RouteCache(ttl=60, max_size=300)
+        pipeline = Pipeline([], self._controller, cache=cache)
+        for index in range(5):
+            self._run(pipeline, f'/items?page={index}')
+        self.assertGreater(cache.stats()['evictions'], 0)
+        self.assertLessEqual(cache.stats()['size'], 300)
+
+    def test_concurrent_misses_are_collapsed(self):
+        def controller(req, res):
+            self.calls += 1
+            time.sleep(0.1)
+            res.json({'ok': True})
+
+        cache = RouteCache(ttl=60)
+        pipeline = Pipeline([], controller, cache=cache)
+        threads = [threading.Thread(target=self._run, args=(pipeline,)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(cache.stats()['coalesced'], 7)
+
+
+if __name__ == '__main__':
+    unittest.main()
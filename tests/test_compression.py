@@ -0,0 +1,55 @@
+import gzip
+import unittest
+import zlib
+
+from classes.compression import Compression, parse_accept_encoding
+
+
+# Unit tests
+class TestParseAcceptEncoding(unittest.TestCase):
+    def test_preference(self):
+        self.assertEqual(parse_accept_encoding('gzip, deflate, br'), 'gzip')
+        self.assertEqual(parse_accept_encoding('deflate'), 'deflate')
+        self.assertEqual(parse_accept_encoding('gzip;q=0.5, deflate;q=0.8'), 'deflate')
+
+    def test_refused(self):
+        self.assertIsNone(parse_accept_encoding('br, identity'))
+        self.assertIsNone(parse_accept_encoding('gzip;q=0'))
+        self.assertIsNone(parse_accept_encoding('*;q=0'))
+
+    def test_wildcard(self):
+        self.assertEqual(parse_accept_encoding('*'), 'gzip')
+        self.assertEqual(parse_accept_encoding('gzip;q=0, *'), 'deflate')
+
+
+class TestCompression(unittest.TestCase):
+    def setUp(self):
+        self.compression = Compression(level=6)
+
+    def test_compressible(self):
+        self.assertTrue(self.compression.compressible('application/json'))
+        self.assertTrue(self.compression.compressible('text/html; charset=utf-8'))
+        self.assertTrue(self.compression.compressible('application/vnd.api+json'))
+        self.assertFalse(self.compression.compressible('image/png'))
+        self.assertFalse(self.compression.compressible(None))
+
+    def test_compress(self):
+        data = b'{"items": []}' * 1000
+        self.assertEqual(gzip.decompress(self.compression.compress(data, 'gzip')), data)
+        self.assertEqual(zlib.decompress(self.compression.compress(data, 'deflate')), data)
+
+    def test_cached_variants(self):
+        data = b'a' * 5000
+        first = self.compression.compress(data, 'gzip', cache_key='k')
+        # A hit doesn't look at the data again.
+        self.assertIs(self.compression.compress(b'other', 'gzip', cache_key='k'), first)
+        self.assertNotEqual(self.compression.compress(data, 'deflate', cache_key='k'), first)
+
+    def test_compress_stream(self):
+        chunks = [b'line %d\n' % i for i in range(100)]
+        compressed = b''.join(self.compression.compress_stream(iter(chunks), 'gzip'))
+        self.assertEqual(gzip.decompress(compressed), b''.join(chunks))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,232 @@
+import asyncio
+import socket
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from classes.admission import AdmissionControl
+from classes.async_server import AsyncServer
+from classes.http_server import CustomHandler, PooledHTTPServer
+from classes.py_express import PyExpress
+from classes.sockets import create_listen_socket
+
+
+@contextmanager
+def threads_server(app, workers=4, **options):
+
+    # The threads engine on a free port, until the block ends.
+    sock = create_listen_socket('127.0.0.1', 0, 16)
+    httpd = PooledHTTPServer(
+        sock.getsockname(), lambda *args, **kwargs: CustomHandler(app, *args, **kwargs), workers=workers, backlog=16,
+        sock=sock, **options)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+
+    try:
+        yield sock.getsockname()
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+@contextmanager
+def asyncio_server(app, **options):
+
+    # The asyncio engine on a free port, with its loop on another thread (AsyncServer.serve needs the main one).
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+
+    executor = ThreadPoolExecutor(max_workers=4)
+    sock = create_listen_socket('127.0.0.1', 0, 16)
+    server = AsyncServer(app, executor, **options)
+    listener = asyncio.run_coroutine_threadsafe(
+        asyncio.start_server(server.handle_connection, sock=sock), loop).result()
+
+    async def close():
+        listener.close()
+        # Connections the clients left open too.
+        tasks = asyncio.all_tasks() - {asyncio.current_task()}
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await listener.wait_closed()
+
+    try:
+        yield sock.getsockname()
+    finally:
+        asyncio.run_coroutine_threadsafe(close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+        executor.shutdown()
+
+
+ENGINES = (threads_server, asyncio_server)
+
+
+def exchange(address, data):
+
+    # Sends raw bytes and reads until the server closes the connection.
+    with socket.create_connection(address, timeout=5) as client:
+        client.sendall(data)
+        received = b''
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                return received
+            received += chunk
+
+
+def request(client, path='/'):
+
+    # One request on a kept alive connection, returns the response (read up to its Content-Length).
+    client.sendall(f'GET {path} HTTP/1.1\r\nHost: x\r\n\r\n'.encode())
+    received = receive(client)
+    while b'\r\n\r\n' not in received:
+        received += receive(client)
+    head, body = received.split(b'\r\n\r\n', 1)
+    length = int(head.lower().split(b'content-length: ')[1].split(b'\r\n')[0])
+    while len(body) < length:
+        body += receive(client)
+    return head + b'\r\n\r\n' + body
+
+
+def receive(client):
+    chunk = client.recv(65536)
+    if not chunk:
+        raise ConnectionError('Closed by the server')
+    return chunk
+
+
+# Unit tests
+class TestEngines(unittest.TestCase):
+    def test_chunked_bodies_are_refused(self):
+        app = PyExpress()
+        app.post('/upload', lambda req, res: res.send({"body": req.body}))
+
+        for engine in ENGINES:
+            with self.subTest(engine=engine.__name__), engine(app) as address:
+                response = exchange(address, (
+                    b'POST /upload HTTP/1.1\r\nHost: x\r\nTransfer-Encoding: chunked\r\n'
+                    b'Content-Type: text/plain\r\n\r\n5\r\nhello\r\n0\r\n\r\n'))
+                self.assertTrue(response.startswith(b'HTTP/1.1 501 '), response)
+
+    def test_route_body_limit_before_reading(self):
+        app = PyExpress()
+        app.post('/small', lambda req, res: res.send(req.body), max_body_size=16)
+
+        for engine in ENGINES:
+            with self.subTest(engine=engine.__name__), engine(app) as address:
+                # Only the start of the body is sent: the 413 can't wait for the rest.
+                response = exchange(address, (
+                    b'POST /small HTTP/1.1\r\nHost: x\r\nContent-Type: text/plain\r\n'
+                    b'Content-Length: 100000\r\n\r\n' + b'a' * 100))
+                self.assertTrue(response.startswith(b'HTTP/1.1 413 '), response)
+
+    def test_failing_error_middleware(self):
+        app = PyExpress()
+
+        def broken(req, res):
+            raise ValueError('broken')
+
+        def error_middleware(req, res, next, error):
+            raise RuntimeError('the error middleware is broken too')
+
+        app.get('/broken', broken)
+        app.use(error_middleware)
+
+        for engine in ENGINES:
+            with self.subTest(engine=engine.__name__), engine(app) as address:
+                response = exchange(address, b'GET /broken HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n')
+                self.assertTrue(response.startswith(b'HTTP/1.1 500 '), response)
+                self.assertTrue(response.endswith(b'{"error":"Something went wrong"}'), response)
+
+
+    def test_idle_connections_free_their_worker(self):
+        app = PyExpress(admission=AdmissionControl(2, max_queue=0))
+        app.get('/', lambda req, res: res.send('ok'))
+
+        with threads_server(app, workers=2) as address:
+            clients = [socket.create_connection(address, timeout=5) for _ in range(4)]
+
+            try:
+                # More connections than workers, each waiting for its next request.
+                for client in clients:
+                    self.assertTrue(request(client).startswith(b'HTTP/1.1 200 '))
+
+                response = exchange(address, b'GET / HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n')
+                self.assertTrue(response.startswith(b'HTTP/1.1 200 '), response)
+
+                # And they're picked up again for their next one, pipelined requests included.
+                for client in clients:
+                    self.assertTrue(request(client).startswith(b'HTTP/1.1 200 '))
+
+                clients[0].sendall(b'GET / HTTP/1.1\r\nHost: x\r\n\r\n' * 2)
+                received = b''
+                while received.count(b'ok') < 2:
+                    received += clients[0].recv(65536)
+                self.assertEqual(received.count(b'HTTP/1.1 200 '), 2)
+            finally:
+                for client in clients:
+                    client.close()
+
+    def test_idle_connections_time_out(self):
+        app = PyExpress()
+        app.get('/', lambda req, res: res.send('ok'))
+
+        with threads_server(app, keep_alive_timeout=0.2) as address:
+            with socket.create_connection(address, timeout=5) as client:
+                self.assertTrue(request(client).startswith(b'HTTP/1.1 200 '))
+                # Closed by the server once idle for too long.
+                self.assertEqual(client.recv(1), b'')
+
+
+    def test_max_connections_closes_idle_ones_first(self):
+        app = PyExpress()
+        app.get('/', lambda req, res: res.send('ok'))
+
+        for engine in ENGINES:
+            with self.subTest(engine=engine.__name__), engine(app, max_connections=2) as address:
+                oldest = socket.create_connection(address, timeout=5)
+                newest = socket.create_connection(address, timeout=5)
+
+                try:
+                    # Both idle, one after the other.
+                    self.assertTrue(request(oldest).startswith(b'HTTP/1.1 200 '))
+                    time.sleep(0.05)
+                    self.assertTrue(request(newest).startswith(b'HTTP/1.1 200 '))
+                    time.sleep(0.05)
+
+                    # The new client is served, and the connection idle for the longest makes room for it.
+                    response = exchange(address, b'GET / HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n')
+                    self.assertTrue(response.startswith(b'HTTP/1.1 200 '), response)
+                    self.assertEqual(oldest.recv(1), b'')
+                    self.assertTrue(request(newest).startswith(b'HTTP/1.1 200 '))
+                finally:
+                    oldest.close()
+                    newest.close()
+
+
+    def test_silent_connections_over_the_limit(self):
+        app = PyExpress()
+        app.get('/', lambda req, res: res.send('ok'))
+
+        with threads_server(app, max_connections=1) as address:
+            # Holds the only connection, then more connect and say nothing.
+            clients = [socket.create_connection(address, timeout=5) for _ in range(21)]
+
+            try:
+                time.sleep(0.5)
+                started = time.monotonic()
+                response = exchange(address, b'GET / HTTP/1.1\r\nHost: x\r\n\r\n')
+                self.assertTrue(response.startswith(b'HTTP/1.1 503 '), response)
+                self.assertLess(time.monotonic() - started, 1)
+            finally:
+                for client in clients:
+                    client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
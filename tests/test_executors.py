@@ -0,0 +1,88 @@
+import http.client
+import io
+import pickle
+import threading
+import unittest
+
+from classes.body_parser import BodyReader, parse_body
+from classes.errors import ServiceUnavailable
+from classes.executors import Executors, RequestSnapshot, ResponseRecorder, run_snapshot, send_description
+from classes.py_express import PyExpress
+from classes.request import Request
+from classes.response import Response
+from fakes import FakeConnection
+
+
+def echo(req, res):
+    res.status(201).set_header('X-Id', req.params['id']).send({"body": req.body, "user": req.context["user"]})
+
+
+def make_request(body):
+    headers = http.client.parse_headers(io.BytesIO(
+        b'Content-Type: application/json\r\nContent-Length: %d\r\n\r\n' % len(body)))
+    request = Request('/items/7', 'POST', headers, params={'id': '7'},
+                      body_reader=BodyReader(io.BytesIO(body), len(body)),
+                      body_parser=lambda request: parse_body(headers, request))
+    request.context['user'] = 'bob'
+    return request
+
+
+# Unit tests
+class TestExecutors(unittest.TestCase):
+    def test_snapshot_round_trip(self):
+        request = make_request(b'{"a":1}')
+        response = Response(FakeConnection(), '/items/7', {}, 'POST')
+        response.set_header('X-Auth', 'yes')
+
+        # What the worker process gets, and what it sends back.
+        snapshot = pickle.loads(pickle.dumps(RequestSnapshot(request, response)))
+        description = pickle.loads(pickle.dumps(run_snapshot(echo, snapshot)))
+
+        send_description(response, description)
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.headers['X-Auth'], 'yes')
+        self.assertEqual(response.headers['X-Id'], '7')
+        self.assertTrue(response.server.data.endswith(b'{"body":{"a":1},"user":"bob"}'))
+
+    def test_snapshot_of_parsed_body(self):
+        request = make_request(b'{"a":1}')
+        self.assertEqual(request.body, {"a": 1})
+        snapshot = RequestSnapshot(request, Response(FakeConnection(), '/', {}, 'POST'))
+        self.assertEqual(snapshot.to_request().body, {"a": 1})
+
+    def test_recorder_rejects_streams(self):
+        response = ResponseRecorder(200, {}, 'GET')
+        self.assertRaises(ValueError, response.stream, [b'a'])
+
+    def test_queue_limit(self):
+        executors = Executors(threads=1, max_queue=1)
+        release = threading.Event()
+
+        running = executors.submit('thread', release.wait)
+        queued = executors.submit('thread', release.wait)
+        self.assertRaises(ServiceUnavailable, executors.submit, 'thread', release.wait)
+
+        stats = executors.stats()['thread']
+        self.assertEqual((stats['running'], stats['queued'], stats['rejected']), (1, 1, 1))
+
+        release.set()
+        running.result()
+        queued.result()
+        executors.shutdown()
+        self.assertEqual(executors.stats()['thread']['completed'], 2)
+
+    def test_route_execution_checks(self):
+        app = PyExpress()
+
+        self.assertRaises(ValueError, app.get, '/a', lambda req, res: None, execution='elsewhere')
+        self.assertRaises(ValueError, app.get, '/b', lambda req, res: None, execution='process')
+
+        async def controller(req, res):
+            pass
+
+        self.assertRaises(ValueError, app.get, '/c', controller, execution='thread')
+
+        app.post('/items/:id', echo, execution='process')
+        self.assertTrue(app.executors.uses_processes)
+        self.assertEqual(app.router.lookup('/items/7', 'POST')[0].pipeline.execution, 'process')
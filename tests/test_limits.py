@@ -0,0 +1,98 @@
+import io
+import socket
+import unittest
+
+from classes.body_parser import BodyReader, parse_content_length
+from classes.errors import PayloadTooLarge, RequestHeaderFieldsTooLarge, RequestTimeout
+from classes.http_server import HeadReader, SocketReader
+from classes.pipeline import Pipeline
+from classes.py_express import PyExpress
+from classes.request import Request
+from classes.serialization import error_response
+from fakes import FakeConnection
+
+
+class FakeResponse:
+    def __init__(self):
+        self.server = FakeConnection()
+
+
+# Unit tests
+class TestLimits(unittest.TestCase):
+    def test_parse_content_length(self):
+        self.assertEqual(parse_content_length({}), 0)
+        self.assertEqual(parse_content_length({'Content-Length': '12'}), 12)
+        self.assertIsNone(parse_content_length({'Content-Length': '-5'}))
+        self.assertIsNone(parse_content_length({'Content-Length': '1e3'}))
+
+    def test_head_reader_limit(self):
+        reader = HeadReader(io.BytesIO(b'A: 1\r\nB: 2\r\n\r\n'), 12)
+        self.assertEqual(reader.readline(65537), b'A: 1\r\n')
+        self.assertEqual(reader.readline(65537), b'B: 2\r\n')
+        self.assertRaises(RequestHeaderFieldsTooLarge, reader.readline, 65537)
+
+    def test_socket_reader_body_timeout(self):
+        left, right = socket.socketpair()
+        try:
+            reader = SocketReader(left)
+            reader.wait_for_body(0.01)
+            self.assertRaises(RequestTimeout, io.BufferedReader(reader).read, 1)
+        finally:
+            left.close()
+            right.close()
+
+    def test_socket_reader_head_deadline(self):
+        left, right = socket.socketpair()
+        try:
+            reader = SocketReader(left)
+            reader.wait_for_request(None, 0.05)
+            right.sendall(b'GET')
+            rfile = io.BufferedReader(reader)
+            self.assertEqual(rfile.read1(10), b'GET')
+            # The rest of the head never comes.
+            self.assertRaises(RequestTimeout, rfile.readline)
+        finally:
+            left.close()
+            right.close()
+
+    def test_body_reader_reads_everything(self):
+        class ShortReads(io.BytesIO):
+            def read(self, size=-1):
+                return super().read(min(size, 3))
+
+        reader = BodyReader(ShortReads(b'0123456789'), 10)
+        self.assertEqual(reader.read(), b'0123456789')
+
+    def test_broken_body_is_not_drained(self):
+        class Timeout:
+            def read(self, size):
+                raise RequestTimeout()
+
+        reader = BodyReader(Timeout(), 10)
+        self.assertRaises(RequestTimeout, reader.read, 5)
+        self.assertFalse(reader.drain(1024))
+
+    def test_pipeline_rejects_large_bodies(self):
+        pipeline = Pipeline([], lambda req, res: None, max_body_size=5)
+
+        request = Request('/', 'POST', {}, body_reader=BodyReader(io.BytesIO(b'123456'), 6))
+        response = FakeResponse()
+        self.assertRaises(PayloadTooLarge, pipeline.run, request, response)
+        self.assertTrue(response.server.close_connection)
+
+        request = Request('/', 'POST', {}, body_reader=BodyReader(io.BytesIO(b'12345'), 5))
+        self.assertTrue(pipeline.run(request, FakeResponse()))
+
+    def test_route_limit_of_zero(self):
+        app = PyExpress(max_body_size=1024)
+        app.post('/ping', lambda req, res: res.send('pong'), max_body_size=0)
+        client = app.test_client()
+
+        self.assertEqual(client.post('/ping', data=b'x').status_code, 413)
+        self.assertEqual(client.post('/ping').status_code, 200)
+
+    def test_error_response(self):
+        response = error_response(408)
+        self.assertTrue(response.startswith(b'HTTP/1.1 408 Request Timeout\r\n'))
+        self.assertIn(b'Connection: close\r\n', response)
+        self.assertTrue(response.endswith(b'{"error":"Request Timeout"}'))
@@ -0,0 +1,81 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+
+from classes.metrics import UNMATCHED_ROUTE, Metrics
+
+
+# Unit tests
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics(buckets=(0.01, 0.1))
+
+    def _record(self, route='/a/:id', method='GET', status_code=200, elapsed=0.005, bytes_in=0, bytes_out=10):
+        shard = self.metrics.begin()
+        self.metrics.end(shard, route, method, status_code, elapsed, bytes_in, bytes_out)
+
+    def test_route_counters(self):
+        self._record(elapsed=0.005)
+        self._record(elapsed=0.05, status_code=404, bytes_in=7)
+        self._record(elapsed=5, status_code=500)
+
+        route, = self.metrics.collect()["routes"]
+
+        self.assertEqual(route["count"], 3)
+        self.assertEqual(route["status"], {'1xx': 0, '2xx': 1, '3xx': 0, '4xx': 1, '5xx': 1})
+        self.assertEqual(route["latency"]["buckets"], {0.01: 1, 0.1: 2, float('inf'): 3})
+        self.assertEqual((route["bytes_in"], route["bytes_out"]), (7, 30))
+
+    def test_unmatched_and_in_flight(self):
+        self.metrics.begin()
+        self._record(route=None)
+        metrics = self.metrics.collect()
+        self.assertEqual(metrics["in_flight"], 1)
+        self.assertEqual(metrics["routes"][0]["route"], UNMATCHED_ROUTE)
+
+    def test_threads_are_added_up(self):
+        threads = [threading.Thread(target=lambda: [self._record() for _ in range(100)]) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.metrics.collect()["routes"][0]["count"], 400)
+
+    def test_middleware_timing(self):
+        def auth(req, res, next):
+            next()
+
+        timed = self.metrics.timed_middleware('/a', 'GET', auth)
+        timed(None, None, lambda: None)
+        middleware, = self.metrics.collect()["middlewares"]
+        self.assertEqual((middleware["middleware"], middleware["calls"]), ('auth', 1))
+
+    def test_prometheus(self):
+        self._record(route='/a/"x"')
+        text = self.metrics.prometheus()
+        self.assertIn('py_express_requests_total{route="/a/\\"x\\"",method="GET",status="2xx"} 1', text)
+        self.assertIn('py_express_request_duration_seconds_bucket{route="/a/\\"x\\"",method="GET",le="+Inf"} 1', text)
+        self.assertIn('py_express_requests_in_flight 0', text)
+
+    def test_published_snapshots_are_added_up(self):
+        other = Metrics(buckets=(0.01, 0.1))
+        shard = other.begin()
+        other.end(shard, '/a/:id', 'GET', 200, 0.001, 0, 10)
+
+        with tempfile.TemporaryDirectory() as directory:
+
+            # As published by another worker (pid 1 is never this process).
+            with open(os.path.join(directory, '1.json'), 'w') as file:
+                json.dump({**other.snapshot(), "pid": 1}, file)
+
+            self.metrics.share(directory)
+            self._record()
+            metrics = self.metrics.collect()
+
+        self.assertEqual(metrics["workers"], 2)
+        self.assertEqual(metrics["routes"][0]["count"], 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+from io import BytesIO
+
+from classes.errors import BadRequest, PayloadTooLarge
+from classes.multipart import MultipartParser, parse_boundary
+
+
+BOUNDARY = b'----boundary123'
+
+
+def build_body(parts):
+    body = b'preamble\r\n'
+    for headers, content in parts:
+        body += b'--' + BOUNDARY + b'\r\n' + headers + b'\r\n\r\n' + content + b'\r\n'
+    return body + b'--' + BOUNDARY + b'--\r\n'
+
+
+def parse(body, **options):
+    return MultipartParser(BytesIO(body), len(body), BOUNDARY, **options).parse()
+
+
+# Unit tests
+class TestMultipartParser(unittest.TestCase):
+    def setUp(self):
+        self.file_content = bytes(range(256)) * 40 + b'\r\n--' + BOUNDARY[:-1]
+        self.body = build_body([
+            (b'Content-Disposition: form-data; name="title"', b'hello world'),
+            (b'Content-Disposition: form-data; name="upload"; filename="a.bin"\r\nContent-Type: application/octet-stream',
+             self.file_content),
+            (b'Content-Disposition: form-data; name="empty"', b''),
+        ])
+
+    def _check(self, parsed):
+        self.assertEqual(parsed['title'], 'hello world')
+        self.assertEqual(parsed['empty'], '')
+        self.assertEqual(parsed['upload']['filename'], 'a.bin')
+        self.assertEqual(parsed['upload']['content_type'], 'application/octet-stream')
+        self.assertEqual(parsed['upload']['size'], len(self.file_content))
+        self.assertEqual(parsed['upload']['file'].read(), self.file_content)
+
+    def test_parse(self):
+        self._check(parse(self.body))
+
+    def test_boundary_split_across_chunks(self):
+        # Every chunk size makes the delimiters land on a different edge.
+        for chunk_size in (1, 2, 3, 7, 16, 41, 100):
+            self._check(parse(self.body, chunk_size=chunk_size))
+
+    def test_file_rolls_over_to_disk(self):
+        parsed = parse(self.body, spool_size=100)
+        self.assertTrue(parsed['upload']['file']._rolled)
+        self._check(parsed)
+
+    def test_field_size_limit(self):
+        with self.assertRaises(PayloadTooLarge):
+            parse(self.body, max_field_size=5)
+
+    def test_file_size_limit(self):
+        with self.assertRaises(PayloadTooLarge):
+            parse(self.body, max_file_size=1000, chunk_size=64)
+
+    def test_total_size_limit(self):
+        with self.assertRaises(PayloadTooLarge):
+            parse(self.body, max_total_size=100)
+
+    def test_truncated_body(self):
+        with self.assertRaises(BadRequest):
+            parse(self.body[:-30])
+
+    def test_parse_boundary(self):
+        self.assertEqual(parse_boundary('multipart/form-data; boundary=abc'), b'abc')
+        self.assertEqual(parse_boundary('multipart/form-data; boundary="a b"; charset=utf-8'), b'a b')
+        with self.assertRaises(BadRequest):
+            parse_boundary('multipart/form-data')
+
+
+if __name__ == '__main__':
+    unittest.main()
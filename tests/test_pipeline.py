@@ -0,0 +1,115 @@
+import asyncio
+import unittest
+
+from classes.pipeline import Pipeline
+from classes.py_express import PyExpress
+
+
+# Unit tests
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+    def _middleware(self, name, proceed=True):
+        def middleware(req, res, next):
+            self.calls.append(name)
+            if proceed:
+                next()
+        return middleware
+
+    def _controller(self, req, res):
+        self.calls.append('controller')
+
+    def test_runs_in_order(self):
+        pipeline = Pipeline([self._middleware('a'), self._middleware('b')], self._controller)
+        self.assertTrue(pipeline.run(None, None))
+        self.assertEqual(self.calls, ['a', 'b', 'controller'])
+
+    def test_stops_when_next_is_not_called(self):
+        pipeline = Pipeline([self._middleware('a', proceed=False), self._middleware('b')], self._controller)
+        self.assertFalse(pipeline.run(None, None))
+        self.assertEqual(self.calls, ['a'])
+
+    def test_deep_chain(self):
+        pipeline = Pipeline([self._middleware(i) for i in range(200)], self._controller)
+        self.assertTrue(pipeline.run(None, None))
+        self.assertEqual(len(self.calls), 201)
+
+    def test_next_runs_the_rest_of_the_chain(self):
+        def around(req, res, next):
+            self.calls.append('before')
+            try:
+                next()
+            except ValueError as error:
+                self.calls.append(f'caught {error}')
+            self.calls.append('after')
+
+        def broken(req, res):
+            self.calls.append('controller')
+            raise ValueError('broken')
+
+        Pipeline([around, self._middleware('a')], broken).run(None, None)
+        self.assertEqual(self.calls, ['before', 'a', 'controller', 'caught broken', 'after'])
+
+    def test_next_called_twice(self):
+        def twice(req, res, next):
+            next()
+            next()
+
+        self.assertRaises(RuntimeError, Pipeline([twice], self._controller).run, None, None)
+        self.assertEqual(self.calls, ['controller'])
+
+    def test_run_async(self):
+        async def async_middleware(req, res, next):
+            self.calls.append('async')
+            await next()
+            self.calls.append('after async')
+
+        async def async_controller(req, res):
+            self.calls.append('async controller')
+
+        pipeline = Pipeline([async_middleware, self._middleware('a')], async_controller)
+        self.assertTrue(asyncio.run(pipeline.run_async(None, None, None)))
+        self.assertEqual(self.calls, ['async', 'a', 'async controller', 'after async'])
+
+        self.calls = []
+        pipeline = Pipeline([async_middleware], self._controller)
+        self.assertTrue(asyncio.run(pipeline.run_async(None, None, None)))
+        self.assertEqual(self.calls, ['async', 'controller', 'after async'])
+
+    def test_async_handlers_need_asyncio(self):
+        app = PyExpress()
+
+        async def load_user(req, res, next):
+            await next()
+
+        app.get('/plain', lambda req, res: res.send('ok'))
+        self.assertEqual(app.async_handlers(), [])
+
+        app.get('/user', load_user, lambda req, res: res.send('ok'))
+        self.assertEqual(app.async_handlers(), [load_user.__qualname__])
+
+        with self.assertRaisesRegex(ValueError, 'load_user'):
+            app.listen(engine="threads", port=0)
+
+    def test_plain_middleware_on_asyncio(self):
+        # The rest of the chain runs once it returns, it can't be waited for from a plain function.
+        def plain(req, res, next):
+            next()
+            self.calls.append('after plain')
+
+        async def stop(req, res, next):
+            self.calls.append('stop')
+
+        pipeline = Pipeline([plain], self._controller)
+        self.assertTrue(asyncio.run(pipeline.run_async(None, None, None)))
+        self.assertEqual(self.calls, ['after plain', 'controller'])
+
+        self.calls = []
+        pipeline = Pipeline([plain, stop], self._controller)
+        self.assertFalse(asyncio.run(pipeline.run_async(None, None, None)))
+        self.assertEqual(self.calls, ['after plain', 'stop'])
+
+
+if __name__ == '__main__':
+    unittest.main()
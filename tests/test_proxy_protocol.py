@@ -0,0 +1,111 @@
+import asyncio
+import os
+import socket
+import struct
+import tempfile
+import unittest
+from io import BytesIO
+
+from classes.errors import BadRequest
+from classes.proxy_protocol import V2_SIGNATURE, read_proxy_header, read_proxy_header_async
+from classes.sockets import adopt_socket, create_unix_socket, describe_address
+
+
+REQUEST = b'GET / HTTP/1.1\r\nHost: x\r\n\r\n'
+
+
+def v2_header(command, family, addresses, tlvs=b''):
+    payload = addresses + tlvs
+    return V2_SIGNATURE + bytes([0x20 | command, family]) + struct.pack('!H', len(payload)) + payload
+
+
+def read_async(data):
+
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await read_proxy_header_async(reader), await reader.read()
+
+    return asyncio.run(run())
+
+
+# Unit tests
+class TestProxyProtocol(unittest.TestCase):
+    def assertHeader(self, data, address):
+        # Both readers give the address, and leave the request that follows untouched.
+        rfile = BytesIO(data + REQUEST)
+        self.assertEqual(read_proxy_header(rfile), address)
+        self.assertEqual(rfile.read(), REQUEST)
+        self.assertEqual(read_async(data + REQUEST), (address, REQUEST))
+
+    def assertInvalid(self, data):
+        self.assertRaises(BadRequest, read_proxy_header, BytesIO(data))
+        # A header cut short is a closed connection to the asyncio engine.
+        self.assertRaises((BadRequest, asyncio.IncompleteReadError), read_async, data)
+
+    def test_v1(self):
+        self.assertHeader(b'PROXY TCP4 203.0.113.7 10.0.0.1 51234 443\r\n', ('203.0.113.7', 51234))
+        self.assertHeader(b'PROXY TCP6 2001:db8::1 2001:db8::2 4000 443\r\n', ('2001:db8::1', 4000))
+        self.assertHeader(b'PROXY UNKNOWN\r\n', None)
+
+    def test_v2(self):
+        ipv4 = socket.inet_aton('203.0.113.7') + socket.inet_aton('10.0.0.1') + struct.pack('!HH', 51234, 443)
+        ipv6 = socket.inet_pton(socket.AF_INET6, '2001:db8::1') + bytes(16) + struct.pack('!HH', 4000, 443)
+
+        self.assertHeader(v2_header(1, 0x11, ipv4), ('203.0.113.7', 51234))
+        self.assertHeader(v2_header(1, 0x21, ipv6, tlvs=b'\x04\x00\x01\x00'), ('2001:db8::1', 4000))
+        # A health check of the proxy itself, and a client on a unix socket.
+        self.assertHeader(v2_header(0, 0x00, b''), None)
+        self.assertHeader(v2_header(1, 0x31, bytes(216)), None)
+
+    def test_invalid(self):
+        for data in (
+            REQUEST,
+            b'PROXY TCP4 203.0.113.7 10.0.0.1 51234\r\n',
+            b'PROXY TCP4 2001:db8::1 10.0.0.1 51234 443\r\n',
+            b'PROXY TCP4 203.0.113.7 10.0.0.1 70000 443\r\n',
+            b'PROXY TCP4 ' + b'1' * 200 + b'\r\n',
+            v2_header(2, 0x11, bytes(12)),
+            v2_header(1, 0x11, bytes(4)),
+            V2_SIGNATURE + b'\x21\x11\x00\x0c' + bytes(4),
+        ):
+            self.assertInvalid(data)
+
+
+class TestListenSockets(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'app.sock')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_unix_socket(self):
+        first = create_unix_socket(self.path, 8, mode=0o660)
+        first.close()
+
+        # The file left behind by the previous run is replaced.
+        sock = create_unix_socket(self.path, 8)
+        self.addCleanup(sock.close)
+        self.assertEqual(describe_address(sock.getsockname()), f'unix:{self.path}')
+
+        client = socket.socket(socket.AF_UNIX)
+        self.addCleanup(client.close)
+        client.connect(self.path)
+
+    def test_unix_socket_keeps_other_files(self):
+        open(self.path, 'w').close()
+        self.assertRaises(ValueError, create_unix_socket, self.path, 8)
+
+    def test_adopt_socket(self):
+        listener = socket.create_server(('127.0.0.1', 0))
+        self.addCleanup(listener.close)
+
+        sock = adopt_socket(os.dup(listener.fileno()))
+        self.addCleanup(sock.close)
+        self.assertEqual(sock.getsockname(), listener.getsockname())
+
+        idle = socket.socket()
+        self.addCleanup(idle.close)
+        self.assertRaises(ValueError, adopt_socket, idle)
@@ -0,0 +1,100 @@
+import os
+import unittest
+
+from classes.rate_limit import BucketStore, RateLimit, SharedBucketStore
+from classes.request import Request
+
+
+class FakeResponse:
+    def __init__(self):
+        self.headers = {}
+        self.status_code = 200
+        self.body = None
+
+    def set_header(self, name, value):
+        self.headers[name] = value
+        return self
+
+    def status(self, status_code):
+        self.status_code = status_code
+        return self
+
+    def send(self, body):
+        self.body = body
+
+
+# Unit tests
+class TestBucketStores(unittest.TestCase):
+    def _check_bucket(self, store):
+        # Burst of 2, then one token every 0.5s.
+        self.assertTrue(store.take('a', 2, 2, 100.0)[0])
+        self.assertTrue(store.take('a', 2, 2, 100.0)[0])
+        allowed, _, retry_after = store.take('a', 2, 2, 100.0)
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 0.5)
+        self.assertTrue(store.take('a', 2, 2, 100.5)[0])
+        # Other keys have their own bucket.
+        self.assertTrue(store.take('b', 2, 2, 100.5)[0])
+
+    def test_local_store(self):
+        self._check_bucket(BucketStore())
+
+    def test_shared_store(self):
+        self._check_bucket(SharedBucketStore(slots=1024))
+
+    def test_local_store_is_bounded(self):
+        store = BucketStore(max_keys=100, shards=4)
+        for index in range(1000):
+            store.take(f'10.0.{index // 256}.{index % 256}', 1, 1, 0.0)
+        self.assertLessEqual(len(store), 100)
+        self.assertEqual(store.evictions, 900)
+
+    def test_shared_store_is_bounded(self):
+        store = SharedBucketStore(slots=64, stripes=4, probes=4)
+        for index in range(1000):
+            self.assertTrue(store.take(f'client-{index}', 1, 1, float(index))[0])
+        self.assertGreater(store.evictions, 0)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs fork')
+    def test_shared_store_across_processes(self):
+        store = SharedBucketStore(slots=1024)
+        pid = os.fork()
+        if pid == 0:
+            store.take('a', 1, 1, 100.0)
+            os._exit(0)
+        os.waitpid(pid, 0)
+        # The child took the only token.
+        self.assertFalse(store.take('a', 1, 1, 100.0)[0])
+
+
+class TestRateLimit(unittest.TestCase):
+    def _request(self, address='10.0.0.1', headers=None):
+        return Request('/', 'GET', headers or {}, client_address=(address, 1234))
+
+    def _run(self, limit, request):
+        response = FakeResponse()
+        called = []
+        limit(request, response, lambda: called.append(True))
+        return response, bool(called)
+
+    def test_rejects_with_retry_after(self):
+        limit = RateLimit(1, burst=1)
+        self.assertTrue(self._run(limit, self._request())[1])
+        response, called = self._run(limit, self._request())
+        self.assertFalse(called)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        # Another client.
+        self.assertTrue(self._run(limit, self._request('10.0.0.2'))[1])
+
+    def test_header_key(self):
+        limit = RateLimit(1, burst=1, key='header:X-Api-Key')
+        self.assertTrue(self._run(limit, self._request(headers={'X-Api-Key': 'a'}))[1])
+        self.assertFalse(self._run(limit, self._request('10.0.0.2', headers={'X-Api-Key': 'a'}))[1])
+        # No key, no limit.
+        self.assertTrue(self._run(limit, self._request())[1])
+        self.assertTrue(self._run(limit, self._request())[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import http.client
+import io
+import unittest
+
+from classes.request import Request, parse_cookies
+from classes.router import Router
+
+
+def headers(raw):
+    return http.client.parse_headers(io.BytesIO(raw + b'\r\n'))
+
+
+# Unit tests
+class TestRequest(unittest.TestCase):
+    def test_url_split(self):
+        request = Request('/a/b?x=1&y=2', 'GET', {})
+        self.assertEqual(request.path_without_query, '/a/b')
+        self.assertEqual(request.query_string, 'x=1&y=2')
+        self.assertEqual(Request('http://host/c?d=1', 'GET', {}).path_without_query, '/c')
+
+    def test_query(self):
+        request = Request('/a?tag=x&tag=y&q=1', 'GET', {})
+        self.assertEqual(request.query, {'tag': 'x', 'q': '1'})
+        self.assertEqual(request.get_query_list('tag'), ['x', 'y'])
+        self.assertEqual(request.get_query('q'), '1')
+        self.assertIsNone(request.get_query('missing'))
+        self.assertEqual(Request('/a', 'GET', {}).query, {})
+
+    def test_query_is_parsed_lazily(self):
+        request = Request('/a?x=1', 'GET', {})
+        self.assertIsNone(request._query_lists)
+        request.query
+        self.assertIsNotNone(request._query_lists)
+
+    def test_params_from_route(self):
+        router = Router()
+        router.add('/users/:id/posts/:post', 'GET', None)
+        request = Request('/users/1/posts/2', 'GET', {})
+        request.set_route(*router.lookup(request.path_without_query, 'GET'))
+        self.assertEqual(request.route, '/users/:id/posts/:post')
+        self.assertEqual(request.params, {'id': '1', 'post': '2'})
+
+    def test_headers(self):
+        request = Request('/', 'GET', headers(b'Content-Type: text/plain\r\nX-A: 1\r\nX-A: 2\r\n'))
+        self.assertEqual(request.get('content-type'), 'text/plain')
+        self.assertEqual(request.get('X-A'), '1')
+        self.assertEqual(request.get('Missing', 'default'), 'default')
+
+    def test_cookies(self):
+        request = Request('/', 'GET', headers(b'Cookie: session=abc; theme="dark"; bad; a=%20b\r\n'))
+        self.assertEqual(request.cookies, {'session': 'abc', 'theme': 'dark', 'a': ' b'})
+        self.assertEqual(parse_cookies(None), {})
+
+    def test_context_instead_of_attributes(self):
+        request = Request('/', 'GET', {})
+        request.context['user'] = 'me'
+        self.assertEqual(request.context, {'user': 'me'})
+        with self.assertRaises(AttributeError):
+            request.user = 'me'
+
+
+if __name__ == '__main__':
+    unittest.main()
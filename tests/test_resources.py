@@ -0,0 +1,201 @@
+import asyncio
+import itertools
+import threading
+import time
+import unittest
+from unittest import mock
+
+from classes.admission import Waiter
+from classes.errors import PoolTimeout
+from classes.py_express import PyExpress
+from classes.request import Request
+from classes.resources import ResourcePool, State
+
+
+class Connection:
+    ids = itertools.count(1)
+
+    def __init__(self):
+        self.id = next(self.ids)
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**options):
+    return ResourcePool(Connection, close=Connection.close, **options)
+
+
+# Unit tests
+class TestResourcePool(unittest.TestCase):
+    def test_reuses_resources(self):
+        pool = make_pool(max_size=2)
+        first = pool.acquire()
+        pool.release(first)
+        self.assertIs(pool.acquire(), first)
+        self.assertEqual(pool.stats()["created"], 1)
+
+    def test_bounded(self):
+        pool = make_pool(max_size=1)
+        pool.acquire()
+        self.assertRaises(PoolTimeout, pool.acquire, timeout=0.01)
+        self.assertEqual(pool.stats()["timeouts"], 1)
+        self.assertEqual(pool.stats()["waiting"], 0)
+
+    def test_released_resource_goes_to_waiter(self):
+        pool = make_pool(max_size=1)
+        resource = pool.acquire()
+
+        results = []
+        waiting = threading.Thread(target=lambda: results.append(pool.acquire(timeout=5)))
+        waiting.start()
+        while pool.stats()["waiting"] == 0:
+            time.sleep(0.001)
+
+        pool.release(resource)
+        waiting.join()
+
+        self.assertEqual(results, [resource])
+
+    def test_resource_handed_over_as_the_wait_times_out(self):
+        pool = make_pool(max_size=1)
+        resource = pool.acquire()
+
+        results = []
+        waiting = threading.Thread(target=lambda: results.append(pool.acquire(timeout=0.05)))
+        waiting.start()
+        while pool.stats()["waiting"] == 0:
+            time.sleep(0.001)
+
+        # The wait times out after the resource was handed over, before the waiter is woken up.
+        wake = Waiter.wake
+
+        def late_wake(waiter):
+            time.sleep(0.2)
+            wake(waiter)
+
+        with mock.patch.object(Waiter, 'wake', late_wake):
+            pool.release(resource)
+        waiting.join()
+
+        self.assertEqual(results, [resource])
+        pool.release(resource)
+        self.assertIs(pool.acquire(timeout=0.01), resource)
+
+    def test_discarded_resource_is_replaced(self):
+        pool = make_pool(max_size=1)
+        resource = pool.acquire()
+        pool.release(resource, discard=True)
+
+        self.assertTrue(resource.closed)
+        self.assertIsNot(pool.acquire(timeout=0), resource)
+        self.assertEqual(pool.stats()["size"], 1)
+
+    def test_health_check(self):
+        pool = make_pool(check=lambda connection: connection.healthy, check_after=0)
+        resource = pool.acquire()
+        resource.healthy = False
+        pool.release(resource)
+
+        replacement = pool.acquire()
+        self.assertIsNot(replacement, resource)
+        self.assertTrue(resource.closed)
+        self.assertEqual(pool.stats()["discarded"], 1)
+
+    def test_idle_resources_expire(self):
+        pool = make_pool(max_idle=0.01, min_size=1)
+        first, second = pool.acquire(), pool.acquire()
+        pool.release(first)
+        pool.release(second)
+        time.sleep(0.02)
+
+        # The oldest idle one is closed, min_size are kept.
+        self.assertIs(pool.acquire(), second)
+        self.assertTrue(first.closed)
+        self.assertEqual(pool.stats()["size"], 1)
+
+    def test_forked_pool_starts_empty(self):
+        pool = make_pool()
+        pool.release(pool.acquire())
+        pool._pid = -1
+        pool.acquire()
+        self.assertEqual(pool.stats()["created"], 2)
+
+    def test_async_acquire(self):
+        pool = make_pool(max_size=1)
+
+        async def run():
+            resource = await pool.acquire_async()
+            waiting = asyncio.ensure_future(pool.acquire_async(timeout=5))
+            await asyncio.sleep(0)
+            pool.release(resource)
+            return resource, await waiting
+
+        resource, handed = asyncio.run(run())
+        self.assertIs(handed, resource)
+
+    def test_close(self):
+        pool = make_pool()
+        resource = pool.acquire()
+        pool.release(resource)
+        pool.close()
+        self.assertTrue(resource.closed)
+        self.assertRaises(RuntimeError, pool.acquire)
+
+    def test_finish_callbacks(self):
+        request = Request('/', 'GET', {})
+        calls = []
+        request.on_finish(lambda: calls.append(1))
+        request.on_finish(lambda: calls.append(2))
+        request.finish()
+        request.finish()
+        self.assertEqual(calls, [2, 1])
+
+
+class AppState(State):
+    db: ResourcePool
+
+
+class TestLifecycle(unittest.TestCase):
+    def test_lease_and_hooks(self):
+        app = PyExpress(state=AppState())
+        app.state.db = make_pool(max_size=1, acquire_timeout=0.01)
+        calls = []
+
+        @app.on_startup
+        def open_pool(app):
+            calls.append('startup')
+
+        @app.on_shutdown
+        def close_pool(app):
+            calls.append('shutdown')
+            app.state.db.close()
+
+        app.use(app.state.db.lease('db'))
+        app.get('/id', lambda req, res: res.send(req.context['db'].id))
+
+        def broken(req, res):
+            raise ValueError('broken')
+
+        app.get('/broken', broken)
+
+        with app.test_client() as client:
+            self.assertEqual(calls, ['startup'])
+            first = client.get('/id').json()
+            # Given back even when the controller fails, so the next request can have it.
+            self.assertEqual(client.get('/broken').status_code, 500)
+            self.assertEqual(client.get('/id').json(), first)
+
+        self.assertEqual(calls, ['startup', 'shutdown'])
+        self.assertEqual(app.state.db.stats()["size"], 0)
+
+    def test_async_hooks_need_asyncio(self):
+        app = PyExpress()
+
+        async def connect(app):
+            pass
+
+        app.on_startup(connect)
+        self.assertRaises(ValueError, app.startup)
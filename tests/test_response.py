@@ -0,0 +1,76 @@
+import os
+import tempfile
+import unittest
+
+from classes.py_express import PyExpress
+from classes.response import Response
+from fakes import FakeConnection
+
+
+# Unit tests
+class TestResponse(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeConnection()
+        self.response = Response(self.server, '/', {}, 'GET')
+
+    def _head_and_body(self):
+        head, _, body = self.server.data.partition(b'\r\n\r\n')
+        return head.decode('latin-1').split('\r\n'), body
+
+    def test_single_write(self):
+        self.response.status(201).set_header('X-Id', '1').send({'a': [1, 2]})
+        self.assertEqual(len(self.server.writes), 1)
+        head, body = self._head_and_body()
+        self.assertEqual(head[0], 'HTTP/1.1 201 Created')
+        self.assertIn('X-Id: 1', head)
+        self.assertIn('Content-Length: %d' % len(body), head)
+        self.assertEqual(body, b'{"a":[1,2]}')
+
+    def test_bytes_pass_through(self):
+        for body in (b'\x00\xff', bytearray(b'\x00\xff'), memoryview(b'\x00\xff')):
+            self.server.writes = []
+            Response(self.server, '/', {}, 'GET').send(body)
+            head, sent = self._head_and_body()
+            self.assertEqual(sent, b'\x00\xff')
+            self.assertIn('Content-Type: application/octet-stream', head)
+
+    def test_custom_json_encoder(self):
+        Response(self.server, '/', {}, 'GET', json_encoder=lambda value: 'custom').send({'a': 1})
+        self.assertEqual(self._head_and_body()[1], b'custom')
+
+    def test_head_has_no_body(self):
+        Response(self.server, '/', {}, 'HEAD').send({'a': 1})
+        head, body = self._head_and_body()
+        self.assertIn('Content-Length: 7', head)
+        self.assertEqual(body, b'')
+
+    def test_connection_headers(self):
+        self.response.set_header('Connection', 'close').send('x')
+        self.assertTrue(self.server.close_connection)
+
+        server = FakeConnection('HTTP/1.0')
+        Response(server, '/', {}, 'GET').send('x')
+        self.assertIn(b'Connection: keep-alive\r\n', server.writes[0])
+
+    def test_send_file_range(self):
+        with tempfile.NamedTemporaryFile(suffix='.txt', delete=False) as file:
+            file.write(b'0123456789')
+        self.addCleanup(os.unlink, file.name)
+
+        app = PyExpress()
+        app.get('/file', lambda req, res: res.send_file(
+            file.name, offset=int(req.query['offset']), count=int(req.query['count'])))
+        client = app.test_client()
+
+        # Cut to what's left of the file, so Content-Length matches the bytes sent.
+        response = client.get('/file', query={'offset': 6, 'count': 100})
+        self.assertEqual(response.body, b'6789')
+        self.assertEqual(response.headers['Content-Length'], '4')
+
+        self.assertEqual(client.get('/file', query={'offset': 10, 'count': 5}).body, b'')
+        self.assertEqual(client.get('/file', query={'offset': 11, 'count': 1}).status_code, 500)
+        self.assertEqual(client.get('/file', query={'offset': -1, 'count': 1}).status_code, 500)
+
+
+if __name__ == '__main__':
+    unittest.main()
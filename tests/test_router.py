@@ -0,0 +1,83 @@
+import unittest
+
+from classes.router import Router
+
+
+def handler(req, res):
+    pass
+
+
+# Unit tests
+class TestRouter(unittest.TestCase):
+    def setUp(self):
+        self.router = Router()
+
+    def _route(self, path, method='GET'):
+        match = self.router.match(path, method)
+        return (match[0].route, match[1]) if match else None
+
+    def test_static_match(self):
+        self.router.add('/a/b/c', 'GET', [handler])
+        self.assertEqual(self._route('/a/b/c'), ('/a/b/c', {}))
+        self.assertIsNone(self._route('/a/b/d'))
+        self.assertIsNone(self._route('/a/b'))
+
+    def test_params_extracted_during_match(self):
+        self.router.add('/a/:id/c', 'GET', [handler])
+        self.router.add('/user/:name', 'GET', [handler])
+        self.assertEqual(self._route('/a/123/c'), ('/a/:id/c', {'id': '123'}))
+        self.assertEqual(self._route('/user/john'), ('/user/:name', {'name': 'john'}))
+
+    def test_params_dont_match_empty_segments(self):
+        self.router.add('/user/:name', 'GET', [handler])
+        self.assertIsNone(self._route('/user/'))
+
+    def test_static_before_param(self):
+        self.router.add('/user/:name', 'GET', [handler])
+        self.router.add('/user/me', 'GET', [handler])
+        self.assertEqual(self._route('/user/me'), ('/user/me', {}))
+        self.assertEqual(self._route('/user/you'), ('/user/:name', {'name': 'you'}))
+
+    def test_backtracks_from_static_branch(self):
+        self.router.add('/a/b/c', 'GET', [handler])
+        self.router.add('/a/:x/d', 'GET', [handler])
+        self.assertEqual(self._route('/a/b/d'), ('/a/:x/d', {'x': 'b'}))
+
+    def test_method_tables(self):
+        self.router.add('/items/:id', 'GET', [handler])
+        self.router.add('/items/new', 'POST', [handler])
+        self.assertEqual(self._route('/items/new', 'POST'), ('/items/new', {}))
+        self.assertEqual(self._route('/items/new', 'GET'), ('/items/:id', {'id': 'new'}))
+        self.assertIsNone(self._route('/items/1', 'PUT'))
+
+    def test_param_names_per_route(self):
+        self.router.add('/a/:id', 'GET', [handler])
+        self.router.add('/a/:name/b', 'GET', [handler])
+        self.assertEqual(self._route('/a/1'), ('/a/:id', {'id': '1'}))
+        self.assertEqual(self._route('/a/x/b'), ('/a/:name/b', {'name': 'x'}))
+
+    def test_replacing_a_route(self):
+        def other(req, res):
+            pass
+
+        self.router.add('/a', 'GET', [handler])
+        self.router.add('/a', 'GET', [other])
+        self.assertEqual(self.router.match('/a', 'GET')[0].pipeline, [other])
+
+    def test_empty_route_and_path(self):
+        self.router.add('', 'GET', [handler])
+        self.assertEqual(self._route(''), ('', {}))
+        self.assertIsNone(self._route('/a/b/c'))
+
+        self.router.add('/a/b/c', 'GET', [handler])
+        self.assertEqual(self._route('/a/b/c'), ('/a/b/c', {}))
+
+    def test_trailing_slashes(self):
+        self.router.add('/a/b/c/', 'GET', [handler])
+        self.router.add('/a/:var/', 'GET', [handler])
+        self.assertIsNone(self._route('/a/b/c'))
+        self.assertEqual(self._route('/a/123/'), ('/a/:var/', {'var': '123'}))
+
+
+if __name__ == '__main__':
+    unittest.main()
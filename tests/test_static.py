@@ -0,0 +1,106 @@
+import os
+import tempfile
+import threading
+import unittest
+
+from classes.py_express import PyExpress
+from classes.static import FileCache, StatCache, parse_range, static
+
+
+# Unit tests
+class TestParseRange(unittest.TestCase):
+    def test_ranges(self):
+        self.assertEqual(parse_range('bytes=0-99', 1000), (0, 100))
+        self.assertEqual(parse_range('bytes=900-', 1000), (900, 100))
+        self.assertEqual(parse_range('bytes=-100', 1000), (900, 100))
+        self.assertEqual(parse_range('bytes=990-2000', 1000), (990, 10))
+
+    def test_unsatisfiable(self):
+        self.assertEqual(parse_range('bytes=1000-', 1000), 'unsatisfiable')
+        self.assertEqual(parse_range('bytes=5-1', 1000), 'unsatisfiable')
+
+    def test_ignored(self):
+        self.assertIsNone(parse_range('items=0-1', 1000))
+        self.assertIsNone(parse_range('bytes=0-1,5-6', 1000))
+        self.assertIsNone(parse_range('bytes=a-b', 1000))
+
+
+class TestFileCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def _file(self, name, data):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'wb') as file:
+            file.write(data)
+        return path, os.stat(path)
+
+    def test_evicts_least_recently_used(self):
+        cache = FileCache(max_size=10)
+        a, a_stat = self._file('a', b'aaaa')
+        b, b_stat = self._file('b', b'bbbb')
+        c, c_stat = self._file('c', b'cccc')
+
+        cache.put(a, a_stat, b'aaaa')
+        cache.put(b, b_stat, b'bbbb')
+        cache.get(a, a_stat)
+        cache.put(c, c_stat, b'cccc')
+
+        self.assertEqual(cache.get(a, a_stat), b'aaaa')
+        self.assertIsNone(cache.get(b, b_stat))
+        self.assertEqual(cache.size, 8)
+
+    def test_invalidated_by_mtime(self):
+        cache = FileCache()
+        a, a_stat = self._file('a', b'aaaa')
+        cache.put(a, a_stat, b'aaaa')
+
+        os.utime(a, ns=(a_stat.st_atime_ns, a_stat.st_mtime_ns + 10 ** 9))
+
+        self.assertIsNone(cache.get(a, os.stat(a)))
+        self.assertEqual(cache.size, 0)
+
+
+
+class TestStaticFiles(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        with open(os.path.join(self.directory.name, 'a.txt'), 'wb') as file:
+            file.write(b'aaaa')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_unreadable_paths_are_not_found(self):
+        app = PyExpress()
+        app.use(static(self.directory.name))
+        client = app.test_client()
+
+        self.assertEqual(client.get('/a.txt').body, b'aaaa')
+        self.assertEqual(client.get('/a.txt%00.png').status_code, 404)
+        self.assertIsNone(StatCache().stat('a\x00b'))
+
+    def test_stat_cache_shared_by_threads(self):
+        cache = StatCache()
+        errors = []
+
+        def run(thread):
+            try:
+                for index in range(3000):
+                    cache.stat(os.path.join(self.directory.name, f'{thread}-{index}'))
+            except Exception as error:
+                errors.append(error)
+
+        threads = [threading.Thread(target=run, args=(thread,)) for thread in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+from classes.errors import HTTPError
+from classes.py_express import PyExpress
+
+
+def authenticate(req, res, next):
+    if req.get('Authorization') != 'token':
+        raise HTTPError(status_code=401)
+    req.context['user'] = 'bob'
+    next()
+
+
+def create_item(req, res):
+    res.status(201).send({"id": req.params['id'], "body": req.body, "user": req.context['user'], "q": req.query})
+
+
+# Unit tests
+class TestTestClient(unittest.TestCase):
+    def setUp(self):
+        self.app = PyExpress()
+        self.app.post('/items/:id', [authenticate], create_item)
+        self.app.get('/stream', lambda req, res: res.stream(iter([b'ab', b'cd']), 'text/plain'))
+        self.app.get('/ip', lambda req, res: res.send(req.ip))
+        self.client = self.app.test_client(headers={'Authorization': 'token'})
+
+    def test_json_round_trip(self):
+        response = self.client.post('/items/7', json={"a": 1}, query={"page": 2})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.headers['Content-Type'], 'application/json')
+        self.assertEqual(response.json(), {"id": "7", "body": {"a": 1}, "user": "bob", "q": {"page": "2"}})
+
+    def test_form_body(self):
+        response = self.client.post('/items/1', data={"name": "x"})
+        self.assertEqual(response.json()["body"], {"name": ["x"]})
+
+    def test_errors_and_not_found(self):
+        self.assertEqual(self.client.post('/items/1', headers={'Authorization': 'nope'}).status_code, 401)
+        self.assertEqual(self.client.get('/missing').json(), {"error": "Not Found"})
+
+    def test_streamed_response(self):
+        response = self.client.get('/stream')
+        self.assertEqual(response.headers['Transfer-Encoding'], 'chunked')
+        self.assertEqual(response.text, 'abcd')
+
+    def test_client_address(self):
+        self.assertEqual(self.client.get('/ip').text, '127.0.0.1')
+
+    def test_nothing_sent(self):
+        self.app.get('/silent', lambda req, res: None)
+        self.assertRaises(AssertionError, self.client.get, '/silent')
+
+    def test_async_handlers(self):
+        app = PyExpress()
+        calls = []
+
+        async def connect(app):
+            calls.append('startup')
+
+        async def load_user(req, res, next):
+            req.context['user'] = 'bob'
+            await next()
+            calls.append('after')
+
+        async def show_user(req, res):
+            res.send({"user": req.context['user']})
+
+        app.on_startup(connect)
+        app.get('/user', load_user, show_user)
+        app.get('/plain', lambda req, res: res.send('ok'))
+
+        with app.test_client() as client:
+            self.assertEqual(client.get('/user').json(), {"user": "bob"})
+            self.assertEqual(client.get('/plain').text, 'ok')
+
+        self.assertEqual(calls, ['startup', 'after'])
@@ -0,0 +1,128 @@
+import os
+import pstats
+import tempfile
+import time
+import unittest
+
+from classes.py_express import PyExpress
+from classes.request import Request
+from classes.tracing import RequestProfiler
+
+
+class FakeResponse:
+    def __init__(self):
+        self.status_code = 200
+        self.trace = None
+
+
+def slow_middleware(req, res, next):
+    time.sleep(0.01)
+    next()
+
+
+def controller(req, res):
+    sum(range(1000))
+
+
+def handle(app, path, method='GET', headers=None):
+    # What the servers do around a request.
+    request = Request(path, method, headers or {})
+    response = FakeResponse()
+    app.tracing.request_start(request, response)
+    route, values = app.router.lookup(request.path_without_query, method)
+    request.set_route(route, values)
+    app.tracing.route_matched(request, response)
+    route.pipeline.run(request, response)
+    app.tracing.handler_done(request, response)
+    app.tracing.response_sent(response)
+    return request, response
+
+
+# Unit tests
+class TestTracing(unittest.TestCase):
+    def test_hooks(self):
+        app = PyExpress()
+        app.get('/items/:id', controller)
+
+        calls = []
+        for name in ('on_request_start', 'on_route_matched', 'on_handler_done', 'on_response_sent'):
+            getattr(app, name)(lambda req, res, timestamp, name=name: calls.append((name, req.route, timestamp)))
+
+        handle(app, '/items/1')
+
+        self.assertEqual([call[0] for call in calls],
+                         ['on_request_start', 'on_route_matched', 'on_handler_done', 'on_response_sent'])
+        self.assertEqual(calls[0][1], None)
+        self.assertEqual(calls[1][1], '/items/:id')
+        self.assertEqual([call[2] for call in calls], sorted(call[2] for call in calls))
+
+    def test_slow_request_log(self):
+        app = PyExpress()
+        logged = []
+        log = app.log_slow_requests(threshold=0.005, callback=logged.append)
+        app.get('/slow', slow_middleware, controller)
+        app.get('/fast', controller)
+
+        handle(app, '/fast')
+        handle(app, '/slow')
+
+        self.assertEqual(len(log.records()), 1)
+        record = log.records()[0]
+        self.assertIs(logged[0], record)
+        self.assertEqual((record["route"], record["method"], record["status"]), ('/slow', 'GET', 200))
+
+        phases = record["phases"]
+        self.assertEqual(phases["middlewares"][0][0], 'slow_middleware')
+        self.assertGreaterEqual(phases["middlewares"][0][1], 0.01)
+        self.assertLessEqual(phases["route_match"] + phases["middlewares"][0][1] + phases["controller"]
+                             + phases["send"], record["duration"] + 1e-6)
+
+    def test_body_parse_time(self):
+        app = PyExpress()
+        log = app.log_slow_requests(threshold=0)
+
+        def parse(request):
+            time.sleep(0.01)
+            return {}
+
+        request = Request('/', 'POST', {}, body_parser=parse)
+        response = FakeResponse()
+        app.tracing.request_start(request, response)
+        request.body
+        app.tracing.handler_done(request, response)
+        app.tracing.response_sent(response)
+
+        self.assertGreaterEqual(log.records()[0]["phases"]["body_parse"], 0.01)
+
+    def test_profiles_are_saved_per_route(self):
+        with tempfile.TemporaryDirectory() as directory:
+            app = PyExpress()
+            profiler = app.profile_requests(every=2, directory=directory)
+            app.get('/items/:id', controller)
+
+            for _ in range(4):
+                handle(app, '/items/1')
+
+            self.assertEqual(profiler.stats(), {'GET /items/:id': 2})
+
+            paths = profiler.save()
+            self.assertEqual([os.path.basename(path) for path in paths], [f'GET_items_:id.{os.getpid()}.pstats'])
+            functions = [function for _, _, function in pstats.Stats(paths[0]).stats]
+            self.assertIn('controller', functions)
+
+    def test_profile_on_demand(self):
+        profiler = RequestProfiler(every=None, header='X-Profile', token='secret')
+
+        self.assertIsNone(profiler.start(Request('/', 'GET', {})))
+        self.assertIsNone(profiler.start(Request('/', 'GET', {'X-Profile': 'guess'})))
+
+        profile = profiler.start(Request('/', 'GET', {'X-Profile': 'secret'}))
+        self.assertIsNotNone(profile)
+        # One at a time.
+        self.assertIsNone(profiler.start(Request('/', 'GET', {'X-Profile': 'secret'})))
+
+        profiler.stop('/', 'GET', profile)
+        self.assertIsNotNone(profiler.start(Request('/', 'GET', {'X-Profile': 'secret'})))
+
+    def test_token_is_required(self):
+        self.assertRaises(ValueError, RequestProfiler, header='X-Profile')